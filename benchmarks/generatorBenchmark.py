@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from argparse import Namespace, ArgumentParser, ArgumentDefaultsHelpFormatter
+from datetime import datetime, timezone
+from functools import partial
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from context_logger import setup_logging, get_logger
+from git import Repo
+
+from image_generator import (
+    BuildConfiguration,
+    BuildConfigurator,
+    BuildInitializer,
+    IDependencyInstaller,
+    ImageBuilder,
+    ImageHasher,
+    TargetConfig,
+    TargetConfigLoader,
+    packageList,
+)
+
+log = get_logger('GeneratorBenchmark')
+
+BOOT_CMDLINE = 'console=serial0,115200 console=tty1 root=ROOTDEV rootfstype=ext4 fsck.repair=yes rootwait quiet'
+LOG_LINE = (
+    'Get:{index} http://raspbian.raspberrypi.org/raspbian bullseye/main armhf package-{index} armhf 1.0-1 [42 kB]'
+)
+OUTPUT_SCRIPT = '''import sys
+
+line_count, root = int(sys.argv[1]), sys.argv[2]
+stages = 3
+block = 10000
+output = sys.stdout.buffer
+
+for stage in range(stages):
+    output.write(f'[00:00:00] Begin {root}/stage{stage}\\n'.encode())
+    stage_lines = line_count // stages
+    for start in range(0, stage_lines, block):
+        lines = ''.join(f'{LOG_LINE}\\n'.format(index=index) for index in range(start, min(start + block, stage_lines)))
+        output.write(lines.encode())
+        sys.stderr.write(f'Warning: block {start} of stage{stage}\\n')
+    output.write(f'[00:00:00] End {root}/stage{stage}\\n'.encode())
+'''
+
+
+class GeneratorBenchmark(object):
+    REFERENCE = 'benchmark'
+
+    def __init__(
+        self,
+        resource_root: str,
+        work_dir: str,
+        repeat: int = 3,
+        target_counts: Optional[list[int]] = None,
+        package_counts: Optional[list[int]] = None,
+        log_lines: int = 2_000_000,
+        image_size: int = 256,
+    ) -> None:
+        self._resource_root = resource_root
+        self._work_dir = work_dir
+        self._repeat = max(1, repeat)
+        self._target_counts = target_counts if target_counts else [10, 100, 1000]
+        self._package_counts = package_counts if package_counts else [1500, 15000]
+        self._log_lines = log_lines
+        self._image_size = image_size
+        self._repository_path = f'{work_dir}/pi-gen'
+        self._results: list[dict[str, Any]] = []
+
+    def run(self) -> dict[str, Any]:
+        os.makedirs(self._work_dir, exist_ok=True)
+        repository = self._create_pi_gen_tree()
+
+        for target_count in self._target_counts:
+            self._benchmark_config_load(target_count)
+
+        self._benchmark_initialize(repository)
+        self._benchmark_configure(repository)
+
+        for log_level in ['stage', 'all']:
+            self._benchmark_build_output(log_level)
+
+        self._benchmark_image_move()
+
+        for package_count in self._package_counts:
+            self._benchmark_package_diff(package_count)
+
+        return {
+            'version': _get_version(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'repeat': self._repeat,
+            'results': self._results,
+        }
+
+    def _benchmark_config_load(self, target_count: int) -> None:
+        config_path = f'{self._work_dir}/target-config-{target_count}.json'
+        _write_json(config_path, _create_targets(target_count))
+        target_names = [f'target-{index}' for index in range(target_count)]
+        config_loader = TargetConfigLoader()
+
+        def load_cold() -> None:
+            TargetConfigLoader().load_targets(config_path, target_names)
+
+        def load_warm() -> None:
+            config_loader.load_targets(config_path, target_names)
+
+        self._measure('config_load', {'targets': target_count, 'cache': 'cold'}, load_cold, items=target_count)
+        load_warm()
+        self._measure('config_load', {'targets': target_count, 'cache': 'warm'}, load_warm, items=target_count)
+
+    def _benchmark_initialize(self, repository: Repo) -> None:
+        config = self._load_benchmark_target()
+        initializer = BuildInitializer(repository, _NoDependencyInstaller(), self._create_configurator())
+
+        self._measure(
+            'initialize',
+            {'packages': len(config.packages)},
+            lambda: initializer.initialize(config),
+            setup=partial(_reset_repository, repository),
+        )
+
+    def _benchmark_configure(self, repository: Repo) -> None:
+        config = self._load_benchmark_target()
+        configurator = self._create_configurator()
+
+        self._measure(
+            'configure',
+            {'packages': len(config.packages)},
+            lambda: configurator.configure(config),
+            setup=partial(_reset_repository, repository),
+        )
+
+    def _benchmark_build_output(self, log_level: str) -> None:
+        script_path = f'{self._work_dir}/emit_output.py'
+
+        with open(script_path, 'w') as script_file:
+            script_file.write(f'LOG_LINE = {LOG_LINE!r}\n{OUTPUT_SCRIPT}')
+
+        command = f'{sys.executable} {script_path} {self._log_lines} {self._repository_path}'
+        image_builder = ImageBuilder(self._repository_path, log_level=log_level)
+
+        def build() -> None:
+            current_dir = os.getcwd()
+            try:
+                image_builder.build(command)
+            finally:
+                os.chdir(current_dir)
+
+        self._measure('build_output', {'lines': self._log_lines, 'log_level': log_level}, build, items=self._log_lines)
+
+    def _benchmark_image_move(self) -> None:
+        source_path = f'{self._work_dir}/deploy/image.img'
+        target_path = f'{self._work_dir}/output/image.img'
+        os.makedirs(os.path.dirname(source_path), exist_ok=True)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+
+        def create_image() -> None:
+            _create_sparse_image(source_path, self._image_size * 1024 * 1024)
+            if os.path.exists(target_path):
+                os.unlink(target_path)
+
+        self._measure(
+            'image_move',
+            {'size': self._image_size * 1024 * 1024},
+            lambda: ImageHasher().move(source_path, target_path),
+            setup=create_image,
+            items=self._image_size * 1024 * 1024,
+        )
+
+    def _benchmark_package_diff(self, package_count: int) -> None:
+        before_path = f'{self._work_dir}/before-install-{package_count}.list'
+        after_path = f'{self._work_dir}/after-install-{package_count}.list'
+        _write_package_list(before_path, package_count, 0)
+        _write_package_list(after_path, package_count + package_count // 10, package_count // 20)
+
+        def diff() -> None:
+            after = packageList.parse_package_list(after_path)
+            result = packageList.diff_packages(packageList.parse_package_list(before_path), after)
+            result.get_installed(after)
+
+        self._measure('package_diff', {'packages': package_count}, diff, items=package_count)
+
+    def _measure(
+        self,
+        phase: str,
+        parameters: dict[str, Any],
+        function: Callable[[], object],
+        setup: Optional[Callable[[], object]] = None,
+        items: Optional[int] = None,
+    ) -> None:
+        durations = []
+
+        for _ in range(self._repeat):
+            if setup:
+                setup()
+            start_time = time.perf_counter()
+            function()
+            durations.append(time.perf_counter() - start_time)
+
+        result = {
+            'phase': phase,
+            'parameters': parameters,
+            'runs': len(durations),
+            'min': min(durations),
+            'mean': statistics.mean(durations),
+            'max': max(durations),
+        }
+
+        if items is not None:
+            result['throughput'] = items / min(durations) if min(durations) else 0.0
+
+        log.info('Benchmark phase completed', **result)
+
+        self._results.append(result)
+
+    def _load_benchmark_target(self) -> TargetConfig:
+        if not (config := TargetConfigLoader().load_target(f'{self._work_dir}/target-config-bench.json', 'target-0')):
+            raise ValueError('Benchmark target configuration not found')
+
+        return config
+
+    def _create_configurator(self) -> BuildConfigurator:
+        configuration = BuildConfiguration('xz', True, True, 'template/config.j2')
+        return BuildConfigurator(self._resource_root, self._repository_path, configuration)
+
+    def _create_pi_gen_tree(self) -> Repo:
+        shutil.rmtree(self._repository_path, ignore_errors=True)
+        boot_files = f'{self._repository_path}/stage1/00-boot-files/files'
+        patches = f'{self._repository_path}/stage2/01-sys-tweaks/00-patches'
+
+        _write_file(f'{boot_files}/cmdline.txt', f'{BOOT_CMDLINE}\n')
+        _write_file(f'{boot_files}/config.txt', '# Synthetic boot config\n')
+        _write_file(f'{patches}/07-resize-init.diff', f'+{BOOT_CMDLINE} init=/usr/lib/raspi-config/init_resize.sh\n')
+        _write_file(f'{self._repository_path}/stage2/00-copies-and-fills/00-run.sh', '#!/bin/bash -e\n')
+        _write_file(f'{self._repository_path}/stage0/prerun.sh', '#!/bin/bash -e\n')
+        _write_file(f'{self._repository_path}/depends', 'quilt\nparted\nqemu-user-static:qemu-arm\n')
+
+        repository = Repo.init(self._repository_path)
+        repository.git.add('--all')
+        repository.index.commit('Synthetic pi-gen tree')
+        repository.create_tag(self.REFERENCE)
+
+        targets = _create_targets(1, packages=50, sources=True, scripts=True)
+        _write_json(f'{self._work_dir}/target-config-bench.json', targets)
+
+        return repository
+
+
+class _NoDependencyInstaller(IDependencyInstaller):
+
+    def install(self, dependency_list: str) -> None:
+        pass
+
+
+def main() -> None:
+    arguments = _get_arguments()
+
+    setup_logging('generator-benchmark', arguments.log_level, warn_on_overwrite=False)
+
+    work_dir = arguments.work_dir if arguments.work_dir else tempfile.mkdtemp(prefix='generator-benchmark-')
+
+    benchmark = GeneratorBenchmark(
+        str(Path(os.path.dirname(__file__)).parent.absolute()),
+        os.path.abspath(work_dir),
+        arguments.repeat,
+        arguments.target_counts,
+        arguments.package_counts,
+        arguments.log_lines,
+        arguments.image_size,
+    )
+
+    try:
+        report = benchmark.run()
+    finally:
+        if not arguments.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    _write_json(arguments.output, report)
+
+    for result in report['results']:
+        parameters = ' '.join(f'{key}={value}' for key, value in result['parameters'].items())
+        print(f'{result["phase"]:<14} {parameters:<32} min={result["min"]:.4f}s mean={result["mean"]:.4f}s')
+
+    print(f'Results written to {arguments.output}')
+
+
+def _get_arguments() -> Namespace:
+    parser = ArgumentParser(
+        description='Benchmark the phases of the image generator pipeline',
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument('-o', '--output', help='benchmark result JSON file', default='benchmark-results.json')
+    parser.add_argument('-w', '--work-dir', help='work directory (default: temporary directory)')
+    parser.add_argument('-r', '--repeat', help='number of runs of each phase', type=int, default=3)
+    parser.add_argument('-l', '--log-level', help='logging level', default='warning')
+    parser.add_argument('--log-lines', help='lines of synthetic pi-gen output', type=int, default=2_000_000)
+    parser.add_argument('--image-size', help='synthetic image size in MiB', type=int, default=256)
+    parser.add_argument(
+        '--target-counts', help='target counts of the config load phase', type=int, nargs='+', default=[10, 100, 1000]
+    )
+    parser.add_argument(
+        '--package-counts', help='package counts of the package diff phase', type=int, nargs='+', default=[1500, 15000]
+    )
+
+    return parser.parse_args()
+
+
+def _reset_repository(repository: Repo) -> None:
+    repository.git.reset('--hard')
+    repository.git.clean('-dfx')
+
+
+def _get_version() -> str:
+    try:
+        return metadata.version('raspbian-image-generator')
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def _create_targets(
+    count: int, packages: int = 20, sources: bool = False, scripts: bool = False
+) -> list[dict[str, Any]]:
+    base: dict[str, Any] = {
+        'name': 'base',
+        'abstract': True,
+        'reference': GeneratorBenchmark.REFERENCE,
+        'packages': [{'package': f'package-{index}', 'version': '1.0.0'} for index in range(packages)],
+        'boot_cmdline': ['modules-load=dwc2,g_ether'],
+        'boot_config': ['enable_uart=1', 'dtoverlay=dwc2'],
+    }
+
+    if sources:
+        base['sources'] = [
+            {
+                'name': 'benchmark',
+                'source': 'deb http://localhost stable main',
+                'key_id': 'C1AEE2EDBAEC37595801DDFAE15BC62117A4E0F3',
+                'key_file': 'http://localhost/public.key',
+                'key_server': 'keyserver.ubuntu.com',
+            }
+        ]
+
+    if scripts:
+        base['pre_install'] = ['echo pre-install']
+        base['post_install'] = ['echo post-install']
+        base['first_boot'] = ['echo first-boot']
+
+    targets = [
+        {
+            'name': f'target-{index}',
+            'version': f'1.0.{index}',
+            'extends': 'base',
+            'packages': [{'package': f'extra-{index}'}],
+        }
+        for index in range(count)
+    ]
+
+    return [base] + targets
+
+
+def _create_sparse_image(path: str, size: int) -> None:
+    block = os.urandom(1024 * 1024)
+
+    with open(path, 'wb') as image_file:
+        image_file.truncate(size)
+        for offset in range(0, size, 4 * len(block)):
+            image_file.seek(offset)
+            image_file.write(block[: min(len(block), size - offset)])
+
+
+def _write_package_list(path: str, count: int, upgraded: int) -> None:
+    with open(path, 'w') as list_file:
+        list_file.write('Listing...\n')
+        for index in range(count):
+            version = '1.1-1' if index < upgraded else '1.0-1'
+            list_file.write(f'package-{index}/oldstable,now {version} armhf [installed,automatic]\n')
+
+
+def _write_file(path: str, content: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, 'w') as file:
+        file.write(content)
+
+
+def _write_json(path: str, content: Any) -> None:
+    with open(path, 'w') as file:
+        file.write(f'{json.dumps(content, indent=2)}\n')
+
+
+if __name__ == '__main__':
+    main()
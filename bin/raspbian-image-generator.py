@@ -5,18 +5,27 @@
 # SPDX-License-Identifier: MIT
 
 import os
-import shutil
+import signal
+import sys
 from argparse import Namespace, ArgumentParser, ArgumentDefaultsHelpFormatter, BooleanOptionalAction
 from pathlib import Path
+from typing import Optional
 
-from apt import Cache
-from common_utility import SessionProvider, FileDownloader
-from common_utility.jsonLoader import JsonLoader
 from context_logger import setup_logging, get_logger
-from git import Repo
-from package_installer import AptInstaller
 
-from image_generator import ImageGenerator, BuildConfigurator, ImageBuilder, BuildConfiguration, BuildInitializer
+from image_generator import (
+    BuildConfiguration,
+    ImageGeneratorFactory,
+    BatchGenerator,
+    StageCache,
+    AptCacheProxy,
+    ImageBuilder,
+    BuildDaemon,
+    BuildCoordinator,
+    TargetConfigLoader,
+    ConfigFetcher,
+    ProfilerHook,
+)
 
 log = get_logger('ImageGeneratorApp')
 
@@ -26,72 +35,205 @@ def main() -> None:
 
     setup_logging('raspbian-image-generator', arguments.log_level, arguments.log_file)
 
-    log.info('Started image generation', target=arguments.target_name, arguments=vars(arguments))
+    log.info('Started image generation', targets=arguments.target_names, arguments=vars(arguments))
 
     resource_root = _get_resource_root()
     repository_location = os.path.abspath(arguments.repository_path)
-    repository = _initialize_repository(repository_location, arguments.repository_url)
 
-    session_provider = SessionProvider()
-    file_downloader = FileDownloader(session_provider, os.path.abspath(arguments.download))
+    config_fetcher = ConfigFetcher(os.path.abspath(arguments.download))
+    target_config = config_fetcher.fetch(arguments.target_config, arguments.target_config_sha256)
+    config_loader = TargetConfigLoader()
+    output_directory = os.path.abspath(arguments.output)
 
-    target_config = file_downloader.download(arguments.target_config, skip_if_exists=False)
-    json_loader = JsonLoader()
+    if arguments.coordinator:
+        _run_coordinator(
+            BuildCoordinator(
+                target_config, config_loader, output_directory, arguments.coordinator_host, arguments.coordinator_port
+            ),
+            arguments.target_names,
+        )
+        return
 
-    apt_cache = Cache()
-    apt_installer = AptInstaller(apt_cache)
+    apt_cache_proxy = _create_apt_cache_proxy(arguments)
+    apt_proxy = apt_cache_proxy.start() if apt_cache_proxy else None
 
     configuration = BuildConfiguration(
-        arguments.compression, arguments.enable_ssh, arguments.clean_build, arguments.config_template
+        arguments.compression,
+        arguments.enable_ssh,
+        arguments.clean_build,
+        arguments.config_template,
+        apt_proxy=apt_proxy,
+        compression_level=arguments.compression_level,
+        compression_threads=arguments.compression_threads,
+        blake3_checksum=arguments.blake3,
+        trim_image=arguments.trim_image,
+        block_map=arguments.block_map,
+        analyze_image=arguments.analyze_image,
+    )
+    stage_cache_dir = os.path.abspath(arguments.stage_cache) if arguments.stage_cache else None
+    wheelhouse_dir = os.path.abspath(arguments.installer_cache) if arguments.installer_cache else None
+    generator_factory = ImageGeneratorFactory(
+        resource_root,
+        repository_location,
+        arguments.repository_url,
+        target_config,
+        configuration,
+        output_directory,
+        stage_cache_dir,
+        arguments.snapshot_format,
+        wheelhouse_dir,
+        arguments.force,
+        arguments.chrome_trace,
+        os.path.abspath(arguments.build_log_dir) if arguments.build_log_dir else None,
+        arguments.build_log_level,
+        arguments.repository_depth,
+        arguments.profiler,
+        os.path.abspath(arguments.profile_dir),
+        os.path.abspath(arguments.metrics_file) if arguments.metrics_file else None,
     )
-    configurator = BuildConfigurator(resource_root, repository_location, configuration)
-    image_builder = ImageBuilder(repository_location)
 
-    build_initializer = BuildInitializer(repository, apt_installer, configurator)
-    output_directory = os.path.abspath(arguments.output)
-    image_generator = ImageGenerator(target_config, json_loader, build_initializer, image_builder, output_directory)
+    if arguments.daemon:
+        try:
+            _run_daemon(
+                BuildDaemon(
+                    generator_factory,
+                    arguments.jobs,
+                    arguments.daemon_host,
+                    arguments.daemon_port,
+                    arguments.coordinator_url,
+                )
+            )
+        finally:
+            if apt_cache_proxy:
+                apt_cache_proxy.stop()
+        return
+
+    batch_generator = BatchGenerator(
+        target_config, config_loader, generator_factory, arguments.jobs, share_base_stages=bool(stage_cache_dir)
+    )
+
+    try:
+        results = batch_generator.generate(arguments.target_names)
+    finally:
+        if apt_cache_proxy:
+            apt_cache_proxy.stop()
 
-    image_generator.generate(arguments.target_name)
+    if not all(result.success for result in results):
+        sys.exit(1)
 
 
 def _get_arguments() -> Namespace:
     parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
     parser.add_argument('-f', '--log-file', help='log file path')
     parser.add_argument('-l', '--log-level', help='logging level', default='INFO')
+    parser.add_argument('--build-log-dir', help='compressed raw pi-gen build log directory', default='log')
+    parser.add_argument(
+        '--build-log-level',
+        help='pi-gen output logged by the logger (stage: stage transitions, warning: stage transitions and stderr)',
+        choices=ImageBuilder.LOG_LEVELS,
+        default='warning',
+    )
 
     parser.add_argument('-d', '--download', help='target config download location', default='/tmp/config')
+    parser.add_argument('--target-config-sha256', help='expected SHA-256 checksum of the target config file')
     parser.add_argument('-p', '--repository-path', help='repository location path', default='/tmp/pi-gen')
     parser.add_argument(
         '-u', '--repository-url', help='repository URL', default='https://github.com/RPi-Distro/pi-gen.git'
     )
+    parser.add_argument('--repository-depth', help='shallow repository mirror depth', type=int)
     parser.add_argument('-o', '--output', help='output image directory', default='image')
+    parser.add_argument('-s', '--stage-cache', help='stage root file system snapshot cache directory')
+    parser.add_argument(
+        '--snapshot-format', help='stage snapshot format', choices=StageCache.SNAPSHOT_FORMATS, default='tar'
+    )
+
+    parser.add_argument('-a', '--apt-cache', help='shared apt package cache directory')
+    parser.add_argument('--apt-cache-size', help='apt package cache size limit in GiB', type=float, default=10)
+    parser.add_argument('--apt-cache-port', help='apt package cache proxy port', type=int, default=3142)
+
+    parser.add_argument('-i', '--installer-cache', help='package installer wheelhouse cache directory')
 
     parser.add_argument('-t', '--config-template', help='pi-gen config template', default='template/config.j2')
-    parser.add_argument('-c', '--compression', help='output image compression', default='xz')
+    parser.add_argument(
+        '-c', '--compression', help='output image compression', choices=BuildConfiguration.COMPRESSIONS, default='xz'
+    )
+    parser.add_argument('--compression-level', help='output image compression level', type=int)
+    parser.add_argument(
+        '--compression-threads', help='output image compression threads (0: all cores)', type=int, default=0
+    )
+    parser.add_argument('--blake3', help='also compute BLAKE3 image checksum', action='store_true')
+    parser.add_argument(
+        '--trim-image', help='zero-fill free space and punch holes in the raw image', action='store_true'
+    )
+    parser.add_argument('--block-map', help='export block map of the raw image for bmaptool', action='store_true')
+    parser.add_argument(
+        '--analyze-image', help='export size breakdown of the raw image and its changes', action='store_true'
+    )
     parser.add_argument('--enable-ssh', help='enable SSH access', action=BooleanOptionalAction, default=True)
     parser.add_argument('--clean-build', help='clean before build', action=BooleanOptionalAction, default=True)
+    parser.add_argument('--force', help='rebuild images even if their inputs are unchanged', action='store_true')
+    parser.add_argument(
+        '--chrome-trace', help='export build stage timeline in Chrome trace format', action='store_true'
+    )
+    parser.add_argument('--profiler', help='profile generator phases', choices=ProfilerHook.PROFILERS)
+    parser.add_argument('--profile-dir', help='generator phase profile directory', default='profile')
+    parser.add_argument('--metrics-file', help='export generator phase metrics in Prometheus text format')
+    parser.add_argument('-j', '--jobs', help='number of targets to build in parallel', type=int, default=1)
+
+    parser.add_argument('--daemon', help='serve build jobs over HTTP with warm workspaces', action='store_true')
+    parser.add_argument('--daemon-host', help='build daemon listen address', default='127.0.0.1')
+    parser.add_argument('--daemon-port', help='build daemon listen port', type=int, default=8180)
+    parser.add_argument('--coordinator-url', help='register the build daemon as a worker of a build coordinator')
+
+    parser.add_argument('--coordinator', help='distribute the targets to registered build workers', action='store_true')
+    parser.add_argument('--coordinator-host', help='build coordinator listen address', default='127.0.0.1')
+    parser.add_argument('--coordinator-port', help='build coordinator listen port', type=int, default=8190)
+
+    parser.add_argument('target_config', help='target config JSON file, directory of JSON files or URL')
+    parser.add_argument('target_names', help='image target config names or "all"', nargs='*')
+
+    arguments = parser.parse_args()
 
-    parser.add_argument('target_config', help='target config JSON file or URL')
-    parser.add_argument('target_name', help='image target config name')
+    if not arguments.daemon and not arguments.target_names:
+        parser.error('the following arguments are required: target_names')
 
-    return parser.parse_args()
+    return arguments
 
 
 def _get_resource_root() -> str:
     return str(Path(os.path.dirname(__file__)).parent.absolute())
 
 
-def _initialize_repository(repo_path: str, repo_url: str) -> Repo:
-    if not os.path.exists(f'{repo_path}/.git'):
-        shutil.rmtree(repo_path, ignore_errors=True)
-        log.info('Cloning repository', repository=repo_url, path=repo_path)
-        return Repo.clone_from(repo_url, repo_path)
-    else:
-        log.info('Cleaning existing repository', repository=repo_url, path=repo_path)
-        repo = Repo(repo_path)
-        repo.git.reset('--hard', 'HEAD')
-        repo.git.clean('-df')
-        return repo
+def _run_daemon(build_daemon: BuildDaemon) -> None:
+    build_daemon.start()
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    try:
+        signal.pause()
+    except KeyboardInterrupt:
+        log.info('Shutting down build daemon')
+    finally:
+        build_daemon.stop()
+
+
+def _run_coordinator(build_coordinator: BuildCoordinator, target_names: list[str]) -> None:
+    build_coordinator.start()
+
+    try:
+        results = build_coordinator.generate(target_names)
+    finally:
+        build_coordinator.stop()
+
+    if not all(result.success for result in results):
+        sys.exit(1)
+
+
+def _create_apt_cache_proxy(arguments: Namespace) -> Optional[AptCacheProxy]:
+    if arguments.apt_cache:
+        cache_size = int(arguments.apt_cache_size * 1024**3)
+        return AptCacheProxy(os.path.abspath(arguments.apt_cache), cache_size, port=arguments.apt_cache_port)
+    return None
 
 
 if __name__ == '__main__':
@@ -1,5 +1,29 @@
 from .targetConfig import *
+from .targetConfigLoader import *
+from .configFetcher import *
+from .stageCache import *
+from .aptCacheProxy import *
+from .installerWheelhouse import *
 from .buildConfigurator import *
+from .repositoryManager import *
+from .dependencyInstaller import *
 from .buildInitializer import *
+from .buildManifest import *
+from .stageProfiler import *
+from .phaseHook import *
+from .profilerHook import *
+from .openMetricsExporter import *
+from .buildLog import *
 from .imageBuilder import *
+from .asyncImageBuilder import *
+from .imageHasher import *
+from .imageTrimmer import *
+from .imageAnalyzer import *
+from .blockMap import *
+from .imageCompressor import *
 from .imageGenerator import *
+from .asyncImageGenerator import *
+from .generatorFactory import *
+from .batchGenerator import *
+from .buildDaemon import *
+from .buildCoordinator import *
@@ -0,0 +1,301 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import hashlib
+import os
+import select
+import shutil
+import socket
+import threading
+from dataclasses import dataclass
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from io import BufferedIOBase
+from typing import Optional, BinaryIO, Any
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+from urllib.request import build_opener, ProxyHandler, Request
+
+from context_logger import get_logger
+
+log = get_logger('AptCacheProxy')
+
+
+@dataclass
+class AptCacheStatistics:
+    hits: int = 0
+    misses: int = 0
+    passthrough: int = 0
+    evictions: int = 0
+    served_bytes: int = 0
+    downloaded_bytes: int = 0
+
+
+class IAptCacheProxy(object):
+
+    def start(self) -> str:
+        raise NotImplementedError()
+
+    def stop(self) -> None:
+        raise NotImplementedError()
+
+    def get_url(self) -> str:
+        raise NotImplementedError()
+
+    def get_statistics(self) -> AptCacheStatistics:
+        raise NotImplementedError()
+
+
+class AptCacheProxy(IAptCacheProxy):
+    CACHED_EXTENSIONS = ('.deb', '.udeb', '.ddeb')
+    BUFFER_SIZE = 256 * 1024
+
+    def __init__(self, cache_dir: str, max_size: int, host: str = '127.0.0.1', port: int = 3142) -> None:
+        self._cache_dir = cache_dir
+        self._max_size = max_size
+        self._host = host
+        self._port = port
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._statistics = AptCacheStatistics()
+        self._cache_size = 0
+        self._opener = build_opener(ProxyHandler({}))
+
+    def start(self) -> str:
+        os.makedirs(self._cache_dir, exist_ok=True)
+        self._cache_size = sum(os.path.getsize(path) for path in self._get_cached_files())
+
+        self._server = ThreadingHTTPServer((self._host, self._port), _AptCacheRequestHandler)
+        self._server.daemon_threads = True
+        setattr(self._server, 'proxy', self)
+        self._thread = threading.Thread(target=self._server.serve_forever, name='AptCacheProxy', daemon=True)
+        self._thread.start()
+
+        log.info('Apt cache proxy started', url=self.get_url(), cache=self._cache_dir, cache_size=self._cache_size)
+
+        return self.get_url()
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+        log.info('Apt cache proxy stopped', statistics=vars(self._statistics), cache_size=self._cache_size)
+
+    def get_url(self) -> str:
+        port = self._server.server_address[1] if self._server else self._port
+        return f'http://{self._host}:{port}'
+
+    def get_statistics(self) -> AptCacheStatistics:
+        return self._statistics
+
+    def is_cacheable(self, url: str) -> bool:
+        return urlsplit(url).path.endswith(self.CACHED_EXTENSIONS)
+
+    def get_cache_path(self, url: str) -> str:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return f'{self._cache_dir}/{key[:2]}/{key}{os.path.splitext(urlsplit(url).path)[1]}'
+
+    def open_upstream(self, url: str, headers: dict[str, str]) -> Any:
+        return self._opener.open(Request(url, headers=headers))
+
+    def record_hit(self, cached_file: BinaryIO) -> int:
+        os.utime(cached_file.fileno())
+        size = os.fstat(cached_file.fileno()).st_size
+
+        with self._lock:
+            self._statistics.hits += 1
+            self._statistics.served_bytes += size
+
+        return size
+
+    def record_miss(self, size: int) -> None:
+        with self._lock:
+            self._statistics.misses += 1
+            self._statistics.downloaded_bytes += size
+
+    def record_passthrough(self) -> None:
+        with self._lock:
+            self._statistics.passthrough += 1
+
+    def store(self, temp_path: str, path: str) -> None:
+        size = os.path.getsize(temp_path)
+
+        with self._lock:
+            if not os.path.exists(path):
+                self._cache_size += size
+
+            os.replace(temp_path, path)
+
+            if self._cache_size > self._max_size:
+                self._evict()
+
+    def _evict(self) -> None:
+        cached_files = sorted(self._get_cached_files(), key=lambda path: os.stat(path).st_mtime)
+
+        for path in cached_files:
+            if self._cache_size <= self._max_size:
+                break
+
+            size = os.path.getsize(path)
+            os.unlink(path)
+            self._cache_size -= size
+            self._statistics.evictions += 1
+
+            log.debug('Evicted package from apt cache', file=path, size=size)
+
+    def _get_cached_files(self) -> list[str]:
+        cached_files: list[str] = []
+
+        for root, _, files in os.walk(self._cache_dir):
+            cached_files.extend(os.path.join(root, name) for name in files if name.endswith(self.CACHED_EXTENSIONS))
+
+        return cached_files
+
+
+class _AptCacheRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    FORWARDED_HEADERS = ['Accept', 'Cache-Control', 'If-Modified-Since', 'If-None-Match', 'Range', 'User-Agent']
+
+    @property
+    def proxy(self) -> AptCacheProxy:
+        return getattr(self.server, 'proxy')  # type: ignore
+
+    def do_GET(self) -> None:
+        if urlsplit(self.path).scheme != 'http':
+            self.send_error(400, 'Only absolute http URLs are supported')
+            return
+
+        if self.proxy.is_cacheable(self.path) and 'Range' not in self.headers:
+            self._handle_cached()
+        else:
+            self._handle_passthrough()
+
+    def do_CONNECT(self) -> None:
+        host, _, port = self.path.rpartition(':')
+
+        try:
+            upstream = socket.create_connection((host, int(port)), timeout=30)
+        except (OSError, ValueError) as error:
+            self.send_error(502, f'Failed to connect: {error}')
+            return
+
+        self.send_response(200, 'Connection established')
+        self.end_headers()
+
+        self.proxy.record_passthrough()
+        self._tunnel(upstream)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        log.debug('Apt cache proxy request', request=format % args)
+
+    def _handle_cached(self) -> None:
+        path = self.proxy.get_cache_path(self.path)
+
+        try:
+            with open(path, 'rb') as cached_file:
+                size = self.proxy.record_hit(cached_file)
+                log.debug('Apt cache hit', url=self.path)
+                self._send_file(cached_file, size)
+                return
+        except FileNotFoundError:
+            log.debug('Apt cache miss', url=self.path)
+
+        response = self._open_upstream()
+
+        if response is None:
+            return
+
+        with response:
+            self._send_headers(response.status, response.headers)
+
+            if response.status != 200:
+                self._copy(response, self.wfile)
+                return
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f'{path}.{threading.get_ident()}.tmp'
+
+            try:
+                with open(temp_path, 'wb') as temp_file:
+                    size = self._copy(response, self.wfile, temp_file)
+
+                self.proxy.record_miss(size)
+                self.proxy.store(temp_path, path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+
+    def _handle_passthrough(self) -> None:
+        self.proxy.record_passthrough()
+
+        response = self._open_upstream()
+
+        if response is not None:
+            with response:
+                self._send_headers(response.status, response.headers)
+                self._copy(response, self.wfile)
+
+    def _open_upstream(self) -> Any:
+        headers = {name: self.headers[name] for name in self.FORWARDED_HEADERS if name in self.headers}
+
+        try:
+            return self.proxy.open_upstream(self.path, headers)
+        except HTTPError as error:
+            self._send_headers(error.code, error.headers)
+            self._copy(error, self.wfile)
+        except (URLError, OSError) as error:
+            self.send_error(502, f'Upstream request failed: {error}')
+
+        return None
+
+    def _send_file(self, file: BinaryIO, size: int) -> None:
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.debian.binary-package')
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        shutil.copyfileobj(file, self.wfile, AptCacheProxy.BUFFER_SIZE)
+
+    def _send_headers(self, status: int, headers: Any) -> None:
+        self.send_response(status)
+        for name in ['Content-Type', 'Content-Length', 'Last-Modified', 'ETag', 'Content-Range']:
+            if headers and headers.get(name):
+                self.send_header(name, headers.get(name))
+        if not (headers and headers.get('Content-Length')):
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+
+    def _copy(self, source: Any, *targets: BufferedIOBase) -> int:
+        size = 0
+
+        while chunk := source.read(AptCacheProxy.BUFFER_SIZE):
+            for target in targets:
+                target.write(chunk)
+            size += len(chunk)
+
+        return size
+
+    def _tunnel(self, upstream: socket.socket) -> None:
+        sockets = [self.connection, upstream]
+
+        with upstream:
+            while True:
+                readable, _, errors = select.select(sockets, [], sockets, 60)
+                if errors or not readable:
+                    break
+
+                for source in readable:
+                    data = source.recv(AptCacheProxy.BUFFER_SIZE)
+                    if not data:
+                        self.close_connection = True
+                        return
+                    (upstream if source is self.connection else self.connection).sendall(data)
+
+        self.close_connection = True
@@ -0,0 +1,125 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import asyncio
+import os
+import shlex
+import signal
+import time
+from asyncio import StreamReader
+from asyncio.subprocess import Process, PIPE
+from datetime import datetime
+from logging import DEBUG, WARNING
+from typing import Optional, Callable
+
+from context_logger import get_logger
+
+from image_generator import ImageBuilder, IStageProfiler, IBuildLog
+
+log = get_logger('AsyncImageBuilder')
+
+
+class AsyncImageBuilder(ImageBuilder):
+    TERMINATE_TIMEOUT = 10.0
+
+    def __init__(
+        self,
+        repository_path: str,
+        stage_profiler: Optional[IStageProfiler] = None,
+        build_log: Optional[IBuildLog] = None,
+        log_level: str = 'all',
+        failure_report: Optional[str] = None,
+        report_lines: int = 50,
+    ) -> None:
+        super().__init__(repository_path, stage_profiler, build_log, log_level, failure_report, report_lines)
+        self._stage_listener: Optional[Callable[[str, str], None]] = None
+
+    async def build_async(
+        self, command: str = './build.sh', stage_listener: Optional[Callable[[str, str], None]] = None
+    ) -> datetime:
+        start_time = self._start_build(command)
+
+        self._stage_listener = stage_listener
+
+        try:
+            return_code = await self._run_command_async(command)
+        finally:
+            self._stage_listener = None
+
+        self._complete_build(command, return_code)
+
+        return start_time
+
+    def _on_stage_transition(self, transition: bytes, stage: str) -> None:
+        if self._stage_listener:
+            self._stage_listener(transition.decode(), stage)
+
+    async def _run_command_async(self, command: str) -> int:
+        log.info('Executing command', command=command)
+
+        start_time = time.time()
+
+        if self._build_log:
+            self._build_log.open()
+
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *shlex.split(command), stdout=PIPE, stderr=PIPE, cwd=self._repository_path, start_new_session=True
+            )
+
+            if self._stage_profiler:
+                self._stage_profiler.start(process.pid)
+
+            try:
+                await asyncio.gather(
+                    self._read_output(process.stdout, DEBUG),  # type: ignore
+                    self._read_output(process.stderr, WARNING),  # type: ignore
+                )
+                return_code = await process.wait()
+            except asyncio.CancelledError:
+                await self._terminate(process)
+                raise
+        finally:
+            if self._stage_profiler:
+                self._stage_profiler.stop()
+            if self._build_log:
+                self._build_log.close()
+
+        log.info(
+            'Command execution completed',
+            command=command,
+            return_code=return_code,
+            elapsed_time=f'{time.time() - start_time:.3f}s',
+        )
+
+        return return_code
+
+    async def _read_output(self, stream: StreamReader, log_level: int) -> None:
+        pending = b''
+
+        while chunk := await stream.read(self.CHUNK_SIZE):
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            self._process_lines(lines, log_level)
+
+        if pending:
+            self._process_lines([pending], log_level)
+
+    async def _terminate(self, process: Process) -> None:
+        log.warning('Build cancelled, terminating process group', pid=process.pid, stage=self._get_current_stage())
+
+        self._signal_process_group(process, signal.SIGTERM)
+
+        try:
+            await asyncio.wait_for(process.wait(), self.TERMINATE_TIMEOUT)
+        except asyncio.TimeoutError:
+            log.warning('Process group did not terminate, killing it', pid=process.pid)
+            self._signal_process_group(process, signal.SIGKILL)
+            await process.wait()
+
+    def _signal_process_group(self, process: Process, signal_number: int) -> None:
+        try:
+            os.killpg(process.pid, signal_number)
+        except ProcessLookupError:
+            pass
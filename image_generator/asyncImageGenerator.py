@@ -0,0 +1,73 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Optional, AsyncIterator
+
+from context_logger import get_logger
+
+from image_generator import TargetConfig, ImageGenerator, AsyncImageBuilder
+
+log = get_logger('AsyncImageGenerator')
+
+
+@dataclass
+class BuildEvent:
+    STARTED = 'started'
+    SKIPPED = 'skipped'
+    STAGE_BEGIN = 'stage_begin'
+    STAGE_END = 'stage_end'
+    COMPLETED = 'completed'
+
+    type: str
+    target: str
+    stage: Optional[str] = None
+    config: Optional[TargetConfig] = None
+    timestamp: float = field(default_factory=time.time)
+
+
+class AsyncImageGenerator(object):
+
+    def __init__(
+        self, image_generator: ImageGenerator, image_builder: AsyncImageBuilder, command: str = './build.sh'
+    ) -> None:
+        self._image_generator = image_generator
+        self._image_builder = image_builder
+        self._command = command
+
+    async def generate(self, target_name: str) -> AsyncIterator[BuildEvent]:
+        yield BuildEvent(BuildEvent.STARTED, target_name)
+
+        context = await asyncio.to_thread(self._image_generator.prepare, target_name)
+
+        if context.up_to_date:
+            yield BuildEvent(BuildEvent.SKIPPED, target_name, config=context.config)
+            return
+
+        events: asyncio.Queue[Optional[BuildEvent]] = asyncio.Queue()
+
+        def on_stage_transition(transition: str, stage: str) -> None:
+            event_type = BuildEvent.STAGE_BEGIN if transition == 'Begin' else BuildEvent.STAGE_END
+            events.put_nowait(BuildEvent(event_type, target_name, stage))
+
+        with self._image_generator.get_instrumentation().phase(target_name, 'build'):
+            build = asyncio.create_task(self._image_builder.build_async(self._command, on_stage_transition))
+            build.add_done_callback(lambda _: events.put_nowait(None))
+
+            try:
+                while event := await events.get():
+                    yield event
+
+                start_time = await build
+            finally:
+                if not build.done():
+                    log.info('Cancelling image build', target=target_name)
+                    build.cancel()
+                    await asyncio.gather(build, return_exceptions=True)
+
+        config = await asyncio.to_thread(self._image_generator.complete, context, start_time)
+
+        yield BuildEvent(BuildEvent.COMPLETED, target_name, config=config)
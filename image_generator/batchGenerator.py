@@ -0,0 +1,179 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from multiprocessing.queues import Queue
+from typing import Optional
+
+from context_logger import get_logger
+
+from image_generator import ITargetConfigLoader, IImageGeneratorFactory
+
+log = get_logger('BatchGenerator')
+
+ALL_TARGETS = 'all'
+
+
+@dataclass
+class BatchResult:
+    target: str
+    success: bool
+    elapsed_time: float
+    worker_id: int
+    version: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchGenerator(object):
+
+    def __init__(
+        self,
+        config_path: str,
+        config_loader: ITargetConfigLoader,
+        generator_factory: IImageGeneratorFactory,
+        max_workers: int = 1,
+        share_base_stages: bool = False,
+    ) -> None:
+        self._config_path = config_path
+        self._config_loader = config_loader
+        self._generator_factory = generator_factory
+        self._max_workers = max(1, max_workers)
+        self._share_base_stages = share_base_stages
+
+    def generate(self, target_names: list[str]) -> list[BatchResult]:
+        targets = self._resolve_targets(target_names)
+        groups = self._group_targets(targets)
+        worker_count = min(self._max_workers, len(targets))
+
+        log.info('Starting batch generation', targets=targets, groups=groups, workers=worker_count)
+
+        start_time = time.time()
+
+        if worker_count > 1:
+            results = self._generate_parallel(groups, worker_count)
+        else:
+            results = [_generate_target(self._generator_factory, 0, target) for group in groups for target in group]
+
+        elapsed_time = time.time() - start_time
+
+        results.sort(key=lambda result: targets.index(result.target))
+
+        self._report_results(results, elapsed_time)
+
+        return results
+
+    def _resolve_targets(self, target_names: list[str]) -> list[str]:
+        if target_names == [ALL_TARGETS]:
+            return self._config_loader.get_target_names(self._config_path)
+
+        return list(dict.fromkeys(target_names))
+
+    def _group_targets(self, targets: list[str]) -> list[list[str]]:
+        if not self._share_base_stages:
+            return [[target] for target in targets]
+
+        groups: dict[str, list[str]] = {}
+
+        for target in targets:
+            groups.setdefault(self._get_base_layer(target), []).append(target)
+
+        return list(groups.values())
+
+    def _get_base_layer(self, target: str) -> str:
+        try:
+            base_layer = self._config_loader.get_base_layer(self._config_path, target)
+        except ValueError as error:
+            log.warning('Invalid target configuration, building target alone', target=target, error=str(error))
+            base_layer = None
+
+        return base_layer if base_layer else target
+
+    def _generate_parallel(self, groups: list[list[str]], worker_count: int) -> list[BatchResult]:
+        worker_ids: Queue[int] = multiprocessing.Queue()
+        for worker_id in range(worker_count):
+            worker_ids.put(worker_id)
+
+        results = []
+
+        with ProcessPoolExecutor(worker_count, initializer=_initialize_worker, initargs=(worker_ids,)) as executor:
+            pending = {self._submit(executor, group[0]): group for group in groups}
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    group = pending.pop(future)
+                    result = self._get_result(future, group[0])
+                    results.append(result)
+
+                    if result.success:
+                        # The base stages are built and cached, the rest of the group can fork from them
+                        for target in group[1:]:
+                            pending[self._submit(executor, target)] = [target]
+                    elif len(group) > 1:
+                        pending[self._submit(executor, group[1])] = group[1:]
+
+        return results
+
+    def _submit(self, executor: ProcessPoolExecutor, target: str) -> 'Future[BatchResult]':
+        return executor.submit(_generate_target_in_worker, self._generator_factory, target)
+
+    def _get_result(self, future: 'Future[BatchResult]', target: str) -> BatchResult:
+        try:
+            return future.result()
+        except Exception as error:
+            return BatchResult(target, False, 0.0, -1, error=repr(error))
+
+    def _report_results(self, results: list[BatchResult], elapsed_time: float) -> None:
+        for result in results:
+            if result.success:
+                log.info(
+                    'Target generated',
+                    target=result.target,
+                    version=result.version,
+                    worker=result.worker_id,
+                    elapsed_time=f'{result.elapsed_time:.3f}s',
+                )
+            else:
+                log.error(
+                    'Target generation failed',
+                    target=result.target,
+                    error=result.error,
+                    worker=result.worker_id,
+                    elapsed_time=f'{result.elapsed_time:.3f}s',
+                )
+
+        log.info(
+            'Batch generation completed',
+            succeeded=len([result for result in results if result.success]),
+            failed=len([result for result in results if not result.success]),
+            build_time=f'{sum(result.elapsed_time for result in results):.3f}s',
+            elapsed_time=f'{elapsed_time:.3f}s',
+        )
+
+
+_worker_id = 0
+
+
+def _initialize_worker(worker_ids: 'Queue[int]') -> None:
+    global _worker_id
+    _worker_id = worker_ids.get()
+
+
+def _generate_target_in_worker(generator_factory: IImageGeneratorFactory, target: str) -> BatchResult:
+    return _generate_target(generator_factory, _worker_id, target)
+
+
+def _generate_target(generator_factory: IImageGeneratorFactory, worker_id: int, target: str) -> BatchResult:
+    start_time = time.time()
+
+    try:
+        config = generator_factory.create(worker_id).generate(target)
+        return BatchResult(target, True, time.time() - start_time, worker_id, version=config.version)
+    except Exception as error:
+        log.error('Failed to generate target', target=target, worker=worker_id, error=repr(error))
+        return BatchResult(target, False, time.time() - start_time, worker_id, error=repr(error))
@@ -0,0 +1,85 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import hashlib
+import os
+from typing import BinaryIO
+
+from context_logger import get_logger
+
+from image_generator import sparseFile
+
+log = get_logger('BlockMap')
+
+
+class IBlockMap(object):
+
+    def create(self, image_path: str, bmap_path: str) -> None:
+        raise NotImplementedError()
+
+
+class BlockMap(IBlockMap):
+    BUFFER_SIZE = 4 * 1024 * 1024
+    CHECKSUM_PLACEHOLDER = '0' * 64
+
+    def __init__(self, block_size: int = 4096) -> None:
+        self._block_size = block_size
+
+    def create(self, image_path: str, bmap_path: str) -> None:
+        with open(image_path, 'rb') as image_file:
+            size = os.fstat(image_file.fileno()).st_size
+            data_ranges = sparseFile.get_data_ranges(image_file.fileno(), size)
+            block_ranges = sparseFile.get_block_ranges(data_ranges, self._block_size)
+            ranges = [(first, last, self._get_checksum(image_file, first, last)) for first, last in block_ranges]
+
+        blocks_count = (size + self._block_size - 1) // self._block_size
+        mapped_blocks_count = sum(last - first + 1 for first, last, _ in ranges)
+
+        log.info(
+            'Creating block map file',
+            file=bmap_path,
+            blocks=blocks_count,
+            mapped_blocks=mapped_blocks_count,
+            ranges=len(ranges),
+        )
+
+        bmap = self._render(size, blocks_count, mapped_blocks_count, ranges, self.CHECKSUM_PLACEHOLDER)
+        bmap = bmap.replace(self.CHECKSUM_PLACEHOLDER, hashlib.sha256(bmap.encode()).hexdigest(), 1)
+
+        with open(bmap_path, 'w') as bmap_file:
+            bmap_file.write(bmap)
+
+    def _get_checksum(self, image_file: BinaryIO, first: int, last: int) -> str:
+        hasher = hashlib.sha256()
+        image_file.seek(first * self._block_size)
+        length = (last - first + 1) * self._block_size
+
+        while length > 0 and (chunk := image_file.read(min(length, self.BUFFER_SIZE))):
+            hasher.update(chunk)
+            length -= len(chunk)
+
+        return hasher.hexdigest()
+
+    def _render(
+        self, size: int, blocks_count: int, mapped_count: int, ranges: list[tuple[int, int, str]], checksum: str
+    ) -> str:
+        lines = [
+            '<?xml version="1.0" ?>',
+            '<bmap version="2.0">',
+            f'    <ImageSize> {size} </ImageSize>',
+            f'    <BlockSize> {self._block_size} </BlockSize>',
+            f'    <BlocksCount> {blocks_count} </BlocksCount>',
+            f'    <MappedBlocksCount> {mapped_count} </MappedBlocksCount>',
+            '    <ChecksumType> sha256 </ChecksumType>',
+            f'    <BmapFileChecksum> {checksum} </BmapFileChecksum>',
+            '    <BlockMap>',
+        ]
+
+        for first, last, range_checksum in ranges:
+            block_range = f'{first}-{last}' if first != last else f'{first}'
+            lines.append(f'        <Range chksum="{range_checksum}"> {block_range} </Range>')
+
+        lines.extend(['    </BlockMap>', '</bmap>'])
+
+        return '\n'.join(lines) + '\n'
@@ -5,18 +5,24 @@
 import os
 import re
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional, Callable
 
 from common_utility import render_template_file, create_file
 from common_utility.jsonLoader import T
 from context_logger import get_logger
 from pydantic import TypeAdapter
 
-from image_generator import TargetConfig
+from image_generator import TargetConfig, IStageCache, IInstallerWheelhouse
 
 log = get_logger('BuildConfigurator')
 
 
 class BuildConfiguration(object):
+    COMPRESSIONS = ['none', 'zip', 'gz', 'xz', 'zst']
+    # compressions applied by the generator on the uncompressed image exported by pi-gen
+    EXTERNAL_COMPRESSIONS = ['xz', 'gz', 'zst']
 
     def __init__(
         self,
@@ -25,12 +31,27 @@ class BuildConfiguration(object):
         clean_build: bool,
         config_template: str,
         first_boot_template: str = 'template/first_boot.j2',
+        apt_proxy: Optional[str] = None,
+        compression_level: Optional[int] = None,
+        compression_threads: int = 0,
+        blake3_checksum: bool = False,
+        trim_image: bool = False,
+        analyze_image: bool = False,
+        block_map: bool = False,
     ) -> None:
         self.compression = compression
+        self.deploy_compression = 'none' if compression in self.EXTERNAL_COMPRESSIONS else compression
+        self.compression_level = compression_level
+        self.compression_threads = compression_threads
+        self.blake3_checksum = blake3_checksum
+        self.trim_image = trim_image
+        self.analyze_image = analyze_image
+        self.block_map = block_map
         self.enable_ssh = '1' if enable_ssh else '0'
         self.clean_build = '1' if clean_build else '0'
         self.config_template = config_template
         self.first_boot_template = first_boot_template
+        self.apt_proxy = apt_proxy
 
 
 class IBuildConfigurator(object):
@@ -41,22 +62,29 @@ class IBuildConfigurator(object):
     def configure(self, config: TargetConfig) -> None:
         raise NotImplementedError()
 
+    def get_build_config(self, config: TargetConfig) -> str:
+        raise NotImplementedError()
+
 
 class BuildConfigurator(IBuildConfigurator):
+    FILE_WORKERS = 4
+    SCRIPT_MODE = 0o755
 
     def __init__(
         self,
         resource_root: str,
         repository_location: str,
         configuration: BuildConfiguration,
+        stage_cache: Optional[IStageCache] = None,
+        wheelhouse: Optional[IInstallerWheelhouse] = None,
         sub_stage_name: str = 'install-packages',
     ) -> None:
         self._resource_root = resource_root
         self._repository_location = repository_location
         self._configuration = configuration
+        self._stage_cache = stage_cache
+        self._wheelhouse = wheelhouse
         self._sub_stage_name = sub_stage_name
-        self._temp_sub_stage = f'{self._resource_root}/build/{self._sub_stage_name}'
-        self._script_index = 0
 
     def get_configuration(self) -> BuildConfiguration:
         return self._configuration
@@ -64,14 +92,35 @@ class BuildConfigurator(IBuildConfigurator):
     def configure(self, config: TargetConfig) -> None:
         log.info('Configuring build')
 
-        self._update_boot_files(config)
+        # The sub-stage is written next to its final location and renamed into place once its index is known
+        temp_sub_stage_dir = f'{self._repository_location}/stage{config.stage}/.{self._sub_stage_name}.tmp'
+
+        shutil.rmtree(temp_sub_stage_dir, ignore_errors=True)
+        os.makedirs(f'{temp_sub_stage_dir}/files')
 
-        self._build_sub_stage(config)
+        tasks = [partial(self._update_boot_files, config)] + self._get_sub_stage_tasks(config, temp_sub_stage_dir)
 
-        self._append_stage(config.stage)
+        with ThreadPoolExecutor(self.FILE_WORKERS) as executor:
+            for future in [executor.submit(task) for task in tasks]:
+                future.result()
+
+        self._append_stage(config, temp_sub_stage_dir)
 
         self._create_build_config(config)
 
+    def get_build_config(self, config: TargetConfig) -> str:
+        context = {
+            'target_name': config.name,
+            'target_hostname': config.name,
+            'compression': self._configuration.deploy_compression,
+            'enable_ssh': self._configuration.enable_ssh,
+            'clean_build': self._configuration.clean_build,
+            'stage_list': ' '.join([f'stage{i}' for i in range(config.stage + 1)]),
+            'apt_proxy': self._configuration.apt_proxy,
+        }
+
+        return str(render_template_file(self._resource_root, self._configuration.config_template, context))
+
     def _update_boot_files(self, config: TargetConfig) -> None:
         if config.boot_cmdline:
             cmdline_path = f'{self._repository_location}/stage1/00-boot-files/files/cmdline.txt'
@@ -103,61 +152,66 @@ class BuildConfigurator(IBuildConfigurator):
                 config_options = '\n'.join(config.boot_config)
                 config_file.write(f'{config_options}\n')
 
-    def _build_sub_stage(self, config: TargetConfig) -> None:
-        log.info('Creating sub-stage', stage=f'stage{config.stage}', sub_stage=self._temp_sub_stage)
+    def _get_sub_stage_tasks(self, config: TargetConfig, sub_stage_dir: str) -> list[Callable[[], object]]:
+        log.info('Creating sub-stage', stage=f'stage{config.stage}', sub_stage=sub_stage_dir)
+
+        files_dir = f'{sub_stage_dir}/files'
+        tasks: list[Callable[[], object]] = []
+
+        if config.sources:
+            tasks.append(partial(self._create_config_file, f'{files_dir}/source-config.json', config.sources))
 
-        shutil.rmtree(self._temp_sub_stage, ignore_errors=True)
-        os.makedirs(self._temp_sub_stage)
+        tasks.append(partial(self._create_config_file, f'{files_dir}/package-config.json', config.packages))
 
-        self._create_config_files(config)
+        if self._wheelhouse:
+            tasks.append(partial(self._wheelhouse.prepare, config, files_dir))
 
-        self._copy_sub_stage_script('packages')
+        scripts: list[Callable[[str], None]] = [partial(self._copy_sub_stage_script, 'packages')]
 
         if config.pre_install:
-            self._create_custom_script(config.pre_install)
+            scripts.append(partial(self._create_custom_script, config.pre_install))
 
-        self._copy_sub_stage_script('run.sh')
+        scripts.append(partial(self._copy_sub_stage_script, 'run.sh'))
 
         if config.post_install:
-            self._create_custom_script(config.post_install)
+            scripts.append(partial(self._create_custom_script, config.post_install))
+
+        tasks.extend(partial(script, f'{sub_stage_dir}/{index:02}-') for index, script in enumerate(scripts))
 
         if config.first_boot:
-            self._insert_first_boot_script(config.first_boot)
+            tasks.append(partial(self._insert_first_boot_script, config.first_boot, files_dir))
 
-    def _append_stage(self, stage: int) -> None:
-        new_sub_stage_dir = self._create_sub_stage_dir(stage)
+        return tasks
 
-        log.info('Appending sub-stage to stage', stage=f'stage{stage}', sub_stage=new_sub_stage_dir)
+    def _append_stage(self, config: TargetConfig, temp_sub_stage_dir: str) -> None:
+        if self._stage_cache:
+            stage_dir = f'{self._repository_location}/stage{config.stage}'
+            sub_stage_index = self._get_new_sub_dir_index(stage_dir)
+            build_config = self.get_build_config(config)
+            self._stage_cache.prepare(self._repository_location, config.stage, sub_stage_index, build_config)
 
-        self._copy_build_files(new_sub_stage_dir)
+        new_sub_stage_dir = self._get_sub_stage_dir(config.stage)
 
-    def _create_build_config(self, config: TargetConfig) -> None:
-        context = {
-            'target_name': config.name,
-            'target_hostname': config.name,
-            'compression': self._configuration.compression,
-            'enable_ssh': self._configuration.enable_ssh,
-            'clean_build': self._configuration.clean_build,
-            'stage_list': ' '.join([f'stage{i}' for i in range(config.stage + 1)]),
-        }
+        log.info('Appending sub-stage to stage', stage=f'stage{config.stage}', sub_stage=new_sub_stage_dir)
 
-        build_config = render_template_file(self._resource_root, self._configuration.config_template, context)
+        shutil.rmtree(new_sub_stage_dir, ignore_errors=True)
+        os.rename(temp_sub_stage_dir, new_sub_stage_dir)
+
+    def _create_build_config(self, config: TargetConfig) -> None:
+        build_config = self.get_build_config(config)
         config_path = f'{self._repository_location}/config'
 
         log.info('Creating build config file', file=config_path)
 
         create_file(config_path, build_config)
 
-    def _create_sub_stage_dir(self, target_stage: int) -> str:
+    def _get_sub_stage_dir(self, target_stage: int) -> str:
         stage_dir = f'{self._repository_location}/stage{target_stage}'
 
         new_index = self._get_new_sub_dir_index(stage_dir)
         new_sub_stage_name = f'{str(new_index).zfill(2)}-{self._sub_stage_name}'
 
-        new_sub_stage_dir = f'{stage_dir}/{new_sub_stage_name}'
-        os.makedirs(new_sub_stage_dir, exist_ok=True)
-
-        return new_sub_stage_dir
+        return f'{stage_dir}/{new_sub_stage_name}'
 
     def _get_new_sub_dir_index(self, stage_dir: str) -> int:
         indexes = []
@@ -171,44 +225,24 @@ class BuildConfigurator(IBuildConfigurator):
 
         return max(indexes) + 1 if indexes else 0
 
-    def _create_config_files(self, config: TargetConfig) -> None:
-        files_dir = f'{self._temp_sub_stage}/files'
-        os.makedirs(files_dir, exist_ok=True)
-
-        if config.sources:
-            source_config_path = f'{files_dir}/source-config.json'
-
-            log.info('Creating source config file', file=source_config_path)
-
-            self._create_config_file(source_config_path, config.sources)
-
-        package_config_path = f'{files_dir}/package-config.json'
-
-        log.info('Creating package config file', file=package_config_path)
-
-        self._create_config_file(package_config_path, config.packages)
-
-    def _copy_sub_stage_script(self, script_name: str) -> None:
+    def _copy_sub_stage_script(self, script_name: str, script_prefix: str) -> None:
         source_path = f'{self._resource_root}/scripts/{script_name}'
-        target_path = f'{self._temp_sub_stage}/{self._script_index:02}-{script_name}'
+        target_path = f'{script_prefix}{script_name}'
 
         log.info('Copying sub-stage script', source=source_path, target=target_path)
 
         shutil.copyfile(source_path, target_path)
-        os.system(f'chmod +x {target_path}')
-
-        self._script_index += 1
-
-    def _copy_build_files(self, new_sub_stage_dir: str) -> None:
-        shutil.copytree(self._temp_sub_stage, new_sub_stage_dir, dirs_exist_ok=True)
+        os.chmod(target_path, self.SCRIPT_MODE)
 
     def _create_config_file(self, config_path: str, config_list: list[T]) -> None:
+        log.info('Creating config file', file=config_path)
+
         with open(config_path, 'w') as config_file:
             type_adapter = TypeAdapter(config_list.__class__)
             config_file.write(f'{type_adapter.dump_json(config_list, indent=2, exclude_none=True).decode()}\n')
 
-    def _create_custom_script(self, commands: list[str]) -> None:
-        script_path = f'{self._temp_sub_stage}/{self._script_index:02}-run-chroot.sh'
+    def _create_custom_script(self, commands: list[str], script_prefix: str) -> None:
+        script_path = f'{script_prefix}run-chroot.sh'
 
         log.info('Creating custom script', script=script_path, commands=commands)
 
@@ -216,16 +250,14 @@ class BuildConfigurator(IBuildConfigurator):
             script_file.write('#!/bin/bash -ex\n\n')
             script_file.write('\n'.join(commands) + '\n')
 
-        os.system(f'chmod +x {script_path}')
-
-        self._script_index += 1
+        os.chmod(script_path, self.SCRIPT_MODE)
 
-    def _insert_first_boot_script(self, commands: list[str]) -> None:
+    def _insert_first_boot_script(self, commands: list[str], files_dir: str) -> None:
         context = {'commands': commands}
 
         first_boot = render_template_file(self._resource_root, self._configuration.first_boot_template, context)
 
-        script_path = f'{self._repository_location}/stage2/01-sys-tweaks/files/rc.local'
+        script_path = f'{files_dir}/rc.local'
 
         log.info('Creating script to run on first boot', script=script_path, commands=commands)
 
@@ -0,0 +1,399 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, Any
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from context_logger import get_logger
+
+from image_generator import ITargetConfigLoader, BatchResult, BuildJob, ALL_TARGETS
+
+log = get_logger('BuildCoordinator')
+
+
+@dataclass
+class BuildWorker:
+    id: int
+    url: str
+    capacity: int
+    active: int = 0
+    last_seen: float = 0.0
+    warm: set[Any] = field(default_factory=set)
+
+
+class IBuildCoordinator(object):
+
+    def start(self) -> str:
+        raise NotImplementedError()
+
+    def stop(self) -> None:
+        raise NotImplementedError()
+
+    def get_url(self) -> str:
+        raise NotImplementedError()
+
+    def register(self, url: str, capacity: int) -> BuildWorker:
+        raise NotImplementedError()
+
+    def get_workers(self) -> list[BuildWorker]:
+        raise NotImplementedError()
+
+    def generate(self, target_names: list[str]) -> list[BatchResult]:
+        raise NotImplementedError()
+
+
+class BuildCoordinator(IBuildCoordinator):
+    CHUNK_SIZE = 1024 * 1024
+    REQUEST_TIMEOUT = 60.0
+    MAX_ATTEMPTS = 3
+
+    def __init__(
+        self,
+        config_path: str,
+        config_loader: ITargetConfigLoader,
+        output_dir: str,
+        host: str = '127.0.0.1',
+        port: int = 8190,
+        worker_timeout: float = 300.0,
+        poll_interval: float = 1.0,
+    ) -> None:
+        self._config_path = config_path
+        self._config_loader = config_loader
+        self._output_dir = output_dir
+        self._host = host
+        self._port = port
+        self._worker_timeout = worker_timeout
+        self._poll_interval = poll_interval
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._condition = threading.Condition()
+        self._workers: dict[str, BuildWorker] = {}
+        self._worker_count = 0
+        self._warming: dict[Any, int] = {}
+        self._attempts: dict[str, int] = {}
+
+    def start(self) -> str:
+        self._server = ThreadingHTTPServer((self._host, self._port), _BuildCoordinatorRequestHandler)
+        self._server.daemon_threads = True
+        setattr(self._server, 'build_coordinator', self)
+
+        self._thread = threading.Thread(target=self._server.serve_forever, name='BuildCoordinator', daemon=True)
+        self._thread.start()
+
+        log.info('Build coordinator started', url=self.get_url())
+
+        return self.get_url()
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+        log.info('Build coordinator stopped', workers=len(self._workers))
+
+    def get_url(self) -> str:
+        port = self._server.server_address[1] if self._server else self._port
+        return f'http://{self._host}:{port}'
+
+    def register(self, url: str, capacity: int) -> BuildWorker:
+        with self._condition:
+            if worker := self._workers.get(url):
+                worker.capacity = capacity
+            else:
+                worker = BuildWorker(self._worker_count, url, capacity)
+                self._workers[url] = worker
+                self._worker_count += 1
+                log.info('Build worker registered', worker=worker.id, url=url, capacity=capacity)
+
+            worker.last_seen = time.time()
+            self._condition.notify_all()
+
+            return worker
+
+    def get_workers(self) -> list[BuildWorker]:
+        with self._condition:
+            return list(self._workers.values())
+
+    def generate(self, target_names: list[str]) -> list[BatchResult]:
+        targets = self._resolve_targets(target_names)
+        pending = [(target, self._get_base_layer(target)) for target in targets]
+        results: list[BatchResult] = []
+        threads = []
+        self._attempts = {}
+
+        log.info('Starting distributed generation', targets=targets, workers=len(self._workers))
+
+        start_time = time.time()
+        idle_since = start_time
+
+        with self._condition:
+            while len(results) < len(targets):
+                for target, base_key, worker in self._assign_targets(pending):
+                    thread = threading.Thread(
+                        target=self._generate_target, args=(target, base_key, worker, pending, results), daemon=True
+                    )
+                    threads.append(thread)
+                    thread.start()
+
+                if self._workers or not pending:
+                    idle_since = time.time()
+                elif time.time() - idle_since > self._worker_timeout:
+                    results.extend(self._fail_targets(pending, 'No build worker registered'))
+                    pending = []
+
+                self._condition.wait(self._poll_interval)
+
+        for thread in threads:
+            thread.join()
+
+        results.sort(key=lambda result: targets.index(result.target))
+
+        self._report_results(results, time.time() - start_time)
+
+        return results
+
+    def _resolve_targets(self, target_names: list[str]) -> list[str]:
+        if target_names == [ALL_TARGETS]:
+            return self._config_loader.get_target_names(self._config_path)
+
+        return list(dict.fromkeys(target_names))
+
+    def _get_base_layer(self, target: str) -> str:
+        try:
+            base_layer = self._config_loader.get_base_layer(self._config_path, target)
+        except ValueError as error:
+            log.warning('Invalid target configuration, scheduling without affinity', target=target, error=str(error))
+            base_layer = None
+
+        return base_layer if base_layer else target
+
+    def _assign_targets(self, pending: list[tuple[str, Any]]) -> list[tuple[str, Any, BuildWorker]]:
+        assigned = []
+
+        self._prune_workers()
+
+        for target, base_key in list(pending):
+            # The first target of a base stage warms the cache of its worker, the rest of its group waits for it
+            if base_key in self._warming:
+                continue
+
+            if not (worker := self._select_worker(base_key)):
+                continue
+
+            if not any(base_key in other.warm for other in self._workers.values()):
+                self._warming[base_key] = worker.id
+
+            worker.active += 1
+            pending.remove((target, base_key))
+            assigned.append((target, base_key, worker))
+
+        return assigned
+
+    def _prune_workers(self) -> None:
+        for worker in list(self._workers.values()):
+            if time.time() - worker.last_seen > self._worker_timeout:
+                log.warning('Build worker expired', worker=worker.id, url=worker.url, timeout=self._worker_timeout)
+                self._remove_worker(worker)
+
+    def _select_worker(self, base_key: Any) -> Optional[BuildWorker]:
+        workers = [worker for worker in self._workers.values() if worker.active < worker.capacity]
+
+        if not workers:
+            return None
+
+        return min(
+            workers, key=lambda worker: (base_key not in worker.warm, worker.active / worker.capacity, worker.id)
+        )
+
+    def _generate_target(
+        self,
+        target: str,
+        base_key: Any,
+        worker: BuildWorker,
+        pending: list[tuple[str, Any]],
+        results: list[BatchResult],
+    ) -> None:
+        log.info('Build job assigned', target=target, worker=worker.id, url=worker.url)
+
+        start_time = time.time()
+        unreachable = False
+
+        try:
+            job = self._run_job(worker, target)
+
+            if job['state'] == BuildJob.SUCCEEDED:
+                version = self._check_file_name(worker, job['version'])
+                self._download_artifacts(worker, job, f'{self._output_dir}/{target}/{version}')
+                result = BatchResult(target, True, time.time() - start_time, worker.id, version=job['version'])
+            else:
+                result = BatchResult(target, False, time.time() - start_time, worker.id, error=job['error'])
+        except Exception as error:
+            log.error('Failed to generate target on worker', target=target, worker=worker.id, error=repr(error))
+            result = BatchResult(target, False, time.time() - start_time, worker.id, error=repr(error))
+
+            if unreachable := isinstance(error, OSError):
+                self._remove_worker(worker)
+
+        with self._condition:
+            worker.active -= 1
+
+            if result.success:
+                worker.warm.add(base_key)
+
+            if self._warming.get(base_key) == worker.id:
+                del self._warming[base_key]
+
+            if unreachable and (attempt := self._attempts.get(target, 1)) < self.MAX_ATTEMPTS:
+                log.warning('Build job requeued', target=target, worker=worker.id, attempt=attempt)
+                self._attempts[target] = attempt + 1
+                pending.append((target, base_key))
+            else:
+                results.append(result)
+
+            self._condition.notify_all()
+
+    def _run_job(self, worker: BuildWorker, target: str) -> dict[str, Any]:
+        content = json.dumps({'target': target}).encode()
+        request = Request(f'{worker.url}/jobs', content, {'Content-Type': 'application/json'})
+
+        with urlopen(request, timeout=self.REQUEST_TIMEOUT) as response:
+            job: dict[str, Any] = json.loads(response.read())
+
+        while job['state'] not in [BuildJob.SUCCEEDED, BuildJob.FAILED]:
+            time.sleep(self._poll_interval)
+
+            with urlopen(f'{worker.url}/jobs/{job["id"]}', timeout=self.REQUEST_TIMEOUT) as response:
+                job = json.loads(response.read())
+
+        return job
+
+    def _download_artifacts(self, worker: BuildWorker, job: dict[str, Any], directory: str) -> None:
+        artifacts = job['artifacts']
+
+        for artifact in artifacts:
+            self._check_file_name(worker, artifact['name'])
+
+        if os.path.basename(job['image']) not in [artifact['name'] for artifact in artifacts]:
+            log.error('Image artifact missing from build job', worker=worker.id, image=job['image'])
+            raise ValueError('Image artifact missing')
+
+        os.makedirs(directory, exist_ok=True)
+
+        for artifact in artifacts:
+            self._download_artifact(
+                f'{worker.url}/jobs/{job["id"]}/artifacts/{quote(artifact["name"])}', directory, artifact
+            )
+
+        log.info('Build artifacts received', worker=worker.id, directory=directory, artifacts=len(artifacts))
+
+    def _download_artifact(self, url: str, directory: str, artifact: dict[str, Any]) -> None:
+        path = f'{directory}/{artifact["name"]}'
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        sha256 = hashlib.sha256()
+
+        try:
+            with urlopen(url, timeout=self.REQUEST_TIMEOUT) as response, open(temp_path, 'wb') as artifact_file:
+                while chunk := response.read(self.CHUNK_SIZE):
+                    sha256.update(chunk)
+                    artifact_file.write(chunk)
+
+            if sha256.hexdigest() != artifact['sha256']:
+                log.error(
+                    'Artifact checksum mismatch', file=path, expected=artifact['sha256'], actual=sha256.hexdigest()
+                )
+                raise ValueError('Artifact checksum mismatch')
+
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _check_file_name(self, worker: BuildWorker, name: str) -> str:
+        # Worker registration is not authenticated, reported names must not escape the output directory
+        if not name or name in ['.', '..'] or os.path.basename(name) != name:
+            log.error('Invalid file name received from worker', worker=worker.id, name=name)
+            raise ValueError('Invalid file name')
+
+        return name
+
+    def _remove_worker(self, worker: BuildWorker) -> None:
+        with self._condition:
+            if self._workers.get(worker.url) is worker:
+                del self._workers[worker.url]
+                log.warning('Build worker removed until it registers again', worker=worker.id, url=worker.url)
+
+    def _fail_targets(self, pending: list[tuple[str, Any]], error: str) -> list[BatchResult]:
+        log.error(error, targets=[target for target, _ in pending], timeout=self._worker_timeout)
+        return [BatchResult(target, False, 0.0, -1, error=error) for target, _ in pending]
+
+    def _report_results(self, results: list[BatchResult], elapsed_time: float) -> None:
+        for result in results:
+            if result.success:
+                log.info('Target generated', target=result.target, version=result.version, worker=result.worker_id)
+            else:
+                log.error('Target generation failed', target=result.target, error=result.error, worker=result.worker_id)
+
+        log.info(
+            'Distributed generation completed',
+            succeeded=len([result for result in results if result.success]),
+            failed=len([result for result in results if not result.success]),
+            elapsed_time=f'{elapsed_time:.3f}s',
+        )
+
+
+class _BuildCoordinatorRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def build_coordinator(self) -> BuildCoordinator:
+        return getattr(self.server, 'build_coordinator')  # type: ignore
+
+    def do_GET(self) -> None:
+        if self.path == '/workers':
+            self._send_json(200, [_get_worker_info(worker) for worker in self.build_coordinator.get_workers()])
+        else:
+            self._send_json(404, {'error': 'Not found'})
+
+    def do_POST(self) -> None:
+        if self.path != '/workers':
+            self._send_json(404, {'error': 'Not found'})
+            return
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            url = str(request.get('url') or f'http://{self.client_address[0]}:{int(request["port"])}')
+            capacity = max(1, int(request.get('capacity', 1)))
+        except (ValueError, TypeError, KeyError) as error:
+            self._send_json(400, {'error': f'Invalid worker registration: {error!r}'})
+            return
+
+        self._send_json(200, _get_worker_info(self.build_coordinator.register(url, capacity)))
+
+    def log_message(self, format: str, *args: Any) -> None:
+        log.debug('Build coordinator request', request=format % args)
+
+    def _send_json(self, status: int, content: Any) -> None:
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _get_worker_info(worker: BuildWorker) -> dict[str, Any]:
+    return {'id': worker.id, 'url': worker.url, 'capacity': worker.capacity, 'active': worker.active}
@@ -0,0 +1,390 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, Future
+from dataclasses import dataclass, asdict, field
+from functools import partial
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from multiprocessing.queues import Queue
+from typing import Optional, Any
+from urllib.parse import unquote
+from urllib.request import Request, urlopen
+
+from context_logger import get_logger
+
+from image_generator import IImageGeneratorFactory, ImageGenerator
+
+log = get_logger('BuildDaemon')
+
+
+@dataclass
+class BuildArtifact:
+    name: str
+    size: int
+    sha256: str
+
+
+@dataclass
+class BuildJob:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    id: str
+    target: str
+    priority: int = 0
+    state: str = QUEUED
+    submitted: float = 0.0
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    version: Optional[str] = None
+    image: Optional[str] = None
+    error: Optional[str] = None
+    artifacts: list[BuildArtifact] = field(default_factory=list)
+
+
+class IBuildDaemon(object):
+
+    def start(self) -> str:
+        raise NotImplementedError()
+
+    def stop(self) -> None:
+        raise NotImplementedError()
+
+    def get_url(self) -> str:
+        raise NotImplementedError()
+
+    def submit(self, target: str, priority: int = 0) -> BuildJob:
+        raise NotImplementedError()
+
+    def get_job(self, job_id: str) -> Optional[BuildJob]:
+        raise NotImplementedError()
+
+    def get_jobs(self) -> list[BuildJob]:
+        raise NotImplementedError()
+
+
+class BuildDaemon(IBuildDaemon):
+    REGISTER_INTERVAL = 30.0
+    REGISTER_RETRY_INTERVAL = 5.0
+
+    def __init__(
+        self,
+        generator_factory: IImageGeneratorFactory,
+        workers: int = 1,
+        host: str = '127.0.0.1',
+        port: int = 8180,
+        coordinator_url: Optional[str] = None,
+    ) -> None:
+        self._generator_factory = generator_factory
+        self._workers = max(1, workers)
+        self._host = host
+        self._port = port
+        self._coordinator_url = coordinator_url
+        self._stopped = threading.Event()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._threads: list[threading.Thread] = []
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._queue: queue.PriorityQueue[tuple[float, int, Optional[BuildJob]]] = queue.PriorityQueue()
+        self._slots = threading.Semaphore(self._workers)
+        self._sequence = itertools.count(1)
+        self._jobs: dict[str, BuildJob] = {}
+
+    def start(self) -> str:
+        self._executor = self._create_executor()
+
+        self._server = ThreadingHTTPServer((self._host, self._port), _BuildDaemonRequestHandler)
+        self._server.daemon_threads = True
+        setattr(self._server, 'build_daemon', self)
+
+        self._threads = [
+            threading.Thread(target=self._dispatch, name='BuildDispatcher', daemon=True),
+            threading.Thread(target=self._server.serve_forever, name='BuildDaemon', daemon=True),
+        ]
+        if self._coordinator_url:
+            self._threads.append(threading.Thread(target=self._register, name='BuildWorkerRegistration', daemon=True))
+
+        self._stopped.clear()
+        for thread in self._threads:
+            thread.start()
+
+        log.info('Build daemon started', url=self.get_url(), workers=self._workers)
+
+        return self.get_url()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+        self._queue.put((float('-inf'), 0, None))
+        self._slots.release()
+
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+        log.info('Build daemon stopped', jobs=len(self._jobs))
+
+    def get_url(self) -> str:
+        port = self._server.server_address[1] if self._server else self._port
+        return f'http://{self._host}:{port}'
+
+    def submit(self, target: str, priority: int = 0) -> BuildJob:
+        sequence = next(self._sequence)
+        job = BuildJob(str(sequence), target, priority, submitted=time.time())
+
+        with self._lock:
+            self._jobs[job.id] = job
+
+        self._queue.put((-priority, sequence, job))
+
+        log.info('Build job queued', job=job.id, target=target, priority=priority, queued=self._queue.qsize())
+
+        return job
+
+    def get_job(self, job_id: str) -> Optional[BuildJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_jobs(self) -> list[BuildJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        worker_ids: Queue[int] = multiprocessing.Queue()
+        for worker_id in range(self._workers):
+            worker_ids.put(worker_id)
+
+        executor = ProcessPoolExecutor(
+            self._workers, initializer=_initialize_worker, initargs=(self._generator_factory, worker_ids)
+        )
+
+        log.info('Preparing build workspaces', workers=self._workers)
+
+        # Every submission starts a new worker process until the pool is full, so the workspaces are ready upfront
+        futures = [executor.submit(_get_worker_id) for _ in range(self._workers)]
+
+        try:
+            for future in futures:
+                future.result()
+        except Exception as error:
+            log.error('Failed to prepare build workspaces', error=repr(error))
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+
+        return executor
+
+    def _register(self) -> None:
+        interval = 0.0
+
+        while not self._stopped.wait(interval):
+            port = self._server.server_address[1] if self._server else self._port
+            content = json.dumps({'port': port, 'capacity': self._workers}).encode()
+            request = Request(f'{self._coordinator_url}/workers', content, {'Content-Type': 'application/json'})
+
+            try:
+                with urlopen(request, timeout=self.REGISTER_RETRY_INTERVAL) as response:
+                    worker = json.loads(response.read())
+                log.debug('Registered with build coordinator', coordinator=self._coordinator_url, worker=worker)
+                interval = self.REGISTER_INTERVAL
+            except (OSError, ValueError) as error:
+                log.warning(
+                    'Failed to register with build coordinator', coordinator=self._coordinator_url, error=str(error)
+                )
+                interval = self.REGISTER_RETRY_INTERVAL
+
+    def _dispatch(self) -> None:
+        while True:
+            self._slots.acquire()
+
+            _, _, job = self._queue.get()
+
+            if not job:
+                break
+
+            with self._lock:
+                job.state = BuildJob.RUNNING
+                job.started = time.time()
+
+            log.info('Build job started', job=job.id, target=job.target)
+
+            self._submit_job(job)
+
+    def _submit_job(self, job: BuildJob) -> None:
+        try:
+            future = self._submit_to_executor(job)
+        except Exception as error:
+            future = Future()
+            future.set_exception(error)
+
+        future.add_done_callback(partial(self._complete_job, job))
+
+    def _submit_to_executor(self, job: BuildJob) -> 'Future[tuple[str, str, list[BuildArtifact]]]':
+        try:
+            return self._get_executor().submit(_generate_target, job.target)
+        except RuntimeError as error:
+            # The pool is broken when a worker process died, the workspaces are prepared again in a new pool
+            log.warning('Build worker pool is not usable, recreating it', job=job.id, error=repr(error))
+
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+        return self._get_executor().submit(_generate_target, job.target)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if not self._executor:
+            self._executor = self._create_executor()
+
+        return self._executor
+
+    def _complete_job(self, job: BuildJob, future: 'Future[tuple[str, str, list[BuildArtifact]]]') -> None:
+        artifacts: list[BuildArtifact] = []
+
+        try:
+            version, image, artifacts = future.result()
+            state, error = BuildJob.SUCCEEDED, None
+        except Exception as exception:
+            version, image = None, None
+            state, error = BuildJob.FAILED, repr(exception)
+
+        with self._lock:
+            job.state, job.version, job.image, job.error, job.artifacts = state, version, image, error, artifacts
+            job.finished = time.time()
+
+        self._slots.release()
+
+        if error:
+            log.error('Build job failed', job=job.id, target=job.target, error=error)
+        else:
+            log.info('Build job completed', job=job.id, target=job.target, image=image)
+
+
+class _BuildDaemonRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    ARTIFACT_PATH = re.compile(r'^/jobs/(?P<job>[^/]+)/artifacts/(?P<name>[^/]+)$')
+
+    @property
+    def build_daemon(self) -> BuildDaemon:
+        return getattr(self.server, 'build_daemon')  # type: ignore
+
+    def do_GET(self) -> None:
+        if self.path == '/jobs':
+            self._send_json(200, [asdict(job) for job in self.build_daemon.get_jobs()])
+        elif self.path.startswith('/jobs/') and (job := self.build_daemon.get_job(self.path.removeprefix('/jobs/'))):
+            self._send_json(200, asdict(job))
+        elif (match := self.ARTIFACT_PATH.match(unquote(self.path))) and (
+            job := self.build_daemon.get_job(match['job'])
+        ):
+            self._send_artifact(job, match['name'])
+        else:
+            self._send_json(404, {'error': 'Not found'})
+
+    def do_POST(self) -> None:
+        if self.path != '/jobs':
+            self._send_json(404, {'error': 'Not found'})
+            return
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            target, priority = str(request['target']), int(request.get('priority', 0))
+        except (ValueError, TypeError, KeyError) as error:
+            self._send_json(400, {'error': f'Invalid job request: {error!r}'})
+            return
+
+        self._send_json(202, asdict(self.build_daemon.submit(target, priority)))
+
+    def log_message(self, format: str, *args: Any) -> None:
+        log.debug('Build daemon request', request=format % args)
+
+    def _send_artifact(self, job: BuildJob, name: str) -> None:
+        artifact = next((artifact for artifact in job.artifacts if artifact.name == name), None)
+
+        if not artifact or not job.image:
+            self._send_json(404, {'error': 'Not found'})
+            return
+
+        with open(f'{os.path.dirname(job.image)}/{artifact.name}', 'rb') as artifact_file:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(artifact.size))
+            self.end_headers()
+            self.connection.sendfile(artifact_file)
+
+    def _send_json(self, status: int, content: Any) -> None:
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_image_generator: Optional[ImageGenerator] = None
+_worker_id = 0
+
+
+def _initialize_worker(generator_factory: IImageGeneratorFactory, worker_ids: 'Queue[int]') -> None:
+    global _image_generator, _worker_id
+    _worker_id = worker_ids.get()
+    _image_generator = generator_factory.create(_worker_id)
+
+
+def _get_worker_id() -> int:
+    return _worker_id
+
+
+def _generate_target(target: str) -> tuple[str, str, list[BuildArtifact]]:
+    if not _image_generator:
+        raise RuntimeError('Build worker is not initialized')
+
+    config = _image_generator.generate(target)
+    image_properties = _image_generator.get_image_properties(config)
+
+    return config.version, image_properties.path, _get_artifacts(image_properties.directory)
+
+
+def _get_artifacts(directory: str) -> list[BuildArtifact]:
+    if not os.path.isdir(directory):
+        return []
+
+    file_names = sorted(entry.name for entry in os.scandir(directory) if entry.is_file())
+    checksums = {}
+
+    # The image checksum is exported while the image is moved, the image does not need to be read again
+    for file_name in [file_name for file_name in file_names if file_name.endswith('.sha256')]:
+        with open(f'{directory}/{file_name}', 'r') as checksum_file:
+            for line in checksum_file.read().splitlines():
+                if len(parts := line.split(maxsplit=1)) == 2:
+                    checksums[parts[1]] = parts[0]
+
+    artifacts = []
+
+    for file_name in file_names:
+        if not (sha256 := checksums.get(file_name)):
+            with open(f'{directory}/{file_name}', 'rb') as artifact_file:
+                sha256 = hashlib.file_digest(artifact_file, 'sha256').hexdigest()
+
+        artifacts.append(BuildArtifact(file_name, os.path.getsize(f'{directory}/{file_name}'), sha256))
+
+    return artifacts
@@ -2,12 +2,18 @@
 # SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
 # SPDX-License-Identifier: MIT
 
+from typing import Optional
+
 from context_logger import get_logger
-from git import Repo
-from package_downloader import PackageConfig
-from package_installer import IAptInstaller
+from git import Repo, GitCommandError
 
-from image_generator import TargetConfig, IBuildConfigurator, BuildConfiguration
+from image_generator import (
+    TargetConfig,
+    IBuildConfigurator,
+    BuildConfiguration,
+    IDependencyInstaller,
+    IRepositoryManager,
+)
 
 log = get_logger('BuildInitializer')
 
@@ -26,10 +32,17 @@ class IBuildInitializer(object):
 
 class BuildInitializer(IBuildInitializer):
 
-    def __init__(self, repository: Repo, apt_installer: IAptInstaller, configurator: IBuildConfigurator) -> None:
+    def __init__(
+        self,
+        repository: Repo,
+        dependency_installer: IDependencyInstaller,
+        configurator: IBuildConfigurator,
+        repository_manager: Optional[IRepositoryManager] = None,
+    ) -> None:
         self._repository = repository
-        self._apt_installer = apt_installer
+        self._dependency_installer = dependency_installer
         self._configurator = configurator
+        self._repository_manager = repository_manager
 
     def initialize(self, config: TargetConfig) -> None:
         self._checkout_target_ref(config)
@@ -45,30 +58,19 @@ class BuildInitializer(IBuildInitializer):
         return self._configurator.get_configuration()
 
     def _checkout_target_ref(self, config: TargetConfig) -> None:
-        if config.reference not in self._repository.git.show_ref():
+        if self._repository_manager:
+            # A reused workspace still holds the sub-stage, boot file changes and stage cache markers of the last build
+            self._repository_manager.reset_worktree(self._repository)
+            self._repository_manager.fetch_reference(config.reference)
+
+        try:
+            commit = self._repository.git.rev_parse('--verify', '--quiet', f'{config.reference}^{{commit}}')
+        except GitCommandError:
             log.error('Reference not exists in repository', reference=config.reference)
             raise AttributeError('Invalid reference')
 
-        log.info('Checking out reference', reference=config.reference)
-        self._repository.git.checkout(config.reference)
+        log.info('Checking out reference', reference=config.reference, commit=commit)
+        self._repository.git.checkout('--detach', commit)
 
     def _install_build_dependencies(self) -> None:
-        dependency_list = f'{self._repository.working_tree_dir}/depends'
-
-        with open(dependency_list, 'r') as file:
-            dependencies = file.readlines()
-            dependencies.append('binfmt-support')
-
-            for dependency in dependencies:
-                if ':' in dependency:
-                    dependency = dependency.split(':')[1]
-
-                config = PackageConfig(package=dependency.strip())
-
-                log.info('Installing build dependency', dependency=config.package)
-
-                if self._apt_installer.install(config):
-                    log.info('Dependency installed', dependency=config.package)
-                else:
-                    log.error('Failed to install dependency', dependency=config.package)
-                    raise RuntimeError('Dependency not installed')
+        self._dependency_installer.install(f'{self._repository.working_tree_dir}/depends')
@@ -0,0 +1,77 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import gzip
+import os
+from typing import Optional, BinaryIO
+
+from context_logger import get_logger
+
+log = get_logger('BuildLog')
+
+
+class IBuildLog(object):
+
+    def open(self) -> None:
+        raise NotImplementedError()
+
+    def write(self, data: bytes) -> None:
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        raise NotImplementedError()
+
+
+class BuildLog(IBuildLog):
+
+    def __init__(
+        self, path: str, max_size: int = 256 * 1024 * 1024, backup_count: int = 5, compress_level: int = 1
+    ) -> None:
+        self._path = path
+        self._max_size = max_size
+        self._backup_count = backup_count
+        self._compress_level = compress_level
+        self._file: Optional[BinaryIO] = None
+        self._size = 0
+
+    def open(self) -> None:
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+
+        if os.path.exists(self._path):
+            self._rotate()
+
+        log.info('Writing raw build log', file=self._path)
+
+        self._open_file()
+
+    def write(self, data: bytes) -> None:
+        if not self._file:
+            return
+
+        if self._size + len(data) > self._max_size:
+            self._file.close()
+            self._rotate()
+            self._open_file()
+
+        self._file.write(data)
+        self._size += len(data)
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _open_file(self) -> None:
+        self._file = gzip.open(self._path, 'wb', self._compress_level)  # type: ignore
+        self._size = 0
+
+    def _rotate(self) -> None:
+        for index in range(self._backup_count - 1, 0, -1):
+            if os.path.exists(f'{self._path}.{index}'):
+                os.replace(f'{self._path}.{index}', f'{self._path}.{index + 1}')
+
+        if self._backup_count > 0:
+            os.replace(self._path, f'{self._path}.1')
+        else:
+            os.unlink(self._path)
@@ -0,0 +1,127 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import json
+import os
+import re
+from importlib.metadata import version, PackageNotFoundError
+from typing import Optional
+
+from context_logger import get_logger
+from git import Repo, GitCommandError
+
+from image_generator import TargetConfig, IBuildConfigurator, BuildConfiguration, contentHasher
+
+log = get_logger('BuildManifest')
+
+
+class IBuildManifest(object):
+
+    def create(self, config: TargetConfig) -> Optional[dict[str, str]]:
+        raise NotImplementedError()
+
+    def load(self, manifest_path: str) -> Optional[dict[str, str]]:
+        raise NotImplementedError()
+
+    def save(self, manifest: dict[str, str], manifest_path: str) -> None:
+        raise NotImplementedError()
+
+
+class BuildManifest(IBuildManifest):
+    # pi-gen config variables that do not affect the generated image
+    IGNORED_CONFIG_VARIABLES = ['CLEAN', 'APT_PROXY']
+
+    def __init__(
+        self,
+        repository: Repo,
+        configurator: IBuildConfigurator,
+        resource_root: str,
+        resource_dirs: Optional[list[str]] = None,
+        package_name: str = 'raspbian-image-generator',
+    ) -> None:
+        self._repository = repository
+        self._configurator = configurator
+        self._resource_root = resource_root
+        self._resource_dirs = resource_dirs if resource_dirs else ['scripts', 'template']
+        self._package_name = package_name
+
+    def create(self, config: TargetConfig) -> Optional[dict[str, str]]:
+        if not (commit := self._get_commit(config.reference)):
+            return None
+
+        configuration = self._configurator.get_configuration()
+
+        manifest = {
+            'tool_version': self._get_tool_version(),
+            'tool': self._hash_directories([os.path.dirname(__file__)], '.py'),
+            'commit': commit,
+            'compression': f'{configuration.compression}:{configuration.compression_level}',
+            'outputs': self._get_optional_outputs(configuration),
+            'config': self._hash_text(self._get_relevant_config(self._configurator.get_build_config(config))),
+            'target': self._hash_text(config.model_dump_json(exclude_none=True)),
+            'resources': self._hash_directories([f'{self._resource_root}/{path}' for path in self._resource_dirs]),
+        }
+
+        manifest['digest'] = self._hash_text(json.dumps(manifest, sort_keys=True))
+
+        return manifest
+
+    def load(self, manifest_path: str) -> Optional[dict[str, str]]:
+        try:
+            with open(manifest_path, 'r') as manifest_file:
+                return dict(json.load(manifest_file))
+        except (OSError, ValueError) as error:
+            log.debug('Build manifest not loaded', file=manifest_path, reason=str(error))
+            return None
+
+    def save(self, manifest: dict[str, str], manifest_path: str) -> None:
+        log.info('Saving build manifest', file=manifest_path, digest=manifest['digest'])
+
+        with open(manifest_path, 'w') as manifest_file:
+            manifest_file.write(f'{json.dumps(manifest, indent=2)}\n')
+
+    def _get_commit(self, reference: str) -> Optional[str]:
+        try:
+            return str(self._repository.git.rev_parse('--verify', f'{reference}^{{commit}}'))
+        except GitCommandError:
+            log.warning('Failed to resolve reference for build manifest', reference=reference)
+            return None
+
+    def _get_tool_version(self) -> str:
+        try:
+            return version(self._package_name)
+        except PackageNotFoundError:
+            return 'unknown'
+
+    def _get_optional_outputs(self, configuration: BuildConfiguration) -> str:
+        outputs = {
+            'blake3': configuration.blake3_checksum,
+            'trim': configuration.trim_image,
+            'bmap': configuration.block_map,
+            'analysis': configuration.analyze_image,
+        }
+        return ','.join(output for output, enabled in outputs.items() if enabled)
+
+    def _get_relevant_config(self, build_config: str) -> str:
+        pattern = re.compile(rf'^({"|".join(self.IGNORED_CONFIG_VARIABLES)})=')
+        return '\n'.join(line for line in build_config.splitlines() if not pattern.match(line))
+
+    def _hash_text(self, text: str) -> str:
+        hasher = contentHasher.create_hasher()
+        contentHasher.update_with_text(hasher, text)
+        return str(hasher.hexdigest())
+
+    def _hash_directories(self, directories: list[str], extension: str = '') -> str:
+        hasher = contentHasher.create_hasher()
+
+        for directory in directories:
+            for root, dirs, files in os.walk(directory):
+                dirs[:] = sorted(name for name in dirs if name != '__pycache__')
+
+                for name in sorted(name for name in files if name.endswith(extension)):
+                    path = os.path.join(root, name)
+                    contentHasher.update_with_text(hasher, os.path.relpath(path, directory))
+                    contentHasher.update_with_file(hasher, path)
+
+        return str(hasher.hexdigest())
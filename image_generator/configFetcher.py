@@ -0,0 +1,130 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import hashlib
+import json
+import os
+import shutil
+from typing import Optional, Any
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+from urllib.request import build_opener, Request
+
+from context_logger import get_logger
+
+log = get_logger('ConfigFetcher')
+
+
+class IConfigFetcher(object):
+
+    def fetch(self, location: str, sha256: Optional[str] = None) -> str:
+        raise NotImplementedError()
+
+
+class ConfigFetcher(IConfigFetcher):
+    REMOTE_SCHEMES = ['http', 'https']
+    BUFFER_SIZE = 256 * 1024
+
+    def __init__(self, download_dir: str, timeout: float = 30) -> None:
+        self._download_dir = download_dir
+        self._timeout = timeout
+        self._opener = build_opener()
+
+    def fetch(self, location: str, sha256: Optional[str] = None) -> str:
+        if urlsplit(location).scheme not in self.REMOTE_SCHEMES:
+            path = os.path.abspath(location)
+        else:
+            path = self._fetch_remote(location)
+
+        if sha256:
+            self._verify(path, sha256)
+
+        return path
+
+    def open_url(self, url: str, headers: dict[str, str]) -> Any:
+        return self._opener.open(Request(url, headers=headers), timeout=self._timeout)
+
+    def _fetch_remote(self, url: str) -> str:
+        path = self._get_cache_path(url)
+        metadata = self._load_metadata(path) if os.path.exists(path) else {}
+
+        try:
+            response = self.open_url(url, self._get_conditional_headers(metadata))
+        except HTTPError as error:
+            if error.code == 304:
+                log.info('Cached target config is up to date', url=url, file=path)
+                return path
+            if error.code < 500:
+                log.error('Failed to download target config', url=url, status=error.code)
+                raise
+            return self._use_cached(url, path, error)
+        except (URLError, OSError) as error:
+            return self._use_cached(url, path, error)
+
+        os.makedirs(self._download_dir, exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+
+        try:
+            with response, open(temp_path, 'wb') as temp_file:
+                shutil.copyfileobj(response, temp_file, self.BUFFER_SIZE)
+                headers = response.headers
+
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+        self._save_metadata(path, url, headers.get('ETag'), headers.get('Last-Modified'))
+
+        log.info('Target config downloaded', url=url, file=path)
+
+        return path
+
+    def _use_cached(self, url: str, path: str, error: Exception) -> str:
+        if not os.path.exists(path):
+            log.error('Failed to download target config', url=url, error=str(error))
+            raise error
+
+        log.warning('Failed to download target config, using cached copy', url=url, file=path, error=str(error))
+
+        return path
+
+    def _verify(self, path: str, sha256: str) -> None:
+        hasher = hashlib.sha256()
+
+        with open(path, 'rb') as file:
+            while chunk := file.read(self.BUFFER_SIZE):
+                hasher.update(chunk)
+
+        if hasher.hexdigest() != sha256.lower():
+            log.error('Target config checksum mismatch', file=path, expected=sha256, actual=hasher.hexdigest())
+            raise ValueError('Target config checksum mismatch')
+
+    def _get_cache_path(self, url: str) -> str:
+        key = hashlib.sha256(url.encode()).hexdigest()[:16]
+        name = os.path.basename(urlsplit(url).path) or 'target-config.json'
+        return f'{self._download_dir}/{key}-{name}'
+
+    def _get_conditional_headers(self, metadata: dict[str, str]) -> dict[str, str]:
+        headers = {}
+
+        if etag := metadata.get('etag'):
+            headers['If-None-Match'] = etag
+        if last_modified := metadata.get('last_modified'):
+            headers['If-Modified-Since'] = last_modified
+
+        return headers
+
+    def _load_metadata(self, path: str) -> dict[str, str]:
+        try:
+            with open(f'{path}.meta.json', 'r') as metadata_file:
+                return dict(json.load(metadata_file))
+        except (OSError, ValueError):
+            return {}
+
+    def _save_metadata(self, path: str, url: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+        metadata = {'url': url, 'etag': etag, 'last_modified': last_modified}
+
+        with open(f'{path}.meta.json', 'w') as metadata_file:
+            metadata_file.write(f'{json.dumps(metadata, indent=2)}\n')
@@ -0,0 +1,40 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import hashlib
+import os
+from typing import Any
+
+BUFFER_SIZE = 1024 * 1024
+
+
+def create_hasher() -> Any:
+    return hashlib.sha256()
+
+
+def update_with_text(hasher: Any, text: str) -> None:
+    hasher.update(text.encode())
+    hasher.update(b'\0')
+
+
+def update_with_file(hasher: Any, file_path: str) -> None:
+    with open(file_path, 'rb') as file:
+        while chunk := file.read(BUFFER_SIZE):
+            hasher.update(chunk)
+    hasher.update(b'\0')
+
+
+def update_with_directory(hasher: Any, directory: str) -> None:
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            relative_path = os.path.relpath(path, directory)
+
+            if os.path.islink(path):
+                update_with_text(hasher, f'{relative_path} -> {os.readlink(path)}')
+            else:
+                update_with_text(hasher, f'{relative_path} {os.stat(path).st_mode & 0o777:o}')
+                update_with_file(hasher, path)
@@ -0,0 +1,115 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import fcntl
+import hashlib
+import os
+from contextlib import contextmanager
+from typing import Any, Callable, Optional, Iterator
+
+from apt import Cache
+from context_logger import get_logger
+
+log = get_logger('DependencyInstaller')
+
+
+class IDependencyInstaller(object):
+
+    def install(self, dependency_list: str) -> None:
+        raise NotImplementedError()
+
+
+class DependencyInstaller(IDependencyInstaller):
+    EXTRA_DEPENDENCIES = ['binfmt-support']
+
+    def __init__(
+        self, state_file: str, cache_factory: Callable[[], Any] = Cache, dpkg_status: str = '/var/lib/dpkg/status'
+    ) -> None:
+        self._state_file = state_file
+        self._cache_factory = cache_factory
+        self._dpkg_status = dpkg_status
+
+    def install(self, dependency_list: str) -> None:
+        dependencies = self._read_dependencies(dependency_list)
+
+        # Parallel workers share the state file, only one of them runs the apt transaction
+        with self._lock():
+            if self._get_state(dependencies) == self._load_state():
+                log.info('Build dependencies are up to date, skipping installation', dependencies=len(dependencies))
+                return
+
+            self._install(dependencies)
+
+            self._save_state(self._get_state(dependencies))
+
+    def _read_dependencies(self, dependency_list: str) -> list[str]:
+        with open(dependency_list, 'r') as file:
+            lines = file.read().splitlines() + self.EXTRA_DEPENDENCIES
+
+        dependencies = [line.split(':')[-1].strip() for line in lines]
+
+        return sorted(set(dependency for dependency in dependencies if dependency))
+
+    def _install(self, dependencies: list[str]) -> None:
+        cache = self._cache_factory()
+
+        if missing := [dependency for dependency in dependencies if dependency not in cache]:
+            log.error('Build dependencies not found', dependencies=missing)
+            raise RuntimeError('Dependency not installed')
+
+        if not (packages := [dependency for dependency in dependencies if not cache[dependency].is_installed]):
+            log.info('Build dependencies already installed', dependencies=len(dependencies))
+            return
+
+        log.info('Installing build dependencies', dependencies=packages)
+
+        try:
+            for package in packages:
+                cache[package].mark_install()
+            cache.commit()
+            cache.open()
+        except (SystemError, OSError) as error:
+            log.error('Failed to install build dependencies', dependencies=packages, error=str(error))
+            raise RuntimeError('Dependency not installed') from error
+
+        if failed := [package for package in packages if not cache[package].is_installed]:
+            log.error('Failed to install build dependencies', dependencies=failed)
+            raise RuntimeError('Dependency not installed')
+
+        log.info('Build dependencies installed', dependencies=packages)
+
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        os.makedirs(os.path.dirname(os.path.abspath(self._state_file)), exist_ok=True)
+
+        with open(f'{self._state_file}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _get_state(self, dependencies: list[str]) -> str:
+        try:
+            status = os.stat(self._dpkg_status)
+            installed_state = f'{status.st_mtime_ns}:{status.st_size}'
+        except FileNotFoundError:
+            installed_state = ''
+
+        return hashlib.sha256('\n'.join(dependencies + [installed_state]).encode()).hexdigest()
+
+    def _load_state(self) -> Optional[str]:
+        try:
+            with open(self._state_file, 'r') as state_file:
+                return state_file.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _save_state(self, state: str) -> None:
+        temp_path = f'{self._state_file}.{os.getpid()}.tmp'
+
+        with open(temp_path, 'w') as state_file:
+            state_file.write(f'{state}\n')
+
+        os.replace(temp_path, self._state_file)
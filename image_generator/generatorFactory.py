@@ -0,0 +1,162 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import os
+from typing import Optional, Any
+
+from context_logger import get_logger
+
+from image_generator import (
+    BuildConfiguration,
+    BuildConfigurator,
+    ImageBuilder,
+    AsyncImageBuilder,
+    BuildInitializer,
+    BuildManifest,
+    ImageGenerator,
+    StageCache,
+    InstallerWheelhouse,
+    StageProfiler,
+    BuildLog,
+    DependencyInstaller,
+    RepositoryManager,
+    TargetConfigLoader,
+    AsyncImageGenerator,
+    IPhaseHook,
+    ProfilerHook,
+    OpenMetricsExporter,
+)
+
+log = get_logger('ImageGeneratorFactory')
+
+
+class IImageGeneratorFactory(object):
+
+    def create(self, worker_id: int = 0) -> ImageGenerator:
+        raise NotImplementedError()
+
+    def create_async(self, worker_id: int = 0) -> AsyncImageGenerator:
+        raise NotImplementedError()
+
+
+class ImageGeneratorFactory(IImageGeneratorFactory):
+
+    def __init__(
+        self,
+        resource_root: str,
+        repository_path: str,
+        repository_url: str,
+        config_path: str,
+        configuration: BuildConfiguration,
+        output_dir: str,
+        stage_cache_dir: Optional[str] = None,
+        snapshot_format: str = 'tar',
+        wheelhouse_dir: Optional[str] = None,
+        force_build: bool = False,
+        chrome_trace: bool = False,
+        build_log_dir: Optional[str] = None,
+        build_log_level: str = 'all',
+        repository_depth: Optional[int] = None,
+        profiler: Optional[str] = None,
+        profile_dir: Optional[str] = None,
+        metrics_file: Optional[str] = None,
+    ) -> None:
+        self._resource_root = resource_root
+        self._repository_path = repository_path
+        self._repository_url = repository_url
+        self._config_path = config_path
+        self._configuration = configuration
+        self._output_dir = output_dir
+        self._stage_cache_dir = stage_cache_dir
+        self._snapshot_format = snapshot_format
+        self._wheelhouse_dir = wheelhouse_dir
+        self._force_build = force_build
+        self._chrome_trace = chrome_trace
+        self._build_log_dir = build_log_dir
+        self._build_log_level = build_log_level
+        self._profiler = profiler
+        self._profile_dir = profile_dir
+        self._metrics_file = metrics_file
+        self._repository_manager = RepositoryManager(repository_url, f'{repository_path}.git', repository_depth)
+
+    def create(self, worker_id: int = 0) -> ImageGenerator:
+        stage_profiler = StageProfiler(chrome_trace=self._chrome_trace)
+        image_builder = self._create_image_builder(ImageBuilder, worker_id, stage_profiler)
+
+        return self._create_generator(worker_id, image_builder, stage_profiler)
+
+    def create_async(self, worker_id: int = 0) -> AsyncImageGenerator:
+        stage_profiler = StageProfiler(chrome_trace=self._chrome_trace)
+        image_builder = self._create_image_builder(AsyncImageBuilder, worker_id, stage_profiler)
+
+        return AsyncImageGenerator(self._create_generator(worker_id, image_builder, stage_profiler), image_builder)
+
+    def _create_image_builder(
+        self, builder_type: type[ImageBuilder], worker_id: int, stage_profiler: StageProfiler
+    ) -> Any:
+        return builder_type(
+            self.get_worker_path(self._repository_path, worker_id),
+            stage_profiler,
+            self._create_build_log(worker_id),
+            self._build_log_level,
+            self._get_failure_report_path(worker_id),
+        )
+
+    def _create_generator(
+        self, worker_id: int, image_builder: ImageBuilder, stage_profiler: StageProfiler
+    ) -> ImageGenerator:
+        repository_location = self.get_worker_path(self._repository_path, worker_id)
+        repository = self._repository_manager.create_worktree(repository_location)
+
+        dependency_installer = DependencyInstaller(f'{self._resource_root}/build/depends.state')
+        stage_cache = self._create_stage_cache()
+        wheelhouse = InstallerWheelhouse(self._wheelhouse_dir, self._resource_root) if self._wheelhouse_dir else None
+        configurator = BuildConfigurator(
+            self._resource_root, repository_location, self._configuration, stage_cache, wheelhouse
+        )
+        build_initializer = BuildInitializer(repository, dependency_installer, configurator, self._repository_manager)
+        build_manifest = BuildManifest(repository, configurator, self._resource_root)
+
+        return ImageGenerator(
+            self._config_path,
+            TargetConfigLoader(),
+            build_initializer,
+            image_builder,
+            self._output_dir,
+            build_manifest=build_manifest,
+            force_build=self._force_build,
+            stage_profiler=stage_profiler,
+            phase_hooks=self._create_phase_hooks(worker_id),
+        )
+
+    @staticmethod
+    def get_worker_path(path: str, worker_id: int) -> str:
+        return path if worker_id == 0 else f'{path}-{worker_id}'
+
+    def _create_stage_cache(self) -> Optional[StageCache]:
+        if self._stage_cache_dir:
+            return StageCache(self._stage_cache_dir, self._resource_root, self._snapshot_format)
+        return None
+
+    def _create_phase_hooks(self, worker_id: int) -> list[IPhaseHook]:
+        hooks: list[IPhaseHook] = []
+
+        if self._profiler:
+            hooks.append(ProfilerHook(self._profile_dir if self._profile_dir else 'profile', self._profiler))
+
+        if self._metrics_file:
+            root, extension = os.path.splitext(self._metrics_file)
+            hooks.append(OpenMetricsExporter(self.get_worker_path(root, worker_id) + extension))
+
+        return hooks
+
+    def _create_build_log(self, worker_id: int) -> Optional[BuildLog]:
+        if self._build_log_dir:
+            return BuildLog(self.get_worker_path(f'{self._build_log_dir}/pi-gen', worker_id) + '.log.gz')
+        return None
+
+    def _get_failure_report_path(self, worker_id: int) -> Optional[str]:
+        if self._build_log_dir:
+            return self.get_worker_path(f'{self._build_log_dir}/pi-gen', worker_id) + '.failure.log'
+        return None
@@ -0,0 +1,208 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import glob
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from subprocess import CalledProcessError
+from typing import Optional, Any
+
+from context_logger import get_logger
+
+log = get_logger('ImageAnalyzer')
+
+
+class IImageAnalyzer(object):
+
+    def analyze(self, image_path: str, report_path: str, previous_report_path: Optional[str] = None) -> dict[str, Any]:
+        raise NotImplementedError()
+
+
+class ImageAnalyzer(IImageAnalyzer):
+    DPKG_STATUS = 'var/lib/dpkg/status'
+    REPORTED_CHANGES = 5
+
+    def __init__(self, directory_depth: int = 2, mount_dir: Optional[str] = None) -> None:
+        self._directory_depth = directory_depth
+        self._mount_dir = mount_dir
+
+    def analyze(self, image_path: str, report_path: str, previous_report_path: Optional[str] = None) -> dict[str, Any]:
+        log.info('Analyzing image', image=image_path)
+
+        report: dict[str, Any] = {
+            'image': os.path.basename(image_path),
+            'size': os.path.getsize(image_path),
+            'allocated_size': os.stat(image_path).st_blocks * 512,
+            'partitions': [],
+            'packages': {},
+        }
+
+        mount_dir = self._mount_dir if self._mount_dir else tempfile.mkdtemp(prefix='image-analyzer-')
+
+        try:
+            loop_device = self._run(['losetup', '--find', '--show', '--read-only', '--partscan', image_path])
+
+            try:
+                for partition in sorted(glob.glob(f'{loop_device}p*')):
+                    self._analyze_partition(partition, loop_device, mount_dir, report)
+            finally:
+                self._run(['losetup', '--detach', loop_device])
+        except (CalledProcessError, OSError) as error:
+            log.error('Failed to analyze image', image=image_path, error=str(error))
+            raise
+        finally:
+            if not self._mount_dir:
+                shutil.rmtree(mount_dir, ignore_errors=True)
+
+        if previous_report_path and (previous_report := self._load_report(previous_report_path)):
+            report['changes'] = self._get_changes(previous_report, report)
+
+        with open(report_path, 'w') as report_file:
+            report_file.write(f'{json.dumps(report, indent=2)}\n')
+
+        self._log_summary(image_path, report_path, report)
+
+        return report
+
+    def _analyze_partition(self, partition: str, loop_device: str, mount_dir: str, report: dict[str, Any]) -> None:
+        if not (file_system := self._run(['blkid', '--output', 'value', '--match-tag', 'TYPE', partition], False)):
+            return
+
+        name = partition.removeprefix(loop_device)
+        mount_point = f'{mount_dir}/{name}'
+        os.makedirs(mount_point, exist_ok=True)
+
+        self._run(['mount', '-o', 'ro', partition, mount_point])
+
+        try:
+            status = os.statvfs(mount_point)
+
+            report['partitions'].append(
+                {
+                    'name': name,
+                    'type': file_system,
+                    'size': status.f_blocks * status.f_frsize,
+                    'used': (status.f_blocks - status.f_bfree) * status.f_frsize,
+                    'directories': self._get_directory_sizes(mount_point),
+                }
+            )
+
+            if os.path.isfile(dpkg_status := f'{mount_point}/{self.DPKG_STATUS}'):
+                report['packages'] = self._get_package_sizes(dpkg_status)
+        finally:
+            self._run(['umount', mount_point])
+
+    def _get_directory_sizes(self, root: str) -> dict[str, int]:
+        sizes: dict[str, int] = {}
+        inodes: set[int] = set()
+
+        for dir_path, _, file_names in os.walk(root):
+            relative_path = os.path.relpath(dir_path, root)
+            parts = [] if relative_path == '.' else relative_path.split(os.sep)
+            total = 0
+
+            for file_name in file_names:
+                try:
+                    status = os.lstat(f'{dir_path}/{file_name}')
+                except OSError:
+                    continue
+
+                if status.st_nlink > 1:
+                    if status.st_ino in inodes:
+                        continue
+                    inodes.add(status.st_ino)
+
+                total += status.st_blocks * 512
+
+            for depth in range(min(len(parts), self._directory_depth) + 1):
+                path = '/' + '/'.join(parts[:depth])
+                sizes[path] = sizes.get(path, 0) + total
+
+        return dict(sorted(sizes.items()))
+
+    def _get_package_sizes(self, dpkg_status: str) -> dict[str, int]:
+        packages = {}
+
+        with open(dpkg_status, 'r', errors='replace') as status_file:
+            for paragraph in status_file.read().split('\n\n'):
+                fields = dict(line.split(': ', 1) for line in paragraph.splitlines() if ': ' in line[:80])
+
+                if 'Package' in fields and fields.get('Status', '').endswith(' installed'):
+                    packages[fields['Package']] = int(fields.get('Installed-Size', '0') or 0) * 1024
+
+        return dict(sorted(packages.items()))
+
+    def _get_changes(self, previous: dict[str, Any], current: dict[str, Any]) -> dict[str, Any]:
+        previous_partitions = {partition['name']: partition for partition in previous.get('partitions', [])}
+        partitions = {}
+
+        for partition in current['partitions']:
+            previous_partition = previous_partitions.get(partition['name'], {})
+            partitions[partition['name']] = {
+                'used': partition['used'] - previous_partition.get('used', 0),
+                'directories': self._get_size_changes(
+                    previous_partition.get('directories', {}), partition['directories']
+                ),
+            }
+
+        previous_packages, packages = previous.get('packages', {}), current['packages']
+
+        return {
+            'previous': previous.get('image'),
+            'size': current['size'] - previous.get('size', 0),
+            'allocated_size': current['allocated_size'] - previous.get('allocated_size', 0),
+            'partitions': partitions,
+            'packages': {
+                'added': {name: size for name, size in packages.items() if name not in previous_packages},
+                'removed': {name: size for name, size in previous_packages.items() if name not in packages},
+                'changed': {
+                    name: size - previous_packages[name]
+                    for name, size in packages.items()
+                    if name in previous_packages and size != previous_packages[name]
+                },
+            },
+        }
+
+    def _get_size_changes(self, previous: dict[str, int], current: dict[str, int]) -> dict[str, int]:
+        changes = {path: current.get(path, 0) - previous.get(path, 0) for path in sorted(set(previous) | set(current))}
+        return {path: change for path, change in changes.items() if change}
+
+    def _load_report(self, report_path: str) -> Optional[dict[str, Any]]:
+        try:
+            with open(report_path, 'r') as report_file:
+                return dict(json.load(report_file))
+        except (OSError, ValueError) as error:
+            log.warning('Failed to load previous image analysis', file=report_path, error=str(error))
+            return None
+
+    def _log_summary(self, image_path: str, report_path: str, report: dict[str, Any]) -> None:
+        largest = sorted(report['packages'].items(), key=lambda item: item[1], reverse=True)[: self.REPORTED_CHANGES]
+
+        log.info(
+            'Image analyzed',
+            image=image_path,
+            report=report_path,
+            used={partition['name']: partition['used'] for partition in report['partitions']},
+            packages=len(report['packages']),
+            largest_packages=dict(largest),
+        )
+
+        if changes := report.get('changes'):
+            package_changes = {**changes['packages']['added'], **changes['packages']['changed']}
+            growth = sorted(package_changes.items(), key=lambda item: item[1], reverse=True)[: self.REPORTED_CHANGES]
+
+            log.info(
+                'Image size changed since previous version',
+                previous=changes['previous'],
+                size=changes['size'],
+                allocated_size=changes['allocated_size'],
+                largest_package_growth=dict(growth),
+            )
+
+    def _run(self, command: list[str], check: bool = True) -> str:
+        log.debug('Executing command', command=command)
+        return subprocess.run(command, check=check, capture_output=True, text=True).stdout.strip()
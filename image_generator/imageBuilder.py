@@ -4,17 +4,19 @@
 
 import os
 import re
+import selectors
+import sys
 import time
 from collections import deque
-from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from functools import partial
 from logging import DEBUG, WARNING
 from subprocess import PIPE, Popen, CalledProcessError
 from typing import Optional
 
 from context_logger import get_logger
 
+from image_generator import IStageProfiler, IBuildLog
+
 log = get_logger('ImageBuilder')
 
 
@@ -25,46 +27,98 @@ class IImageBuilder(object):
 
 
 class ImageBuilder(IImageBuilder):
-
-    def __init__(self, repository_path: str) -> None:
+    LOG_LEVELS = ['stage', 'warning', 'all']
+    CHUNK_SIZE = 64 * 1024
+    STAGE_PATTERN = re.compile(rb'^\[[^]]*] (Begin|End) (.*/pi-gen.*)$')
+    PACKAGE_INSTALLER_MARKER = b'package-installer\x1b'
+    ROOT_STAGE = 'build'
+    STARTUP_STAGE = 'startup'
+
+    def __init__(
+        self,
+        repository_path: str,
+        stage_profiler: Optional[IStageProfiler] = None,
+        build_log: Optional[IBuildLog] = None,
+        log_level: str = 'all',
+        failure_report: Optional[str] = None,
+        report_lines: int = 50,
+    ) -> None:
         self._repository_path = repository_path
+        self._stage_profiler = stage_profiler
+        self._build_log = build_log
+        self._log_level = log_level
+        self._failure_report = failure_report
+        self._report_lines = report_lines
         self._stage_stack: list[str] = []
+        self._stage_output: list[deque[bytes]] = [deque(maxlen=report_lines)]
+
+        if log_level not in self.LOG_LEVELS:
+            log.error('Invalid build log level', log_level=log_level, log_levels=self.LOG_LEVELS)
+            raise ValueError('Invalid build log level')
 
     def build(self, command: str = './build.sh') -> datetime:
+        start_time = self._start_build(command)
+
+        os.chdir(self._repository_path)
+
+        return_code = self._run_command(command)
+
+        self._complete_build(command, return_code)
+
+        return start_time
+
+    def _start_build(self, command: str) -> datetime:
         start_time = datetime.now()
 
         log.info('Building image', path=self._repository_path, command=command, start_time=start_time)
 
-        os.chdir(self._repository_path)
+        self._stage_stack.clear()
+        self._stage_output = [deque(maxlen=self._report_lines)]
 
-        return_code = self._run_command(command)
+        if self._failure_report and os.path.exists(self._failure_report):
+            os.unlink(self._failure_report)
 
+        return start_time
+
+    def _complete_build(self, command: str, return_code: Optional[int]) -> None:
         if return_code:
+            report = self._create_failure_report(command, return_code)
+
+            if self._failure_report:
+                os.makedirs(os.path.dirname(self._failure_report), exist_ok=True)
+                with open(self._failure_report, 'w') as report_file:
+                    report_file.write(report)
+
             log.error(
                 'Failed to build image',
                 path=self._repository_path,
                 return_code=return_code,
                 command=command,
                 stage=self._get_current_stage(),
+                report=self._failure_report,
             )
-            raise CalledProcessError(return_code, command)
+            raise CalledProcessError(return_code, command, output=report)
 
         log.info('Image build completed', path=self._repository_path, command=command)
 
-        return start_time
-
     def _run_command(self, command: str) -> Optional[int]:
         log.info('Executing command', command=command)
 
         start_time = time.time()
 
-        with Popen(command, shell=True, text=True, stdout=PIPE, stderr=PIPE) as process:
-            with ThreadPoolExecutor(2) as pool:
-                exhaust = partial(pool.submit, partial(deque, maxlen=0))
-                if process.stdout:
-                    exhaust(self._log_output(line[:-1], DEBUG) for line in process.stdout)
-                if process.stderr:
-                    exhaust(self._log_output(line[:-1], WARNING) for line in process.stderr)
+        if self._build_log:
+            self._build_log.open()
+
+        try:
+            with Popen(command, shell=True, stdout=PIPE, stderr=PIPE) as process:
+                if self._stage_profiler:
+                    self._stage_profiler.start(process.pid)
+                self._process_output(process)
+        finally:
+            if self._stage_profiler:
+                self._stage_profiler.stop()
+            if self._build_log:
+                self._build_log.close()
 
         end_time = time.time()
         elapsed_time = end_time - start_time
@@ -78,29 +132,78 @@ class ImageBuilder(IImageBuilder):
 
         return process.poll()
 
-    def _log_output(self, log_line: str, log_level: int) -> str:
-        if self._is_package_installer_log(log_line):
-            print(log_line)
-        elif self._is_pi_gen_log(log_line):
-            log.info(log_line)
-            self._handle_stage_stack(log_line)
-        else:
-            log.log(log_level, log_line, stage=self._get_current_stage())
-        return log_line
-
-    def _is_package_installer_log(self, log_line: str) -> bool:
-        return 'package-installer\x1b' in log_line
-
-    def _is_pi_gen_log(self, log_line: str) -> bool:
-        return log_line.startswith('[') and '/pi-gen' in log_line
-
-    def _handle_stage_stack(self, log_line: str) -> None:
-        match_begin = re.match(r'^\[.*] Begin (.*)', log_line)
-        if match_begin:
-            stage = match_begin.group(1).replace(f'{self._repository_path}', '')[1:]
+    def _process_output(self, process: Popen[bytes]) -> None:
+        pending = {WARNING: b'', DEBUG: b''}
+
+        with selectors.DefaultSelector() as selector:
+            selector.register(process.stdout, selectors.EVENT_READ, DEBUG)  # type: ignore
+            selector.register(process.stderr, selectors.EVENT_READ, WARNING)  # type: ignore
+
+            while selector.get_map():
+                for key, _ in selector.select():
+                    chunk = os.read(key.fd, self.CHUNK_SIZE)
+
+                    if not chunk:
+                        selector.unregister(key.fileobj)
+                        if pending[key.data]:
+                            self._process_lines([pending[key.data]], key.data)
+                        continue
+
+                    lines = (pending[key.data] + chunk).split(b'\n')
+                    pending[key.data] = lines.pop()
+                    self._process_lines(lines, key.data)
+
+    def _process_lines(self, lines: list[bytes], log_level: int) -> None:
+        if self._build_log:
+            self._build_log.write(b'\n'.join(lines) + b'\n')
+
+        installer_lines = []
+
+        for line in lines:
+            if line.startswith(b'[') and (match := self.STAGE_PATTERN.match(line)):
+                self._handle_stage_stack(match.group(1), match.group(2).decode(errors='replace'))
+                log.info(line.decode(errors='replace'))
+                continue
+
+            self._stage_output[-1].append(line)
+
+            if self.PACKAGE_INSTALLER_MARKER in line:
+                installer_lines.append(line)
+            elif self._log_level == 'all' or (self._log_level == 'warning' and log_level == WARNING):
+                log.log(log_level, line.decode(errors='replace'), stage=self._get_current_stage())
+
+        if installer_lines:
+            sys.stdout.write(b'\n'.join(installer_lines).decode(errors='replace') + '\n')
+            sys.stdout.flush()
+
+    def _handle_stage_stack(self, transition: bytes, path: str) -> None:
+        if transition == b'Begin':
+            stage = path.replace(f'{self._repository_path}', '')[1:]
             self._stage_stack.append(stage)
-        elif re.match(r'^\[.*] End (.*)', log_line):
-            self._stage_stack.pop()
+            self._stage_output.append(deque(maxlen=self._report_lines))
+            if self._stage_profiler:
+                self._stage_profiler.begin_stage(stage if stage else self.ROOT_STAGE)
+            self._on_stage_transition(transition, stage if stage else self.ROOT_STAGE)
+        elif self._stage_stack:
+            stage = self._stage_stack.pop()
+            self._stage_output.pop()
+            if self._stage_profiler:
+                self._stage_profiler.end_stage()
+            self._on_stage_transition(transition, stage if stage else self.ROOT_STAGE)
+
+    def _on_stage_transition(self, transition: bytes, stage: str) -> None:
+        pass
 
     def _get_current_stage(self) -> Optional[str]:
         return self._stage_stack[-1] if self._stage_stack else None
+
+    def _create_failure_report(self, command: str, return_code: int) -> str:
+        lines = [f'Command: {command}', f'Return code: {return_code}', f'Stage: {self._get_current_stage()}']
+        stages = [self.STARTUP_STAGE] + [stage if stage else self.ROOT_STAGE for stage in self._stage_stack]
+
+        for stage, output in zip(stages, self._stage_output):
+            if output:
+                lines.extend(['', f'--- {stage} (last {len(output)} lines) ---'])
+                lines.extend(line.decode(errors='replace') for line in output)
+
+        return '\n'.join(lines) + '\n'
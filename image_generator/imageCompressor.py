@@ -0,0 +1,77 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import os
+import shutil
+import time
+from subprocess import Popen, PIPE, CalledProcessError
+
+from context_logger import get_logger
+
+from image_generator import BuildConfiguration, ImageDigest, ImageHasher
+
+log = get_logger('ImageCompressor')
+
+
+class IImageCompressor(object):
+
+    def compress(self, source_path: str, target_path: str, configuration: BuildConfiguration) -> ImageDigest:
+        raise NotImplementedError()
+
+
+class ImageCompressor(IImageCompressor):
+
+    def compress(self, source_path: str, target_path: str, configuration: BuildConfiguration) -> ImageDigest:
+        command = self._get_command(configuration)
+        temp_path = f'{target_path}.tmp'
+
+        log.info('Compressing image', source=source_path, target=target_path, command=command)
+
+        start_time = time.time()
+
+        try:
+            with open(temp_path, 'wb') as target_file, Popen([*command, source_path], stdout=PIPE) as process:
+                digest = ImageHasher(configuration.blake3_checksum).copy(process.stdout, target_file)  # type: ignore
+            if process.returncode:
+                raise CalledProcessError(process.returncode, command)
+        except (CalledProcessError, OSError) as error:
+            log.error('Failed to compress image', source=source_path, command=command, error=str(error))
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        os.replace(temp_path, target_path)
+
+        source_size = os.path.getsize(source_path)
+        os.unlink(source_path)
+
+        log.info(
+            'Image compressed',
+            target=target_path,
+            source_size=source_size,
+            target_size=digest.size,
+            ratio=f'{digest.size / source_size:.3f}' if source_size else None,
+            elapsed_time=f'{time.time() - start_time:.3f}s',
+        )
+
+        return digest
+
+    def _get_command(self, configuration: BuildConfiguration) -> list[str]:
+        compression = configuration.compression
+        threads = configuration.compression_threads
+        level = [f'-{configuration.compression_level}'] if configuration.compression_level is not None else []
+
+        if compression == 'xz':
+            return ['xz', '--stdout', f'--threads={threads}', *level]
+        elif compression == 'zst':
+            ultra = ['--ultra'] if configuration.compression_level and configuration.compression_level > 19 else []
+            return ['zstd', '--stdout', '--quiet', f'-T{threads}', *ultra, *level]
+        elif compression == 'gz':
+            if shutil.which('pigz'):
+                return ['pigz', '--stdout', '-p', str(threads if threads else os.cpu_count()), *level]
+            log.warning('pigz not found, falling back to single-threaded gzip')
+            return ['gzip', '--stdout', *level]
+
+        log.error('Unsupported compression', compression=compression, compressions=configuration.EXTERNAL_COMPRESSIONS)
+        raise ValueError('Unsupported compression')
@@ -2,17 +2,35 @@
 # SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
 # SPDX-License-Identifier: MIT
 
-import difflib
+import json
 import os
-import re
-import shutil
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict
 from datetime import datetime
+from typing import Optional
 
-from common_utility.jsonLoader import IJsonLoader
 from context_logger import get_logger
 
-from image_generator import TargetConfig, IImageBuilder, IBuildInitializer
+from image_generator import (
+    TargetConfig,
+    ITargetConfigLoader,
+    IImageBuilder,
+    IBuildInitializer,
+    IBuildManifest,
+    IImageCompressor,
+    ImageCompressor,
+    ImageDigest,
+    ImageHasher,
+    IImageTrimmer,
+    ImageTrimmer,
+    IImageAnalyzer,
+    ImageAnalyzer,
+    IBlockMap,
+    BlockMap,
+    IStageProfiler,
+    IPhaseHook,
+    PhaseInstrumentation,
+    packageList,
+)
 
 log = get_logger('ImageGenerator')
 
@@ -25,7 +43,35 @@ class ImageProperties:
 
     @property
     def path(self) -> str:
-        return f'{self.directory}/{self.name}.{self.type}'
+        return f'{self.directory}/{self.file_name}'
+
+    @property
+    def config_path(self) -> str:
+        return f'{self.directory}/{self.name}.json'
+
+    @property
+    def manifest_path(self) -> str:
+        return f'{self.directory}/{self.name}.manifest.json'
+
+    @property
+    def analysis_path(self) -> str:
+        return f'{self.directory}/{self.name}.analysis.json'
+
+    @property
+    def bmap_path(self) -> str:
+        return f'{self.directory}/{self.name}.bmap'
+
+    @property
+    def file_name(self) -> str:
+        return f'{self.name}.{self.type}'
+
+
+@dataclass
+class ImageBuildContext:
+    config: TargetConfig
+    image_properties: ImageProperties
+    manifest: Optional[dict[str, str]] = None
+    up_to_date: bool = False
 
 
 class ImageGenerator(object):
@@ -33,57 +79,142 @@ class ImageGenerator(object):
     def __init__(
         self,
         config_path: str,
-        json_loader: IJsonLoader,
+        config_loader: ITargetConfigLoader,
         initializer: IBuildInitializer,
         image_builder: IImageBuilder,
         output_dir: str,
         output_pattern: str = '{target}-{version}',
+        build_manifest: Optional[IBuildManifest] = None,
+        force_build: bool = False,
+        image_compressor: Optional[IImageCompressor] = None,
+        image_trimmer: Optional[IImageTrimmer] = None,
+        block_map: Optional[IBlockMap] = None,
+        stage_profiler: Optional[IStageProfiler] = None,
+        image_analyzer: Optional[IImageAnalyzer] = None,
+        phase_hooks: Optional[list[IPhaseHook]] = None,
     ) -> None:
         self._config_path = config_path
-        self._json_loader = json_loader
+        self._config_loader = config_loader
         self._initializer = initializer
         self._image_builder = image_builder
         self._output_dir = output_dir
         self._output_pattern = output_pattern
+        self._build_manifest = build_manifest
+        self._force_build = force_build
+        self._image_compressor = image_compressor if image_compressor else ImageCompressor()
+        self._image_trimmer = image_trimmer if image_trimmer else ImageTrimmer()
+        self._block_map = block_map if block_map else BlockMap()
+        self._stage_profiler = stage_profiler
+        self._image_analyzer = image_analyzer if image_analyzer else ImageAnalyzer()
+        self._instrumentation = PhaseInstrumentation(phase_hooks)
 
     def generate(self, target_name: str) -> TargetConfig:
-        config = self._get_config(target_name)
+        context = self.prepare(target_name)
+
+        if context.up_to_date:
+            return context.config
+
+        with self._instrumentation.phase(target_name, 'build'):
+            start_time = self._image_builder.build()
+
+        return self.complete(context, start_time)
+
+    def prepare(self, target_name: str) -> ImageBuildContext:
+        with self._instrumentation.phase(target_name, 'load_config'):
+            config = self._get_config(target_name)
+
+        image_properties = self.get_image_properties(config)
 
-        self._initializer.initialize(config)
+        with self._instrumentation.phase(config.name, 'check_manifest'):
+            manifest = self._build_manifest.create(config) if self._build_manifest else None
+            up_to_date = bool(manifest and self._is_up_to_date(manifest, image_properties))
 
-        start_time = self._image_builder.build()
+        if up_to_date:
+            return ImageBuildContext(config, image_properties, manifest, up_to_date=True)
+
+        self._remove_manifest(image_properties)
+
+        with self._instrumentation.phase(config.name, 'initialize'):
+            self._initializer.initialize(config)
+
+        return ImageBuildContext(config, image_properties, manifest)
+
+    def complete(self, context: ImageBuildContext, start_time: datetime) -> TargetConfig:
+        config, image_properties, manifest = context.config, context.image_properties, context.manifest
 
         source_image_path = self._get_source_image_path(config, start_time)
 
-        self._check_result(source_image_path)
+        with self._instrumentation.phase(config.name, 'prepare_image'):
+            self._check_result(source_image_path)
+            self._prepare_raw_image(source_image_path, image_properties)
+
+        with self._instrumentation.phase(config.name, 'analyze_image'):
+            self._analyze_image(config, source_image_path, image_properties)
 
-        image_properties = self._create_image_properties(config)
+        with self._instrumentation.phase(config.name, 'move_image') as event:
+            image_digest = self._move_image(source_image_path, image_properties)
+            event.metrics['image_bytes'] = image_digest.size
 
-        self._move_image(source_image_path, image_properties)
+        with self._instrumentation.phase(config.name, 'export'):
+            self._export_digest(image_digest, image_properties)
 
-        self._export_config(config, image_properties)
+            self._export_config(config, image_properties)
 
-        self._export_package_list(image_properties)
+            self._export_package_list(image_properties)
+
+            if self._stage_profiler:
+                self._stage_profiler.export(f'{image_properties.directory}/{image_properties.name}')
+
+            if self._build_manifest and manifest:
+                self._build_manifest.save(manifest, image_properties.manifest_path)
 
         return config
 
+    def get_instrumentation(self) -> PhaseInstrumentation:
+        return self._instrumentation
+
+    def get_image_properties(self, config: TargetConfig) -> ImageProperties:
+        return ImageProperties(
+            directory=f'{self._output_dir}/{config.name}/{config.version}',
+            name=self._output_pattern.format(target=config.name, version=config.version),
+            type=self._get_file_type(self._initializer.get_configuration().compression),
+        )
+
     def _get_config(self, target_name: str) -> TargetConfig:
         log.info('Loading target configuration', target=target_name)
 
-        config_list = self._json_loader.load_list(self._config_path, TargetConfig)
-        config_map = {config.name: config for config in config_list}
-
-        if not (target := config_map.get(target_name)):
-            log.error('Target configuration not found', target=target_name, target_list=list(config_map.keys()))
+        if not (target := self._config_loader.load_target(self._config_path, target_name)):
+            target_list = self._config_loader.get_target_names(self._config_path)
+            log.error('Target configuration not found', target=target_name, target_list=target_list)
             raise AttributeError('Invalid target name or configuration list')
 
         log.info('Target configuration loaded', target=target_name, version=target.version)
 
         return target
 
+    def _is_up_to_date(self, manifest: dict[str, str], image_properties: ImageProperties) -> bool:
+        if self._force_build:
+            log.info('Forced build, skipping build manifest check', image=image_properties.path)
+            return False
+
+        if not (os.path.exists(image_properties.path) and os.path.exists(image_properties.config_path)):
+            return False
+
+        if not self._build_manifest or self._build_manifest.load(image_properties.manifest_path) != manifest:
+            log.info('Build inputs changed, rebuilding image', image=image_properties.path)
+            return False
+
+        log.info('Image is up to date, skipping build', image=image_properties.path, digest=manifest['digest'])
+
+        return True
+
+    def _remove_manifest(self, image_properties: ImageProperties) -> None:
+        if os.path.exists(image_properties.manifest_path):
+            os.unlink(image_properties.manifest_path)
+
     def _get_source_image_path(self, config: TargetConfig, start_time: datetime) -> str:
         date = start_time.strftime('%Y-%m-%d')
-        file_type = self._get_file_type()
+        file_type = self._get_file_type(self._initializer.get_configuration().deploy_compression)
         image_name_pattern = 'image_{date}-{target}-lite.{type}'
 
         image_name = image_name_pattern.format(date=date, target=config.name, type=file_type)
@@ -97,53 +228,112 @@ class ImageGenerator(object):
         else:
             log.info('Image found', image=image_path)
 
-    def _create_image_properties(self, config: TargetConfig) -> ImageProperties:
-        return ImageProperties(
-            directory=f'{self._output_dir}/{config.name}/{config.version}',
-            name=self._output_pattern.format(target=config.name, version=config.version),
-            type=self._get_file_type(),
-        )
-
-    def _move_image(self, source_image_path: str, image_properties: ImageProperties) -> None:
-        log.info('Moving image', source=source_image_path, target=image_properties.path)
+    def _prepare_raw_image(self, source_image_path: str, image_properties: ImageProperties) -> None:
+        configuration = self._initializer.get_configuration()
 
         os.makedirs(image_properties.directory, exist_ok=True)
 
+        if configuration.deploy_compression != 'none':
+            return
+
+        if configuration.trim_image:
+            self._image_trimmer.trim(source_image_path)
+
+        if configuration.block_map:
+            self._block_map.create(source_image_path, image_properties.bmap_path)
+
+    def _analyze_image(self, config: TargetConfig, source_image_path: str, image_properties: ImageProperties) -> None:
+        configuration = self._initializer.get_configuration()
+
+        if not configuration.analyze_image:
+            return
+
+        if configuration.deploy_compression != 'none':
+            log.warning('Image compressed by pi-gen, skipping analysis', compression=configuration.compression)
+            return
+
+        previous_report_path = self._get_previous_analysis_path(config)
+
+        self._image_analyzer.analyze(source_image_path, image_properties.analysis_path, previous_report_path)
+
+    def _get_previous_analysis_path(self, config: TargetConfig) -> Optional[str]:
+        target_dir = f'{self._output_dir}/{config.name}'
+        previous_version, previous_path = None, None
+
+        for version in os.listdir(target_dir):
+            properties = ImageProperties(
+                f'{target_dir}/{version}', self._output_pattern.format(target=config.name, version=version), ''
+            )
+
+            if not os.path.isfile(properties.analysis_path):
+                continue
+
+            if packageList.compare_versions(version, config.version) < 0 and (
+                not previous_version or packageList.compare_versions(version, previous_version) > 0
+            ):
+                previous_version, previous_path = version, properties.analysis_path
+
+        return previous_path
+
+    def _move_image(self, source_image_path: str, image_properties: ImageProperties) -> ImageDigest:
+        configuration = self._initializer.get_configuration()
+
         if os.path.exists(image_properties.path):
             os.unlink(image_properties.path)
 
-        shutil.move(source_image_path, image_properties.path)
+        if configuration.deploy_compression != configuration.compression:
+            return self._image_compressor.compress(source_image_path, image_properties.path, configuration)
+
+        log.info('Moving image', source=source_image_path, target=image_properties.path)
+
+        return ImageHasher(configuration.blake3_checksum).move(source_image_path, image_properties.path)
+
+    def _export_digest(self, image_digest: ImageDigest, image_properties: ImageProperties) -> None:
+        export_path = f'{image_properties.directory}/{image_properties.name}'
+        log.info('Exporting image checksum to file', file=f'{export_path}.sha256', sha256=image_digest.sha256)
+
+        with open(f'{export_path}.sha256', 'w') as checksum_file:
+            checksum_file.write(f'{image_digest.sha256}  {image_properties.file_name}\n')
+
+        if image_digest.blake3:
+            with open(f'{export_path}.b3', 'w') as checksum_file:
+                checksum_file.write(f'{image_digest.blake3}  {image_properties.file_name}\n')
+
+        with open(f'{export_path}.digest.json', 'w') as digest_file:
+            digest = {'file': image_properties.file_name, **asdict(image_digest)}
+            digest_file.write(f'{json.dumps(digest, indent=2)}\n')
 
     def _export_config(self, config: TargetConfig, image_properties: ImageProperties) -> None:
-        export_path = f'{image_properties.directory}/{image_properties.name}.json'
+        export_path = image_properties.config_path
         log.info('Exporting target configuration to file', file=export_path)
 
         with open(export_path, 'w') as config_file:
             config_file.write(f'{config.model_dump_json(indent=2, exclude_none=True)}\n')
 
-    def _get_file_type(self) -> str:
-        compression_to_file_type = {'none': 'img', 'zip': 'zip', 'gz': 'img.gz', 'xz': 'img.xz'}
-
-        compression = self._initializer.get_configuration().compression
+    def _get_file_type(self, compression: str) -> str:
+        compression_to_file_type = {'none': 'img', 'zip': 'zip', 'gz': 'img.gz', 'xz': 'img.xz', 'zst': 'img.zst'}
 
         return compression_to_file_type.get(compression, 'img')
 
     def _export_package_list(self, image_properties: ImageProperties) -> None:
         package_list_dir = f'{self._initializer.get_repository_path()}/deploy'
-        before_install = f'{package_list_dir}/before-install.list'
-        after_install = f'{package_list_dir}/after-install.list'
-
-        with open(before_install, 'r') as before_file, open(after_install, 'r') as after_file:
-            pattern = r'\[.*?\]'
-            before = re.sub(pattern, '', before_file.read()).splitlines()
-            after = re.sub(pattern, '', after_file.read()).splitlines()
-            diff = difflib.ndiff(before, after)
-
-        export_path = f'{image_properties.directory}/{image_properties.name}.list'
-
-        installed_packages = [package.strip('+ ') for package in diff if package.startswith('+')]
+        before = packageList.parse_package_list(f'{package_list_dir}/before-install.list')
+        after = packageList.parse_package_list(f'{package_list_dir}/after-install.list')
+        diff = packageList.diff_packages(before, after)
+
+        export_path = f'{image_properties.directory}/{image_properties.name}'
+
+        log.info(
+            'Exporting installed package list to file',
+            file=f'{export_path}.list',
+            added=len(diff.added),
+            removed=len(diff.removed),
+            upgraded=len(diff.upgraded),
+            downgraded=len(diff.downgraded),
+        )
 
-        log.info('Exporting installed package list to file', file=export_path)
+        with open(f'{export_path}.list', 'w') as installed_file:
+            installed_file.write('\n'.join(diff.get_installed(after)) + '\n')
 
-        with open(export_path, 'w') as installed_file:
-            installed_file.write('\n'.join(installed_packages) + '\n')
+        with open(f'{export_path}.packages.json', 'w') as diff_file:
+            diff_file.write(f'{json.dumps(diff.to_dict(), indent=2)}\n')
@@ -0,0 +1,126 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import errno
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Optional, BinaryIO, Any
+
+from context_logger import get_logger
+
+from image_generator import sparseFile
+
+log = get_logger('ImageHasher')
+
+
+@dataclass
+class ImageDigest:
+    size: int
+    sha256: str
+    blake3: Optional[str] = None
+
+
+class ImageHasher(object):
+    BUFFER_SIZE = 4 * 1024 * 1024
+    ZERO_BUFFER = bytes(BUFFER_SIZE)
+
+    def __init__(self, use_blake3: bool = False) -> None:
+        self._size = 0
+        self._sha256 = hashlib.sha256()
+        self._blake3 = self._create_blake3() if use_blake3 else None
+
+    def copy(self, source: BinaryIO, *targets: BinaryIO) -> ImageDigest:
+        buffer = bytearray(self.BUFFER_SIZE)
+        view = memoryview(buffer)
+
+        while size := source.readinto(buffer):  # type: ignore
+            chunk = view[:size]
+            self._update(chunk)
+            for target in targets:
+                target.write(chunk)
+
+        return self.get_digest()
+
+    def move(self, source_path: str, target_path: str) -> ImageDigest:
+        try:
+            os.rename(source_path, target_path)
+        except OSError as error:
+            if error.errno != errno.EXDEV:
+                raise
+        else:
+            log.debug('Image moved, computing checksum', target=target_path)
+            with open(target_path, 'rb') as target_file:
+                return self.copy_sparse(target_file)
+
+        log.debug('Image on different file system, copying with checksum', source=source_path, target=target_path)
+
+        temp_path = f'{target_path}.tmp'
+
+        try:
+            with open(source_path, 'rb') as source_file, open(temp_path, 'wb') as temp_file:
+                digest = self.copy_sparse(source_file, temp_file)
+            os.replace(temp_path, target_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+        os.unlink(source_path)
+
+        return digest
+
+    def copy_sparse(self, source: BinaryIO, target: Optional[BinaryIO] = None) -> ImageDigest:
+        size = os.fstat(source.fileno()).st_size
+        position = 0
+
+        for start, end in sparseFile.get_data_ranges(source.fileno(), size):
+            self._update_zeros(start - position)
+            source.seek(start)
+            if target:
+                target.seek(start)
+            self._copy_range(source, target, end - start)
+            position = end
+
+        self._update_zeros(size - position)
+
+        if target:
+            target.truncate(size)
+
+        return self.get_digest()
+
+    def get_digest(self) -> ImageDigest:
+        blake3 = self._blake3.hexdigest() if self._blake3 else None
+        return ImageDigest(self._size, self._sha256.hexdigest(), blake3)
+
+    def _copy_range(self, source: BinaryIO, target: Optional[BinaryIO], length: int) -> None:
+        while length > 0:
+            chunk = source.read(min(length, self.BUFFER_SIZE))
+            if not chunk:
+                break
+            self._update(chunk)
+            if target:
+                target.write(chunk)
+            length -= len(chunk)
+
+    def _update_zeros(self, length: int) -> None:
+        view = memoryview(self.ZERO_BUFFER)
+
+        while length > 0:
+            self._update(view[: min(length, self.BUFFER_SIZE)])
+            length -= self.BUFFER_SIZE
+
+    def _update(self, chunk: Any) -> None:
+        self._sha256.update(chunk)
+        if self._blake3:
+            self._blake3.update(chunk)
+        self._size += len(chunk)
+
+    def _create_blake3(self) -> Any:
+        try:
+            from blake3 import blake3
+
+            return blake3(max_threads=blake3.AUTO)
+        except ImportError:
+            log.error('BLAKE3 checksum requested, but the blake3 package is not installed')
+            raise
@@ -0,0 +1,66 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import glob
+import os
+import subprocess
+from subprocess import CalledProcessError
+
+from context_logger import get_logger
+
+log = get_logger('ImageTrimmer')
+
+
+class IImageTrimmer(object):
+
+    def trim(self, image_path: str) -> None:
+        raise NotImplementedError()
+
+
+class ImageTrimmer(IImageTrimmer):
+    ZERO_FILLED_FILE_SYSTEMS = ['ext2', 'ext3', 'ext4']
+
+    def trim(self, image_path: str) -> None:
+        allocated_size = self._get_allocated_size(image_path)
+
+        log.info('Trimming image', image=image_path, allocated_size=allocated_size)
+
+        try:
+            loop_device = self._run(['losetup', '--find', '--show', '--partscan', image_path])
+
+            try:
+                for partition in self._get_partitions(loop_device):
+                    log.info('Zero-filling free space of partition', partition=partition)
+                    self._run(['zerofree', partition])
+            finally:
+                self._run(['losetup', '--detach', loop_device])
+
+            self._run(['fallocate', '--dig-holes', image_path])
+        except (CalledProcessError, OSError) as error:
+            log.error('Failed to trim image', image=image_path, error=str(error))
+            raise
+
+        log.info(
+            'Image trimmed',
+            image=image_path,
+            allocated_size=self._get_allocated_size(image_path),
+            previous_allocated_size=allocated_size,
+        )
+
+    def _get_partitions(self, loop_device: str) -> list[str]:
+        partitions = []
+
+        for partition in sorted(glob.glob(f'{loop_device}p*')):
+            file_system = self._run(['blkid', '--output', 'value', '--match-tag', 'TYPE', partition], check=False)
+            if file_system in self.ZERO_FILLED_FILE_SYSTEMS:
+                partitions.append(partition)
+
+        return partitions
+
+    def _get_allocated_size(self, image_path: str) -> int:
+        return os.stat(image_path).st_blocks * 512
+
+    def _run(self, command: list[str], check: bool = True) -> str:
+        log.debug('Executing command', command=command)
+        return subprocess.run(command, check=check, capture_output=True, text=True).stdout.strip()
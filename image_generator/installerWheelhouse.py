@@ -0,0 +1,100 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import os
+import re
+import shutil
+import subprocess
+from subprocess import CalledProcessError, TimeoutExpired
+from typing import Optional
+
+from common_utility import create_file
+from context_logger import get_logger
+
+from image_generator import TargetConfig, contentHasher
+
+log = get_logger('InstallerWheelhouse')
+
+
+class IInstallerWheelhouse(object):
+
+    def prepare(self, config: TargetConfig, files_dir: str) -> bool:
+        raise NotImplementedError()
+
+
+class InstallerWheelhouse(IInstallerWheelhouse):
+    INSTALLER_PATTERN = re.compile(r'git\+(?P<url>[^@"\s]+)@(?P<ref>[^"\s]+)')
+    RESOLVE_TIMEOUT = 30
+
+    def __init__(self, cache_dir: str, resource_root: str, install_script: str = 'scripts/run.sh') -> None:
+        self._cache_dir = cache_dir
+        self._resource_root = resource_root
+        self._install_script = install_script
+
+    def prepare(self, config: TargetConfig, files_dir: str) -> bool:
+        if not (wheelhouse_path := self.get_wheelhouse_path(config)):
+            # Without the network the installer can not be built either, the latest cached release is used instead
+            if not (wheelhouse_path := self._get_latest_wheelhouse_path(config)):
+                log.warning('Package installer version not resolved, building without wheelhouse cache')
+                return False
+
+            log.warning('Package installer version not resolved, using latest cached wheelhouse', path=wheelhouse_path)
+
+        if os.path.isdir(wheelhouse_path):
+            log.info('Using cached package installer wheelhouse', reference=config.reference, path=wheelhouse_path)
+            shutil.copytree(wheelhouse_path, f'{files_dir}/wheels', dirs_exist_ok=True)
+            return True
+
+        log.info('Package installer wheelhouse not found, creating it during build', path=wheelhouse_path)
+        create_file(f'{files_dir}/wheelhouse', f'{wheelhouse_path}\n')
+
+        return False
+
+    def get_wheelhouse_path(self, config: TargetConfig) -> Optional[str]:
+        if not (installer_commit := self._get_installer_commit()):
+            return None
+
+        hasher = contentHasher.create_hasher()
+        contentHasher.update_with_text(hasher, installer_commit)
+
+        return f'{self._get_source_dir(config)}/{hasher.hexdigest()}'
+
+    def _get_source_dir(self, config: TargetConfig) -> str:
+        hasher = contentHasher.create_hasher()
+        contentHasher.update_with_text(hasher, config.reference)
+        contentHasher.update_with_file(hasher, f'{self._resource_root}/{self._install_script}')
+
+        return f'{self._cache_dir}/{hasher.hexdigest()}'
+
+    def _get_latest_wheelhouse_path(self, config: TargetConfig) -> Optional[str]:
+        if not os.path.isdir(source_dir := self._get_source_dir(config)):
+            return None
+
+        wheelhouses = [entry for entry in os.scandir(source_dir) if entry.is_dir() and not entry.name.endswith('.tmp')]
+
+        if not wheelhouses:
+            return None
+
+        return max(wheelhouses, key=lambda entry: entry.stat().st_mtime).path
+
+    def _get_installer_commit(self) -> Optional[str]:
+        with open(f'{self._resource_root}/{self._install_script}', 'r') as script_file:
+            if not (match := self.INSTALLER_PATTERN.search(script_file.read())):
+                log.error('Package installer source not found in install script', script=self._install_script)
+                raise ValueError('Package installer source not found')
+
+        command = ['git', 'ls-remote', match['url'], match['ref']]
+
+        try:
+            output = subprocess.run(
+                command, check=True, capture_output=True, text=True, timeout=self.RESOLVE_TIMEOUT
+            ).stdout
+        except (CalledProcessError, TimeoutExpired, OSError) as error:
+            log.warning(
+                'Failed to resolve package installer version', url=match['url'], ref=match['ref'], error=str(error)
+            )
+            return None
+
+        # A reference not found on the remote is used as is, it is a commit hash or the build fails anyway
+        return output.split()[0] if output.split() else match['ref']
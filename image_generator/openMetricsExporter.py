@@ -0,0 +1,117 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import os
+import re
+from typing import Optional
+
+from context_logger import get_logger
+
+from image_generator import IPhaseHook, PhaseEvent
+
+log = get_logger('OpenMetricsExporter')
+
+
+class OpenMetricsExporter(IPhaseHook):
+    PREFIX = 'image_generator_phase'
+    # metric family, type, help, event attribute (None: counter updated by the exporter)
+    METRICS: list[tuple[str, str, str, Optional[str]]] = [
+        ('duration_seconds', 'gauge', 'Duration of the last run of the phase', 'duration'),
+        ('cpu_seconds', 'gauge', 'CPU time of the generator process in the last run of the phase', 'cpu_time'),
+        ('child_cpu_seconds', 'gauge', 'CPU time of subprocesses in the last run of the phase', 'child_cpu_time'),
+        ('read_bytes', 'gauge', 'Bytes read by the generator process in the last run of the phase', 'read_bytes'),
+        (
+            'written_bytes',
+            'gauge',
+            'Bytes written by the generator process in the last run of the phase',
+            'written_bytes',
+        ),
+        ('subprocesses', 'gauge', 'Subprocesses started in the last run of the phase', 'subprocesses'),
+        ('timestamp_seconds', 'gauge', 'Completion time of the last run of the phase', None),
+        ('runs', 'counter', 'Runs of the phase', None),
+        ('failures', 'counter', 'Failed runs of the phase', None),
+    ]
+    SAMPLE_PATTERN = re.compile(r'^(?P<name>[a-z_]+)(?P<labels>\{.*}) (?P<value>\S+)$')
+
+    def __init__(self, metrics_file: str) -> None:
+        self._metrics_file = metrics_file
+        self._samples: Optional[dict[tuple[str, str], float]] = None
+
+    def before_phase(self, event: PhaseEvent) -> None:
+        pass
+
+    def after_phase(self, event: PhaseEvent) -> None:
+        samples = self._get_samples()
+        labels = self._format_labels(event)
+
+        for family, metric_type, _, attribute in self.METRICS:
+            name = self._get_sample_name(family, metric_type)
+
+            if attribute:
+                samples[(name, labels)] = float(getattr(event, attribute))
+            elif family == 'timestamp_seconds':
+                samples[(name, labels)] = event.timestamp + event.duration
+            elif family == 'runs' or event.error:
+                samples[(name, labels)] = samples.get((name, labels), 0.0) + 1
+
+        self._write(samples)
+
+    def _get_samples(self) -> dict[tuple[str, str], float]:
+        if self._samples is None:
+            self._samples = self._load()
+
+        return self._samples
+
+    def _load(self) -> dict[tuple[str, str], float]:
+        samples: dict[tuple[str, str], float] = {}
+
+        try:
+            with open(self._metrics_file, 'r') as metrics_file:
+                for line in metrics_file:
+                    if match := self.SAMPLE_PATTERN.match(line.strip()):
+                        samples[(match['name'], match['labels'])] = float(match['value'])
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as error:
+            log.warning('Failed to load existing metrics, starting over', file=self._metrics_file, error=str(error))
+
+        return samples
+
+    def _write(self, samples: dict[tuple[str, str], float]) -> None:
+        lines = []
+
+        # The node_exporter textfile collector reads the Prometheus text format, where the metadata of counters is
+        # declared under the sample name ending with _total
+        for family, metric_type, description, _ in self.METRICS:
+            name = self._get_sample_name(family, metric_type)
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.extend(
+                f'{name}{labels} {_format_value(value)}'
+                for (sample, labels), value in sorted(samples.items())
+                if sample == name
+            )
+
+        os.makedirs(os.path.dirname(os.path.abspath(self._metrics_file)), exist_ok=True)
+        temp_path = f'{self._metrics_file}.{os.getpid()}.tmp'
+
+        # The file is replaced atomically, so node_exporter never reads a partially written file
+        with open(temp_path, 'w') as metrics_file:
+            metrics_file.write('\n'.join(lines) + '\n')
+
+        os.replace(temp_path, self._metrics_file)
+
+    def _get_sample_name(self, family: str, metric_type: str) -> str:
+        return f'{self.PREFIX}_{family}_total' if metric_type == 'counter' else f'{self.PREFIX}_{family}'
+
+    def _format_labels(self, event: PhaseEvent) -> str:
+        return f'{{target="{_escape(event.target)}",phase="{_escape(event.phase)}"}}'
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,137 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import re
+from dataclasses import dataclass, field
+from itertools import zip_longest
+from typing import Any
+
+PACKAGE_LINE_PATTERN = re.compile(r'^(?P<name>[^/\s]+)/(?P<suites>\S*) (?P<version>\S+) (?P<arch>\S+)')
+VERSION_PART_PATTERN = re.compile(r'(\D*)(\d*)')
+
+
+@dataclass(frozen=True)
+class InstalledPackage:
+    version: str
+    arch: str
+    suites: str = ''
+
+    def format(self, name: str) -> str:
+        return f'{name}/{self.suites} {self.version} {self.arch}'
+
+
+@dataclass
+class PackageDiff:
+    added: dict[str, InstalledPackage] = field(default_factory=dict)
+    removed: dict[str, InstalledPackage] = field(default_factory=dict)
+    upgraded: dict[str, tuple[InstalledPackage, InstalledPackage]] = field(default_factory=dict)
+    downgraded: dict[str, tuple[InstalledPackage, InstalledPackage]] = field(default_factory=dict)
+
+    def get_installed(self, after: dict[str, InstalledPackage]) -> list[str]:
+        return [
+            package.format(name)
+            for name, package in after.items()
+            if name in self.added or name in self.upgraded or name in self.downgraded
+        ]
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'added': {name: _to_dict(package) for name, package in self.added.items()},
+            'removed': {name: _to_dict(package) for name, package in self.removed.items()},
+            'upgraded': {name: _to_change_dict(*change) for name, change in self.upgraded.items()},
+            'downgraded': {name: _to_change_dict(*change) for name, change in self.downgraded.items()},
+        }
+
+
+def parse_package_list(path: str) -> dict[str, InstalledPackage]:
+    packages = {}
+
+    with open(path, 'r') as package_file:
+        for line in package_file:
+            if match := PACKAGE_LINE_PATTERN.match(line):
+                packages[match['name']] = InstalledPackage(match['version'], match['arch'], match['suites'])
+
+    return packages
+
+
+def diff_packages(before: dict[str, InstalledPackage], after: dict[str, InstalledPackage]) -> PackageDiff:
+    diff = PackageDiff()
+
+    for name, package in after.items():
+        if (previous := before.get(name)) is None:
+            diff.added[name] = package
+        elif package.version == previous.version:
+            continue
+        elif (result := compare_versions(package.version, previous.version)) > 0:
+            diff.upgraded[name] = (previous, package)
+        elif result < 0:
+            diff.downgraded[name] = (previous, package)
+
+    for name, package in before.items():
+        if name not in after:
+            diff.removed[name] = package
+
+    return diff
+
+
+def compare_versions(first: str, second: str) -> int:
+    first_epoch, first_upstream, first_revision = _split_version(first)
+    second_epoch, second_upstream, second_revision = _split_version(second)
+
+    if first_epoch != second_epoch:
+        return 1 if first_epoch > second_epoch else -1
+
+    return _compare_part(first_upstream, second_upstream) or _compare_part(first_revision, second_revision)
+
+
+def _split_version(version: str) -> tuple[int, str, str]:
+    epoch, _, rest = version.partition(':') if ':' in version else ('0', '', version)
+    upstream, _, revision = rest.rpartition('-') if '-' in rest else (rest, '', '0')
+
+    return int(epoch) if epoch.isdigit() else 0, upstream, revision
+
+
+def _compare_part(first: str, second: str) -> int:
+    first_parts = VERSION_PART_PATTERN.findall(first)
+    second_parts = VERSION_PART_PATTERN.findall(second)
+
+    for (first_text, first_number), (second_text, second_number) in zip_longest(
+        first_parts, second_parts, fillvalue=('', '')
+    ):
+        if result := _compare_text(first_text, second_text):
+            return result
+
+        if int(first_number or 0) != int(second_number or 0):
+            return 1 if int(first_number or 0) > int(second_number or 0) else -1
+
+    return 0
+
+
+def _compare_text(first: str, second: str) -> int:
+    for first_char, second_char in zip_longest(first, second, fillvalue=''):
+        first_order, second_order = _get_order(first_char), _get_order(second_char)
+
+        if first_order != second_order:
+            return 1 if first_order > second_order else -1
+
+    return 0
+
+
+def _get_order(char: str) -> int:
+    if not char:
+        return 0
+    if char == '~':
+        return -1
+    if char.isalpha():
+        return ord(char)
+
+    return ord(char) + 256
+
+
+def _to_dict(package: InstalledPackage) -> dict[str, str]:
+    return {'version': package.version, 'arch': package.arch}
+
+
+def _to_change_dict(previous: InstalledPackage, current: InstalledPackage) -> dict[str, str]:
+    return {'from': previous.version, 'to': current.version, 'arch': current.arch}
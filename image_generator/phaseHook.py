@@ -0,0 +1,135 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import os
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional, Iterator, Any
+
+from context_logger import get_logger
+
+log = get_logger('PhaseHook')
+
+
+@dataclass
+class PhaseEvent:
+    target: str
+    phase: str
+    timestamp: float
+    duration: float = 0.0
+    cpu_time: float = 0.0
+    child_cpu_time: float = 0.0
+    read_bytes: int = 0
+    written_bytes: int = 0
+    subprocesses: int = 0
+    metrics: dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+class IPhaseHook(object):
+
+    def before_phase(self, event: PhaseEvent) -> None:
+        raise NotImplementedError()
+
+    def after_phase(self, event: PhaseEvent) -> None:
+        raise NotImplementedError()
+
+
+@dataclass
+class _Sample:
+    time: float
+    cpu_time: float
+    child_cpu_time: float
+    read_bytes: int
+    written_bytes: int
+    subprocesses: int
+
+
+class PhaseInstrumentation(object):
+    SUBPROCESS_EVENTS = ['subprocess.Popen', 'os.system']
+
+    def __init__(self, hooks: Optional[list[IPhaseHook]] = None, io_counters: str = '/proc/self/io') -> None:
+        self._hooks = hooks if hooks else []
+        self._io_counters = io_counters
+
+        if self._hooks:
+            _install_subprocess_counter(self.SUBPROCESS_EVENTS)
+
+    @contextmanager
+    def phase(self, target: str, phase: str) -> Iterator[PhaseEvent]:
+        event = PhaseEvent(target, phase, time.time())
+
+        if not self._hooks:
+            yield event
+            return
+
+        self._call_hooks('before_phase', event)
+
+        start = self._sample()
+
+        try:
+            yield event
+        except BaseException as error:
+            event.error = repr(error)
+            raise
+        finally:
+            end = self._sample()
+            event.duration = end.time - start.time
+            event.cpu_time = end.cpu_time - start.cpu_time
+            event.child_cpu_time = end.child_cpu_time - start.child_cpu_time
+            event.read_bytes = end.read_bytes - start.read_bytes
+            event.written_bytes = end.written_bytes - start.written_bytes
+            event.subprocesses = end.subprocesses - start.subprocesses
+
+            self._call_hooks('after_phase', event)
+
+    def _call_hooks(self, method: str, event: PhaseEvent) -> None:
+        for hook in self._hooks:
+            try:
+                getattr(hook, method)(event)
+            except Exception as error:
+                log.warning('Phase hook failed', hook=type(hook).__name__, phase=event.phase, error=str(error))
+
+    def _sample(self) -> _Sample:
+        times = os.times()
+        read_bytes, written_bytes = self._read_io_counters()
+
+        return _Sample(
+            time.perf_counter(),
+            times.user + times.system,
+            times.children_user + times.children_system,
+            read_bytes,
+            written_bytes,
+            _subprocess_count,
+        )
+
+    def _read_io_counters(self) -> tuple[int, int]:
+        try:
+            with open(self._io_counters, 'r') as io_file:
+                counters = dict(line.split(':', 1) for line in io_file.read().splitlines() if ':' in line)
+            return int(counters.get('rchar', 0)), int(counters.get('wchar', 0))
+        except (OSError, ValueError):
+            return 0, 0
+
+
+_subprocess_count = 0
+_subprocess_counter_installed = False
+
+
+def _install_subprocess_counter(events: list[str]) -> None:
+    global _subprocess_counter_installed
+
+    if _subprocess_counter_installed:
+        return
+
+    def count_subprocess(event: str, _: Any) -> None:
+        global _subprocess_count
+        if event in events:
+            _subprocess_count += 1
+
+    # Audit hooks cannot be removed, the counter is installed once per process
+    sys.addaudithook(count_subprocess)
+    _subprocess_counter_installed = True
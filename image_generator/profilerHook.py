@@ -0,0 +1,73 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import cProfile
+import os
+from typing import Optional, Any
+
+from context_logger import get_logger
+
+from image_generator import IPhaseHook, PhaseEvent
+
+log = get_logger('ProfilerHook')
+
+
+class ProfilerHook(IPhaseHook):
+    PROFILERS = ['cprofile', 'pyinstrument']
+
+    def __init__(self, output_dir: str, profiler: str = 'cprofile', phases: Optional[list[str]] = None) -> None:
+        self._output_dir = output_dir
+        self._profiler = profiler
+        self._phases = phases
+        self._active: dict[tuple[str, str], Any] = {}
+
+        if profiler not in self.PROFILERS:
+            log.error('Invalid profiler', profiler=profiler, profilers=self.PROFILERS)
+            raise ValueError('Invalid profiler')
+
+        if profiler == 'pyinstrument':
+            self._get_pyinstrument()
+
+    def before_phase(self, event: PhaseEvent) -> None:
+        if self._phases is not None and event.phase not in self._phases:
+            return
+
+        profiler: Any
+
+        if self._profiler == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            profiler = self._get_pyinstrument()()
+            profiler.start()
+
+        self._active[(event.target, event.phase)] = profiler
+
+    def after_phase(self, event: PhaseEvent) -> None:
+        if not (profiler := self._active.pop((event.target, event.phase), None)):
+            return
+
+        os.makedirs(self._output_dir, exist_ok=True)
+        path_prefix = f'{self._output_dir}/{event.target}-{event.phase}'
+
+        if self._profiler == 'cprofile':
+            profiler.disable()
+            profiler.dump_stats(f'{path_prefix}.prof')
+            profile_path = f'{path_prefix}.prof'
+        else:
+            profiler.stop()
+            with open(f'{path_prefix}.html', 'w') as profile_file:
+                profile_file.write(profiler.output_html())
+            profile_path = f'{path_prefix}.html'
+
+        log.info('Phase profile exported', target=event.target, phase=event.phase, file=profile_path)
+
+    def _get_pyinstrument(self) -> Any:
+        try:
+            from pyinstrument import Profiler
+
+            return Profiler
+        except ImportError:
+            log.error('Pyinstrument profiler requested, but the pyinstrument package is not installed')
+            raise
@@ -0,0 +1,118 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import fcntl
+import os
+import shutil
+from contextlib import contextmanager
+from typing import Optional, Iterator
+
+from context_logger import get_logger
+from git import Repo, GitCommandError
+
+log = get_logger('RepositoryManager')
+
+
+class IRepositoryManager(object):
+
+    def create_worktree(self, path: str) -> Repo:
+        raise NotImplementedError()
+
+    def reset_worktree(self, repository: Repo) -> None:
+        raise NotImplementedError()
+
+    def fetch_reference(self, reference: str) -> None:
+        raise NotImplementedError()
+
+
+class RepositoryManager(IRepositoryManager):
+
+    def __init__(self, repository_url: str, mirror_path: str, depth: Optional[int] = None) -> None:
+        self._repository_url = repository_url
+        self._mirror_path = mirror_path
+        self._depth = depth
+
+    def create_worktree(self, path: str) -> Repo:
+        path = os.path.abspath(path)
+
+        with self._lock():
+            mirror = self._get_mirror()
+
+            if self._is_worktree(mirror, path):
+                log.info('Cleaning existing worktree', repository=self._repository_url, path=path)
+                repository = Repo(path)
+                self._clean_worktree(repository)
+                return repository
+
+            if os.path.exists(path):
+                log.info('Replacing repository with worktree', path=path)
+                shutil.rmtree(path, ignore_errors=True)
+
+            log.info('Creating worktree', mirror=self._mirror_path, path=path)
+            mirror.git.worktree('prune')
+            mirror.git.worktree('add', '--detach', '--force', path, 'HEAD')
+
+            return Repo(path)
+
+    def reset_worktree(self, repository: Repo) -> None:
+        log.info('Resetting worktree', path=repository.working_tree_dir)
+        self._clean_worktree(repository)
+
+    def fetch_reference(self, reference: str) -> None:
+        with self._lock():
+            mirror = self._get_mirror()
+
+            try:
+                mirror.git.rev_parse('--verify', '--quiet', f'{reference}^{{commit}}')
+                return
+            except GitCommandError:
+                pass
+
+            log.info('Fetching reference into mirror', reference=reference, depth=self._depth)
+
+            try:
+                mirror.git.fetch(*self._get_depth_options(), 'origin', reference)
+            except GitCommandError as error:
+                log.warning('Failed to fetch reference', reference=reference, error=str(error))
+
+    def _get_mirror(self) -> Repo:
+        if os.path.exists(f'{self._mirror_path}/HEAD'):
+            return Repo(self._mirror_path)
+
+        shutil.rmtree(self._mirror_path, ignore_errors=True)
+
+        log.info('Creating repository mirror', repository=self._repository_url, path=self._mirror_path)
+
+        return Repo.clone_from(self._repository_url, self._mirror_path, multi_options=self._get_clone_options())
+
+    def _is_worktree(self, mirror: Repo, path: str) -> bool:
+        if not os.path.isfile(f'{path}/.git'):
+            return False
+
+        worktrees = mirror.git.worktree('list', '--porcelain').splitlines()
+
+        return f'worktree {path}' in worktrees
+
+    def _clean_worktree(self, repository: Repo) -> None:
+        repository.git.reset('--hard', 'HEAD')
+        repository.git.clean('-df')
+        # pi-gen ignores the SKIP markers of the stage cache, the stage directories are cleaned of ignored files too
+        repository.git.clean('-dfx', '--', 'stage*')
+
+    def _get_clone_options(self) -> list[str]:
+        return ['--mirror'] + self._get_depth_options()
+
+    def _get_depth_options(self) -> list[str]:
+        return [f'--depth={self._depth}'] if self._depth else []
+
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        os.makedirs(os.path.dirname(os.path.abspath(self._mirror_path)), exist_ok=True)
+
+        with open(f'{self._mirror_path}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,44 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import errno
+import os
+
+
+def get_data_ranges(fd: int, size: int) -> list[tuple[int, int]]:
+    ranges: list[tuple[int, int]] = []
+    position = 0
+
+    try:
+        while position < size:
+            try:
+                start = os.lseek(fd, position, os.SEEK_DATA)
+            except OSError as error:
+                if error.errno == errno.ENXIO:
+                    break
+                raise
+
+            end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+            ranges.append((start, end))
+            position = end
+    except (AttributeError, OSError):
+        return [(0, size)] if size else []
+    finally:
+        os.lseek(fd, 0, os.SEEK_SET)
+
+    return ranges
+
+
+def get_block_ranges(data_ranges: list[tuple[int, int]], block_size: int) -> list[tuple[int, int]]:
+    block_ranges: list[tuple[int, int]] = []
+
+    for start, end in data_ranges:
+        first, last = start // block_size, (end - 1) // block_size
+
+        if block_ranges and first <= block_ranges[-1][1] + 1:
+            block_ranges[-1] = (block_ranges[-1][0], max(last, block_ranges[-1][1]))
+        else:
+            block_ranges.append((first, last))
+
+    return block_ranges
@@ -0,0 +1,159 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import os
+import re
+from pathlib import Path
+
+from common_utility import render_template_file, create_file
+from context_logger import get_logger
+from git import Repo, InvalidGitRepositoryError, NoSuchPathError
+
+from image_generator import contentHasher
+
+log = get_logger('StageCache')
+
+
+class IStageCache(object):
+
+    def prepare(self, repository_path: str, stage: int, sub_stage_index: int, build_config: str) -> bool:
+        raise NotImplementedError()
+
+
+class StageCache(IStageCache):
+    # pi-gen config variables that do not affect the content of the root file system (the hostname is re-applied
+    # by the install-packages sub-stage, so targets differing only in name can share snapshots)
+    IGNORED_CONFIG_VARIABLES = ['IMG_NAME', 'TARGET_HOSTNAME', 'DEPLOY_COMPRESSION', 'CLEAN', 'STAGE_LIST', 'APT_PROXY']
+    SNAPSHOT_FORMATS = ['tar', 'reflink']
+
+    def __init__(
+        self,
+        cache_dir: str,
+        resource_root: str,
+        snapshot_format: str = 'tar',
+        snapshot_template: str = 'template/stage_snapshot.j2',
+        restore_template: str = 'template/stage_restore.j2',
+        sub_stage_name: str = 'stage-snapshot',
+    ) -> None:
+        self._cache_dir = cache_dir
+        self._resource_root = resource_root
+        self._snapshot_format = snapshot_format
+        self._snapshot_template = snapshot_template
+        self._restore_template = restore_template
+        self._sub_stage_name = sub_stage_name
+
+        if snapshot_format not in self.SNAPSHOT_FORMATS:
+            log.error('Invalid snapshot format', format=snapshot_format, formats=self.SNAPSHOT_FORMATS)
+            raise ValueError('Invalid snapshot format')
+
+    def prepare(self, repository_path: str, stage: int, sub_stage_index: int, build_config: str) -> bool:
+        key = self.get_key(repository_path, stage, sub_stage_index, build_config)
+        snapshot_path = self.get_snapshot_path(key)
+        stage_dir = f'{repository_path}/stage{stage}'
+
+        self._create_snapshot_sub_stage(stage_dir, sub_stage_index, snapshot_path)
+
+        if not os.path.exists(snapshot_path):
+            log.info('Stage snapshot not found, creating it during build', stage=f'stage{stage}', key=key)
+            return False
+
+        log.info('Stage snapshot found, skipping cached stages', stage=f'stage{stage}', key=key, path=snapshot_path)
+
+        self._skip_cached_stages(repository_path, stage, sub_stage_index)
+        self._create_restore_script(stage_dir, snapshot_path)
+
+        Path(snapshot_path).touch()
+
+        return True
+
+    def get_key(self, repository_path: str, stage: int, sub_stage_index: int, build_config: str) -> str:
+        hasher = contentHasher.create_hasher()
+
+        contentHasher.update_with_text(hasher, f'stage{stage}/{sub_stage_index:02}')
+        contentHasher.update_with_text(hasher, self._get_commit(repository_path))
+        contentHasher.update_with_text(hasher, self._get_relevant_config(build_config))
+
+        for stage_dir in self._get_cached_stage_dirs(repository_path, stage):
+            contentHasher.update_with_text(hasher, os.path.relpath(stage_dir, repository_path))
+            contentHasher.update_with_directory(hasher, stage_dir)
+
+        for sub_stage_dir in self._get_cached_sub_stage_dirs(f'{repository_path}/stage{stage}', sub_stage_index):
+            contentHasher.update_with_text(hasher, os.path.relpath(sub_stage_dir, repository_path))
+            contentHasher.update_with_directory(hasher, sub_stage_dir)
+
+        for stage_file in self._get_stage_files(f'{repository_path}/stage{stage}'):
+            contentHasher.update_with_text(hasher, os.path.relpath(stage_file, repository_path))
+            contentHasher.update_with_file(hasher, stage_file)
+
+        return str(hasher.hexdigest())
+
+    def get_snapshot_path(self, key: str) -> str:
+        return f'{self._cache_dir}/{key}.tar' if self._snapshot_format == 'tar' else f'{self._cache_dir}/{key}'
+
+    def _get_commit(self, repository_path: str) -> str:
+        try:
+            return str(Repo(repository_path).head.commit.hexsha)
+        except (InvalidGitRepositoryError, NoSuchPathError, ValueError):
+            log.warning('Failed to resolve repository commit, using content only', path=repository_path)
+            return ''
+
+    def _get_relevant_config(self, build_config: str) -> str:
+        pattern = re.compile(rf'^({"|".join(self.IGNORED_CONFIG_VARIABLES)})=')
+        return '\n'.join(line for line in build_config.splitlines() if not pattern.match(line))
+
+    def _get_cached_stage_dirs(self, repository_path: str, stage: int) -> list[str]:
+        stage_dirs = [f'{repository_path}/stage{index}' for index in range(stage)]
+        return [stage_dir for stage_dir in stage_dirs if os.path.isdir(stage_dir)]
+
+    def _get_cached_sub_stage_dirs(self, stage_dir: str, sub_stage_index: int) -> list[str]:
+        sub_stage_dirs = []
+
+        for sub_dir in sorted(os.listdir(stage_dir)):
+            sub_stage_dir = f'{stage_dir}/{sub_dir}'
+            starts_with_digits = re.match(r'^\d+', sub_dir)
+            if (
+                os.path.isdir(sub_stage_dir)
+                and starts_with_digits
+                and int(starts_with_digits.group()) < sub_stage_index
+            ):
+                sub_stage_dirs.append(sub_stage_dir)
+
+        return sub_stage_dirs
+
+    def _get_stage_files(self, stage_dir: str) -> list[str]:
+        return [
+            f'{stage_dir}/{name}' for name in sorted(os.listdir(stage_dir)) if os.path.isfile(f'{stage_dir}/{name}')
+        ]
+
+    def _create_snapshot_sub_stage(self, stage_dir: str, sub_stage_index: int, snapshot_path: str) -> None:
+        script_path = f'{stage_dir}/{sub_stage_index:02}-{self._sub_stage_name}/00-run.sh'
+
+        log.info('Creating stage snapshot script', script=script_path, snapshot=snapshot_path)
+
+        self._create_script(script_path, self._snapshot_template, snapshot_path)
+
+    def _skip_cached_stages(self, repository_path: str, stage: int, sub_stage_index: int) -> None:
+        stage_dir = f'{repository_path}/stage{stage}'
+        skipped_dirs = self._get_cached_stage_dirs(repository_path, stage)
+        skipped_dirs.extend(self._get_cached_sub_stage_dirs(stage_dir, sub_stage_index + 1))
+
+        log.info('Skipping cached stages', stages=[os.path.relpath(path, repository_path) for path in skipped_dirs])
+
+        for skipped_dir in skipped_dirs:
+            Path(f'{skipped_dir}/SKIP').touch()
+
+    def _create_restore_script(self, stage_dir: str, snapshot_path: str) -> None:
+        script_path = f'{stage_dir}/prerun.sh'
+
+        log.info('Creating stage restore script', script=script_path, snapshot=snapshot_path)
+
+        self._create_script(script_path, self._restore_template, snapshot_path)
+
+    def _create_script(self, script_path: str, template: str, snapshot_path: str) -> None:
+        context = {'snapshot_path': snapshot_path, 'snapshot_format': self._snapshot_format}
+        script = render_template_file(self._resource_root, template, context)
+
+        os.makedirs(os.path.dirname(script_path), exist_ok=True)
+        create_file(script_path, script)
+        os.chmod(script_path, 0o755)
@@ -0,0 +1,253 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, asdict, field
+from typing import Optional, Any
+
+from context_logger import get_logger
+
+log = get_logger('StageProfiler')
+
+
+@dataclass
+class ResourceUsage:
+    rss: int = 0
+    cpu_time: float = 0.0
+    read_bytes: int = 0
+    write_bytes: int = 0
+
+
+@dataclass
+class StageProfile:
+    name: str
+    depth: int
+    start: float
+    end: Optional[float] = None
+    duration: Optional[float] = None
+    cpu_time: float = 0.0
+    peak_cpu: float = 0.0
+    peak_rss: int = 0
+    read_bytes: int = 0
+    write_bytes: int = 0
+    start_usage: ResourceUsage = field(default_factory=ResourceUsage, repr=False)
+
+
+class IStageProfiler(object):
+
+    def start(self, pid: int) -> None:
+        raise NotImplementedError()
+
+    def stop(self) -> None:
+        raise NotImplementedError()
+
+    def begin_stage(self, stage: str) -> None:
+        raise NotImplementedError()
+
+    def end_stage(self) -> None:
+        raise NotImplementedError()
+
+    def get_timeline(self) -> list[StageProfile]:
+        raise NotImplementedError()
+
+    def export(self, path_prefix: str) -> None:
+        raise NotImplementedError()
+
+
+class StageProfiler(IStageProfiler):
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+    def __init__(self, sample_interval: float = 1.0, chrome_trace: bool = False, proc_root: str = '/proc') -> None:
+        self._sample_interval = sample_interval
+        self._chrome_trace = chrome_trace
+        self._proc_root = proc_root
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = 0
+        self._process_usage: dict[tuple[int, str], ResourceUsage] = {}
+        self._usage = ResourceUsage()
+        self._sample_time = 0.0
+        self._stage_stack: list[StageProfile] = []
+        self._timeline: list[StageProfile] = []
+        self._samples: list[tuple[float, int, float]] = []
+
+    def start(self, pid: int) -> None:
+        with self._lock:
+            self._pid = pid
+            self._process_usage.clear()
+            self._stage_stack.clear()
+            self._timeline.clear()
+            self._samples.clear()
+            self._usage = ResourceUsage()
+            self._sample_time = time.time()
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='StageProfiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+        with self._lock:
+            while self._stage_stack:
+                self._close_stage()
+
+    def begin_stage(self, stage: str) -> None:
+        with self._lock:
+            profile = StageProfile(stage, len(self._stage_stack), time.time(), start_usage=self._get_total_usage())
+            self._stage_stack.append(profile)
+            self._timeline.append(profile)
+
+    def end_stage(self) -> None:
+        with self._lock:
+            if self._stage_stack:
+                self._close_stage()
+
+    def get_timeline(self) -> list[StageProfile]:
+        with self._lock:
+            return list(self._timeline)
+
+    def export(self, path_prefix: str) -> None:
+        timeline = self.get_timeline()
+        timeline_path = f'{path_prefix}.timeline.json'
+
+        log.info('Exporting stage timeline to file', file=timeline_path, stages=len(timeline))
+
+        with open(timeline_path, 'w') as timeline_file:
+            stages = [{k: v for k, v in asdict(stage).items() if k != 'start_usage'} for stage in timeline]
+            timeline_file.write(f'{json.dumps({"stages": stages}, indent=2)}\n')
+
+        if self._chrome_trace:
+            trace_path = f'{path_prefix}.trace.json'
+
+            log.info('Exporting Chrome trace to file', file=trace_path)
+
+            with open(trace_path, 'w') as trace_file:
+                trace_file.write(f'{json.dumps(self._create_chrome_trace(timeline))}\n')
+
+    def _run(self) -> None:
+        self._sample()
+
+        while not self._stop_event.wait(self._sample_interval):
+            self._sample()
+
+        self._sample()
+
+    def _sample(self) -> None:
+        sample_time = time.time()
+        processes = self._read_process_tree()
+
+        with self._lock:
+            previous_cpu_time = self._get_total_usage().cpu_time
+            rss = 0
+
+            for key, usage in processes.items():
+                self._process_usage[key] = usage
+                rss += usage.rss
+
+            self._usage = self._get_total_usage()
+            self._usage.rss = rss
+
+            elapsed_time = sample_time - self._sample_time
+            cpu = (self._usage.cpu_time - previous_cpu_time) / elapsed_time if elapsed_time > 0 else 0.0
+            self._sample_time = sample_time
+            self._samples.append((sample_time, rss, round(cpu, 3)))
+
+            for stage in self._stage_stack:
+                stage.peak_rss = max(stage.peak_rss, rss)
+                stage.peak_cpu = max(stage.peak_cpu, round(cpu, 3))
+
+    def _close_stage(self) -> None:
+        stage = self._stage_stack.pop()
+        usage = self._get_total_usage()
+        stage.end = time.time()
+        stage.duration = round(stage.end - stage.start, 3)
+        stage.cpu_time = round(usage.cpu_time - stage.start_usage.cpu_time, 3)
+        stage.read_bytes = usage.read_bytes - stage.start_usage.read_bytes
+        stage.write_bytes = usage.write_bytes - stage.start_usage.write_bytes
+
+    def _get_total_usage(self) -> ResourceUsage:
+        total = ResourceUsage(rss=self._usage.rss)
+
+        for usage in self._process_usage.values():
+            total.cpu_time += usage.cpu_time
+            total.read_bytes += usage.read_bytes
+            total.write_bytes += usage.write_bytes
+
+        return total
+
+    def _read_process_tree(self) -> dict[tuple[int, str], ResourceUsage]:
+        stats = {}
+        children: dict[int, list[int]] = {}
+
+        for entry in os.listdir(self._proc_root):
+            if entry.isdigit() and (stat := self._read_stat(int(entry))):
+                stats[int(entry)] = stat
+                children.setdefault(int(stat[1]), []).append(int(entry))
+
+        processes = {}
+        pids = [self._pid]
+
+        while pids:
+            pid = pids.pop()
+            if stat := stats.get(pid):
+                read_bytes, write_bytes = self._read_io(pid)
+                cpu_time = (int(stat[11]) + int(stat[12])) / self.CLOCK_TICKS
+                rss = int(stat[21]) * self.PAGE_SIZE
+                processes[(pid, stat[19])] = ResourceUsage(rss, cpu_time, read_bytes, write_bytes)
+                pids.extend(children.get(pid, []))
+
+        return processes
+
+    def _read_stat(self, pid: int) -> Optional[list[str]]:
+        try:
+            with open(f'{self._proc_root}/{pid}/stat') as stat_file:
+                return stat_file.read().rpartition(')')[2].split()
+        except OSError:
+            return None
+
+    def _read_io(self, pid: int) -> tuple[int, int]:
+        try:
+            with open(f'{self._proc_root}/{pid}/io') as io_file:
+                io = dict(line.split(': ') for line in io_file.read().splitlines())
+                return int(io.get('read_bytes', 0)), int(io.get('write_bytes', 0))
+        except (OSError, ValueError):
+            return 0, 0
+
+    def _create_chrome_trace(self, timeline: list[StageProfile]) -> dict[str, Any]:
+        events: list[dict[str, Any]] = []
+
+        for stage in timeline:
+            args = {k: v for k, v in asdict(stage).items() if k not in ['name', 'depth', 'start', 'end', 'start_usage']}
+            events.append(
+                {
+                    'name': stage.name,
+                    'cat': 'stage',
+                    'ph': 'X',
+                    'ts': int(stage.start * 1000000),
+                    'dur': int((stage.duration or 0) * 1000000),
+                    'pid': 1,
+                    'tid': 1,
+                    'args': args,
+                }
+            )
+
+        with self._lock:
+            samples = list(self._samples)
+
+        for sample_time, rss, cpu in samples:
+            timestamp = int(sample_time * 1000000)
+            events.append({'name': 'rss', 'ph': 'C', 'ts': timestamp, 'pid': 1, 'args': {'bytes': rss}})
+            events.append({'name': 'cpu', 'ph': 'C', 'ts': timestamp, 'pid': 1, 'args': {'cores': cpu}})
+
+        return {'traceEvents': events}
@@ -0,0 +1,198 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Optional, Any
+
+from context_logger import get_logger
+
+from image_generator import TargetConfig
+
+log = get_logger('TargetConfigLoader')
+
+
+@dataclass
+class _ResolvedTarget:
+    entry: dict[str, Any]
+    files: list['_ConfigFile']
+    base_layer: Optional[str] = None
+    config: Optional[TargetConfig] = None
+
+
+@dataclass
+class _ConfigFile:
+    path: str
+    key: tuple[int, int]
+    entries: dict[str, dict[str, Any]]
+    targets: dict[str, _ResolvedTarget] = field(default_factory=dict)
+
+
+class ITargetConfigLoader(object):
+
+    def get_target_names(self, config_path: str) -> list[str]:
+        raise NotImplementedError()
+
+    def load_target(self, config_path: str, target_name: str) -> Optional[TargetConfig]:
+        raise NotImplementedError()
+
+    def load_targets(self, config_path: str, target_names: list[str]) -> list[TargetConfig]:
+        raise NotImplementedError()
+
+    def get_base_layer(self, config_path: str, target_name: str) -> Optional[str]:
+        raise NotImplementedError()
+
+
+class TargetConfigLoader(ITargetConfigLoader):
+    EXTENDS = 'extends'
+    INCLUDE = 'include'
+    ABSTRACT = 'abstract'
+    # fields determining the pi-gen stages shared between targets
+    BASE_LAYER_FIELDS = {'reference', 'stage', 'boot_cmdline', 'boot_config'}
+
+    def __init__(self) -> None:
+        self._files: dict[str, _ConfigFile] = {}
+
+    def get_target_names(self, config_path: str) -> list[str]:
+        return [
+            name
+            for config_file in self._index(config_path)
+            for name, entry in config_file.entries.items()
+            if not entry.get(self.ABSTRACT)
+        ]
+
+    def load_target(self, config_path: str, target_name: str) -> Optional[TargetConfig]:
+        if not (target := self._resolve(config_path, target_name, ())) or target.entry.get(self.ABSTRACT):
+            return None
+
+        if not target.config:
+            log.debug('Validating target configuration', target=target_name)
+            target.config = TargetConfig.model_validate(target.entry)
+
+        return target.config
+
+    def load_targets(self, config_path: str, target_names: list[str]) -> list[TargetConfig]:
+        return [config for target_name in target_names if (config := self.load_target(config_path, target_name))]
+
+    def get_base_layer(self, config_path: str, target_name: str) -> Optional[str]:
+        if not (config := self.load_target(config_path, target_name)):
+            return None
+
+        if not (target := self._resolve(config_path, target_name, ())):
+            return None
+
+        if not target.base_layer:
+            layer = config.model_dump(mode='json', include=self.BASE_LAYER_FIELDS)
+            target.base_layer = hashlib.sha256(json.dumps(layer, sort_keys=True).encode()).hexdigest()[:16]
+
+        return target.base_layer
+
+    def _resolve(self, config_path: str, target_name: str, chain: tuple[str, ...]) -> Optional[_ResolvedTarget]:
+        if target_name in chain:
+            log.error('Circular target configuration inheritance', targets=[*chain, target_name])
+            raise ValueError(f'Circular target configuration inheritance: {" -> ".join([*chain, target_name])}')
+
+        if not (config_file := self._find(config_path, target_name)):
+            return None
+
+        if (target := config_file.targets.get(target_name)) and self._is_up_to_date(target):
+            return target
+
+        entry = config_file.entries[target_name]
+        extends = entry.get(self.EXTENDS)
+        includes = self._get_names(entry, self.INCLUDE)
+
+        merged: dict[str, Any] = {}
+        files = [config_file]
+
+        for base_name in ([extends] if extends else []) + includes:
+            base = self._resolve_base(config_path, base_name, (*chain, target_name))
+            merged = self._merge(merged, base.entry)
+            files.extend(base.files)
+
+        own = {key: value for key, value in entry.items() if key not in [self.EXTENDS, self.INCLUDE, self.ABSTRACT]}
+        merged = self._merge(merged, own)
+        merged[self.ABSTRACT] = entry.get(self.ABSTRACT, False)
+
+        target = config_file.targets[target_name] = _ResolvedTarget(merged, self._get_unique_files(files))
+
+        return target
+
+    def _resolve_base(self, config_path: str, base_name: str, chain: tuple[str, ...]) -> _ResolvedTarget:
+        if not (base := self._resolve(config_path, base_name, chain)):
+            log.error('Base target configuration not found', target=chain[-1], base=base_name)
+            raise ValueError(f'Base target configuration not found: {base_name}')
+
+        return base
+
+    def _find(self, config_path: str, target_name: str) -> Optional[_ConfigFile]:
+        for config_file in self._index(config_path, target_name):
+            if target_name in config_file.entries:
+                return config_file
+
+        return None
+
+    def _is_up_to_date(self, target: _ResolvedTarget) -> bool:
+        return all(self._load_file(config_file.path) is config_file for config_file in target.files)
+
+    def _get_unique_files(self, files: list[_ConfigFile]) -> list[_ConfigFile]:
+        return list({config_file.path: config_file for config_file in files}.values())
+
+    def _get_names(self, entry: dict[str, Any], key: str) -> list[str]:
+        value = entry.get(key) or []
+        return [value] if isinstance(value, str) else list(value)
+
+    def _merge(self, base: dict[str, Any], overlay: dict[str, Any]) -> dict[str, Any]:
+        merged = dict(base)
+
+        for key, value in overlay.items():
+            if isinstance(value, list) and isinstance(merged.get(key), list):
+                merged[key] = self._merge_list(merged[key], value)
+            else:
+                merged[key] = value
+
+        return merged
+
+    def _merge_list(self, base: list[Any], overlay: list[Any]) -> list[Any]:
+        items = {json.dumps(item, sort_keys=True): item for item in base + overlay}
+        return list(items.values())
+
+    def _index(self, config_path: str, target_name: Optional[str] = None) -> list[_ConfigFile]:
+        if not os.path.isdir(config_path):
+            return [self._load_file(config_path)]
+
+        if target_name and os.path.isfile(target_path := f'{config_path}/{target_name}.json'):
+            config_file = self._load_file(target_path)
+            if target_name in config_file.entries:
+                return [config_file]
+
+        file_names = sorted(name for name in os.listdir(config_path) if name.endswith('.json'))
+
+        return [self._load_file(f'{config_path}/{file_name}') for file_name in file_names]
+
+    def _load_file(self, path: str) -> _ConfigFile:
+        status = os.stat(path)
+        key = (status.st_mtime_ns, status.st_size)
+
+        if (config_file := self._files.get(path)) and config_file.key == key:
+            return config_file
+
+        log.debug('Indexing target configuration file', file=path)
+
+        with open(path, 'r') as file:
+            content = json.load(file)
+
+        entries = {}
+
+        for entry in content if isinstance(content, list) else [content]:
+            if isinstance(entry, dict) and isinstance(entry.get('name'), str):
+                entries[entry['name']] = entry
+            else:
+                log.warning('Skipping target configuration without name', file=path)
+
+        config_file = self._files[path] = _ConfigFile(path, key, entries)
+
+        return config_file
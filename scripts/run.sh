@@ -4,8 +4,23 @@
 # SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
 # SPDX-License-Identifier: MIT
 
+installer="debian-package-installer@git+https://github.com/EffectiveRange/debian-package-installer.git@latest"
+
 cp -v files/*.json "${ROOTFS_DIR}/var/tmp/"
 
+rm -rf "${ROOTFS_DIR}/var/tmp/wheels"
+
+if [ -d files/wheels ]; then
+    cp -rv files/wheels "${ROOTFS_DIR}/var/tmp/"
+fi
+
+echo "${TARGET_HOSTNAME}" > "${ROOTFS_DIR}/etc/hostname"
+sed -i "s/^127\.0\.1\.1.*/127.0.1.1\t\t${TARGET_HOSTNAME}/" "${ROOTFS_DIR}/etc/hosts"
+
+if [ -f files/rc.local ]; then
+    install -m 755 files/rc.local "${ROOTFS_DIR}/etc/"
+fi
+
 on_chroot << EOF
 
 cd /var/tmp
@@ -14,7 +29,11 @@ apt list --installed > before-install.list
 
 python -m venv venv
 
-venv/bin/pip3 install debian-package-installer@git+https://github.com/EffectiveRange/debian-package-installer.git@latest
+if [ ! -d wheels ]; then
+    venv/bin/pip3 wheel --wheel-dir wheels ${installer}
+fi
+
+venv/bin/pip3 install --no-index --find-links wheels debian-package-installer
 
 venv/bin/debian-package-installer.py package-config.json --source-config source-config.json
 
@@ -24,6 +43,20 @@ touch /etc/first_boot
 
 EOF
 
+if [ -f files/wheelhouse ]; then
+    wheelhouse="$(cat files/wheelhouse)"
+    if [ ! -d "${wheelhouse}" ]; then
+        mkdir -p "$(dirname "${wheelhouse}")"
+        cp -r "${ROOTFS_DIR}/var/tmp/wheels" "${wheelhouse}.$$.tmp"
+        # Another build may have exported the wheelhouse meanwhile, its copy is kept and ours is discarded
+        if ! mv -T "${wheelhouse}.$$.tmp" "${wheelhouse}" 2>/dev/null; then
+            rm -rf "${wheelhouse}.$$.tmp"
+        fi
+    fi
+fi
+
+rm -rf "${ROOTFS_DIR}/var/tmp/wheels"
+
 mkdir -p "${DEPLOY_DIR}"
 cp -v "${ROOTFS_DIR}/var/tmp/before-install.list" "${DEPLOY_DIR}"
 cp -v "${ROOTFS_DIR}/var/tmp/after-install.list" "${DEPLOY_DIR}"
@@ -9,7 +9,10 @@ setup(
     packages=['image_generator'],
     scripts=['bin/raspbian-image-generator.py'],
     data_files=[
-        ('template', ['template/config.j2', 'template/first_boot.j2']),
+        (
+            'template',
+            ['template/config.j2', 'template/first_boot.j2', 'template/stage_snapshot.j2', 'template/stage_restore.j2'],
+        ),
         ('scripts', ['scripts/packages', 'scripts/run.sh']),
     ],
     install_requires=[
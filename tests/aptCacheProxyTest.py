@@ -0,0 +1,118 @@
+import os
+import threading
+import unittest
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from typing import Any
+from unittest import TestCase
+from urllib.error import HTTPError
+from urllib.request import build_opener, ProxyHandler
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+
+from image_generator import AptCacheProxy
+from tests import TEST_FILE_SYSTEM_ROOT
+
+
+class AptCacheProxyTest(TestCase):
+    REPOSITORY_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/repository'
+    CACHE_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/apt-cache'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(TEST_FILE_SYSTEM_ROOT)
+        os.makedirs(self.REPOSITORY_DIR)
+        create_file(f'{self.REPOSITORY_DIR}/package1.deb', b'1' * 1000)
+        create_file(f'{self.REPOSITORY_DIR}/package2.deb', b'2' * 1000)
+        create_file(f'{self.REPOSITORY_DIR}/Release', b'release')
+        handler = partial(QuietHTTPRequestHandler, directory=self.REPOSITORY_DIR)
+        self.repository = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.repository.serve_forever, daemon=True).start()
+        self.repository_url = f'http://127.0.0.1:{self.repository.server_address[1]}'
+
+    def tearDown(self) -> None:
+        self.repository.shutdown()
+        self.repository.server_close()
+
+    def test_serves_package_from_cache_after_first_download(self) -> None:
+        # Given
+        proxy = AptCacheProxy(self.CACHE_DIR, 10000, port=0)
+        opener = build_opener(ProxyHandler({'http': proxy.start()}))
+
+        # When
+        first = opener.open(f'{self.repository_url}/package1.deb').read()
+        os.remove(f'{self.REPOSITORY_DIR}/package1.deb')
+        second = opener.open(f'{self.repository_url}/package1.deb').read()
+        proxy.stop()
+
+        # Then
+        self.assertEqual(b'1' * 1000, first)
+        self.assertEqual(b'1' * 1000, second)
+        statistics = proxy.get_statistics()
+        self.assertEqual(1, statistics.hits)
+        self.assertEqual(1, statistics.misses)
+        self.assertEqual(1000, statistics.served_bytes)
+        self.assertEqual(1000, statistics.downloaded_bytes)
+
+    def test_passes_through_index_files(self) -> None:
+        # Given
+        proxy = AptCacheProxy(self.CACHE_DIR, 10000, port=0)
+        opener = build_opener(ProxyHandler({'http': proxy.start()}))
+
+        # When
+        result = opener.open(f'{self.repository_url}/Release').read()
+        proxy.stop()
+
+        # Then
+        self.assertEqual(b'release', result)
+        self.assertEqual(1, proxy.get_statistics().passthrough)
+        self.assertEqual(0, proxy.get_statistics().misses)
+
+    def test_forwards_upstream_error(self) -> None:
+        # Given
+        proxy = AptCacheProxy(self.CACHE_DIR, 10000, port=0)
+        opener = build_opener(ProxyHandler({'http': proxy.start()}))
+
+        # When
+        with self.assertRaises(HTTPError) as context:
+            opener.open(f'{self.repository_url}/missing.deb')
+        proxy.stop()
+
+        # Then
+        self.assertEqual(404, context.exception.code)
+        self.assertFalse(os.listdir(self.CACHE_DIR))
+
+    def test_evicts_least_recently_used_package_when_cache_is_full(self) -> None:
+        # Given
+        proxy = AptCacheProxy(self.CACHE_DIR, 1500, port=0)
+        opener = build_opener(ProxyHandler({'http': proxy.start()}))
+        opener.open(f'{self.repository_url}/package1.deb').read()
+
+        # When
+        opener.open(f'{self.repository_url}/package2.deb').read()
+        proxy.stop()
+
+        # Then
+        self.assertEqual(1, proxy.get_statistics().evictions)
+        self.assertFalse(os.path.exists(proxy.get_cache_path(f'{self.repository_url}/package1.deb')))
+        self.assertTrue(os.path.exists(proxy.get_cache_path(f'{self.repository_url}/package2.deb')))
+
+
+class QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def create_file(path: str, content: bytes) -> None:
+    with open(path, 'wb') as file:
+        file.write(content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import time
+import unittest
+from subprocess import CalledProcessError
+from unittest import TestCase
+
+from common_utility import copy_file
+from context_logger import setup_logging
+
+from image_generator import AsyncImageBuilder
+from tests import TEST_RESOURCE_ROOT, TEST_FILE_SYSTEM_ROOT
+
+
+class AsyncImageBuilderTest(TestCase):
+    PI_GEN_LOCATION = f'{TEST_FILE_SYSTEM_ROOT}/tmp/pi-gen'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        os.makedirs(self.PI_GEN_LOCATION, exist_ok=True)
+        copy_file(f'{TEST_RESOURCE_ROOT}/scripts/build.sh', self.PI_GEN_LOCATION)
+
+    def test_successful_build_reports_stage_transitions(self):
+        # Given
+        image_builder = AsyncImageBuilder(self.PI_GEN_LOCATION)
+        transitions: list[tuple[str, str]] = []
+
+        # When
+        asyncio.run(
+            image_builder.build_async(
+                f'/bin/bash ./build.sh 0 {self.PI_GEN_LOCATION}', lambda *transition: transitions.append(transition)
+            )
+        )
+
+        # Then
+        self.assertEqual(
+            [
+                ('Begin', 'build'),
+                ('Begin', 'stage0'),
+                ('End', 'stage0'),
+                ('Begin', 'stage1'),
+                ('End', 'stage1'),
+                ('Begin', 'stage2'),
+                ('End', 'stage2'),
+                ('End', 'build'),
+            ],
+            transitions,
+        )
+
+    def test_failing_build(self):
+        # Given
+        image_builder = AsyncImageBuilder(self.PI_GEN_LOCATION)
+
+        # When, Then
+        with self.assertRaises(CalledProcessError) as context:
+            asyncio.run(image_builder.build_async(f'/bin/bash ./build.sh 1 {self.PI_GEN_LOCATION}'))
+        self.assertIn('Build failed', context.exception.output)
+
+    def test_cancelled_build_terminates_process_group(self):
+        # Given
+        image_builder = AsyncImageBuilder(self.PI_GEN_LOCATION)
+        pid_file = f'{self.PI_GEN_LOCATION}/sleep.pid'
+        script = f'echo "[00:00:00] Begin {self.PI_GEN_LOCATION}"; sleep 30 & echo $! > {pid_file}; wait'
+        started = asyncio.Event()
+
+        async def build_and_cancel() -> None:
+            build = asyncio.create_task(
+                image_builder.build_async(f'/bin/bash -c \'{script}\'', lambda *_: started.set())
+            )
+            await asyncio.wait_for(started.wait(), 10)
+            await asyncio.sleep(0.2)
+            build.cancel()
+            await asyncio.gather(build, return_exceptions=True)
+
+        start_time = time.time()
+
+        # When
+        asyncio.run(build_and_cancel())
+
+        # Then
+        self.assertLess(time.time() - start_time, 10)
+        with open(pid_file) as file:
+            self.assertFalse(is_running(int(file.read())))
+
+
+def is_running(pid: int) -> bool:
+    try:
+        with open(f'/proc/{pid}/stat') as stat_file:
+            return stat_file.read().rpartition(')')[2].split()[0] != 'Z'
+    except OSError:
+        return False
+
+
+if __name__ == '__main__':
+    unittest.main()
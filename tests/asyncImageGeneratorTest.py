@@ -0,0 +1,156 @@
+import asyncio
+import unittest
+from datetime import datetime
+from typing import Callable
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from context_logger import setup_logging
+
+from image_generator import (
+    AsyncImageGenerator,
+    AsyncImageBuilder,
+    BuildEvent,
+    ImageGenerator,
+    ImageBuildContext,
+    ImageProperties,
+    TargetConfig,
+    IPhaseHook,
+    PhaseInstrumentation,
+)
+
+
+class AsyncImageGeneratorTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+
+    def test_generate_streams_build_events(self) -> None:
+        # Given
+        config = TargetConfig(name='test-target', version='1.0.0', reference='test-ref', packages=[])
+        image_generator = create_image_generator(config, up_to_date=False)
+        start_time = datetime.now()
+
+        async def build(command: str, stage_listener: Callable[[str, str], None]) -> datetime:
+            stage_listener('Begin', 'build')
+            await asyncio.sleep(0)
+            stage_listener('Begin', 'stage0')
+            stage_listener('End', 'stage0')
+            stage_listener('End', 'build')
+            return start_time
+
+        image_builder = MagicMock(spec=AsyncImageBuilder)
+        image_builder.build_async.side_effect = build
+        async_generator = AsyncImageGenerator(image_generator, image_builder)
+
+        # When
+        events = asyncio.run(collect_events(async_generator, 'test-target'))
+
+        # Then
+        self.assertEqual(
+            [
+                (BuildEvent.STARTED, None),
+                (BuildEvent.STAGE_BEGIN, 'build'),
+                (BuildEvent.STAGE_BEGIN, 'stage0'),
+                (BuildEvent.STAGE_END, 'stage0'),
+                (BuildEvent.STAGE_END, 'build'),
+                (BuildEvent.COMPLETED, None),
+            ],
+            [(event.type, event.stage) for event in events],
+        )
+        self.assertEqual(config, events[-1].config)
+        image_generator.complete.assert_called_once_with(image_generator.prepare.return_value, start_time)
+
+    def test_generate_instruments_build_phase(self) -> None:
+        # Given
+        config = TargetConfig(name='test-target', version='1.0.0', reference='test-ref', packages=[])
+        image_generator = create_image_generator(config, up_to_date=False)
+        phase_hook = MagicMock(spec=IPhaseHook)
+        image_generator.get_instrumentation.return_value = PhaseInstrumentation([phase_hook])
+        phases = []
+
+        async def build(command: str, stage_listener: Callable[[str, str], None]) -> datetime:
+            phases.extend(call.args[0].phase for call in phase_hook.before_phase.call_args_list)
+            await asyncio.sleep(0.05)
+            return datetime.now()
+
+        image_builder = MagicMock(spec=AsyncImageBuilder)
+        image_builder.build_async.side_effect = build
+        async_generator = AsyncImageGenerator(image_generator, image_builder)
+
+        # When
+        asyncio.run(collect_events(async_generator, 'test-target'))
+
+        # Then
+        self.assertEqual(['build'], phases)
+        event = phase_hook.after_phase.call_args.args[0]
+        self.assertEqual(('test-target', 'build', None), (event.target, event.phase, event.error))
+        self.assertGreaterEqual(event.duration, 0.05)
+
+    def test_generate_skips_up_to_date_image(self) -> None:
+        # Given
+        config = TargetConfig(name='test-target', version='1.0.0', reference='test-ref', packages=[])
+        image_generator = create_image_generator(config, up_to_date=True)
+        image_builder = MagicMock(spec=AsyncImageBuilder)
+        async_generator = AsyncImageGenerator(image_generator, image_builder)
+
+        # When
+        events = asyncio.run(collect_events(async_generator, 'test-target'))
+
+        # Then
+        self.assertEqual([BuildEvent.STARTED, BuildEvent.SKIPPED], [event.type for event in events])
+        image_builder.build_async.assert_not_called()
+        image_generator.complete.assert_not_called()
+
+    def test_closing_event_stream_cancels_build(self) -> None:
+        # Given
+        config = TargetConfig(name='test-target', version='1.0.0', reference='test-ref', packages=[])
+        image_generator = create_image_generator(config, up_to_date=False)
+        cancelled = []
+
+        async def build(command: str, stage_listener: Callable[[str, str], None]) -> datetime:
+            stage_listener('Begin', 'build')
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            return datetime.now()
+
+        image_builder = MagicMock(spec=AsyncImageBuilder)
+        image_builder.build_async.side_effect = build
+        async_generator = AsyncImageGenerator(image_generator, image_builder)
+
+        async def generate_until_first_stage() -> None:
+            events = async_generator.generate('test-target')
+            async for event in events:
+                if event.type == BuildEvent.STAGE_BEGIN:
+                    break
+            await events.aclose()  # type: ignore
+
+        # When
+        asyncio.run(generate_until_first_stage())
+
+        # Then
+        self.assertEqual([True], cancelled)
+        image_generator.complete.assert_not_called()
+
+
+async def collect_events(async_generator: AsyncImageGenerator, target: str) -> list[BuildEvent]:
+    return [event async for event in async_generator.generate(target)]
+
+
+def create_image_generator(config: TargetConfig, up_to_date: bool) -> MagicMock:
+    image_generator = MagicMock(spec=ImageGenerator)
+    image_properties = ImageProperties('/path/to/image', 'test-target-1.0.0', 'img.xz')
+    image_generator.prepare.return_value = ImageBuildContext(config, image_properties, up_to_date=up_to_date)
+    image_generator.complete.return_value = config
+    return image_generator
+
+
+if __name__ == '__main__':
+    unittest.main()
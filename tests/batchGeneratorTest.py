@@ -0,0 +1,154 @@
+import unittest
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from context_logger import setup_logging
+
+from image_generator import (
+    BatchGenerator,
+    IImageGeneratorFactory,
+    TargetConfig,
+    ImageGenerator,
+    ImageGeneratorFactory,
+    ITargetConfigLoader,
+)
+
+
+class BatchGeneratorTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+
+    def test_generates_targets_sequentially(self) -> None:
+        # Given
+        config_loader = create_config_loader()
+        batch_generator = BatchGenerator('/path/to/config', config_loader, FakeGeneratorFactory(), 1)
+
+        # When
+        results = batch_generator.generate(['target1', 'target2'])
+
+        # Then
+        self.assertEqual(['target1', 'target2'], [result.target for result in results])
+        self.assertTrue(all(result.success for result in results))
+        self.assertEqual(['1.0.0', '1.0.0'], [result.version for result in results])
+        self.assertEqual([0, 0], [result.worker_id for result in results])
+        config_loader.get_target_names.assert_not_called()
+
+    def test_generates_targets_in_parallel(self) -> None:
+        # Given
+        config_loader = create_config_loader()
+        batch_generator = BatchGenerator('/path/to/config', config_loader, FakeGeneratorFactory(), 2)
+
+        # When
+        results = batch_generator.generate(['target1', 'target2', 'target3'])
+
+        # Then
+        self.assertEqual(['target1', 'target2', 'target3'], [result.target for result in results])
+        self.assertTrue(all(result.success for result in results))
+        self.assertTrue(all(result.worker_id in [0, 1] for result in results))
+
+    def test_generates_all_targets_from_config(self) -> None:
+        # Given
+        config_loader = create_config_loader()
+        batch_generator = BatchGenerator('/path/to/config', config_loader, FakeGeneratorFactory(), 2)
+
+        # When
+        results = batch_generator.generate(['all'])
+
+        # Then
+        self.assertEqual(['target1', 'target2', 'target3'], [result.target for result in results])
+        config_loader.get_target_names.assert_called_once_with('/path/to/config')
+
+    def test_reports_failed_target(self) -> None:
+        # Given
+        config_loader = create_config_loader()
+        batch_generator = BatchGenerator('/path/to/config', config_loader, FakeGeneratorFactory(), 2)
+
+        # When
+        results = batch_generator.generate(['target1', 'invalid-target'])
+
+        # Then
+        self.assertTrue(results[0].success)
+        self.assertFalse(results[1].success)
+        self.assertEqual("AttributeError('Invalid target name or configuration list')", results[1].error)
+
+    def test_generates_targets_with_shared_base_stages_together(self) -> None:
+        # Given
+        config_loader = create_config_loader()
+        config_loader.targets[2].reference = 'test-ref-2'
+        generated_targets.clear()
+        batch_generator = BatchGenerator('/path/to/config', config_loader, FakeGeneratorFactory(), 1, True)
+
+        # When
+        results = batch_generator.generate(['target1', 'target3', 'target2'])
+
+        # Then
+        self.assertEqual(['target1', 'target3', 'target2'], [result.target for result in results])
+        self.assertEqual(['target1', 'target2', 'target3'], generated_targets)
+
+    def test_generates_group_members_in_parallel_after_group_leader_failed(self) -> None:
+        # Given
+        config_loader = create_config_loader()
+        config_loader.targets.insert(0, create_target_config('failing-target'))
+        batch_generator = BatchGenerator('/path/to/config', config_loader, FakeGeneratorFactory(), 2, True)
+
+        # When
+        results = batch_generator.generate(['all'])
+
+        # Then
+        self.assertEqual(['failing-target', 'target1', 'target2', 'target3'], [result.target for result in results])
+        self.assertEqual([False, True, True, True], [result.success for result in results])
+
+    def test_returns_worker_specific_path(self) -> None:
+        # When
+        result = [ImageGeneratorFactory.get_worker_path('/tmp/pi-gen', worker_id) for worker_id in range(3)]
+
+        # Then
+        self.assertEqual(['/tmp/pi-gen', '/tmp/pi-gen-1', '/tmp/pi-gen-2'], result)
+
+
+generated_targets: list[str] = []
+
+
+class FakeImageGenerator(object):
+
+    def generate(self, target_name: str) -> TargetConfig:
+        generated_targets.append(target_name)
+
+        if target_name.startswith('invalid'):
+            raise AttributeError('Invalid target name or configuration list')
+        if target_name.startswith('failing'):
+            raise RuntimeError('Failed to build image')
+
+        return create_target_config(target_name)
+
+
+class FakeGeneratorFactory(IImageGeneratorFactory):
+
+    def create(self, worker_id: int = 0) -> ImageGenerator:
+        return FakeImageGenerator()  # type: ignore
+
+
+def create_target_config(name: str) -> TargetConfig:
+    return TargetConfig(name=name, version='1.0.0', reference='test-ref', packages=[])
+
+
+def create_config_loader() -> MagicMock:
+    config_loader = MagicMock(spec=ITargetConfigLoader)
+    config_loader.targets = [create_target_config(f'target{index}') for index in range(1, 4)]
+    config_loader.get_target_names.side_effect = lambda path: [target.name for target in config_loader.targets]
+    config_loader.load_target.side_effect = lambda path, name: next(
+        (target for target in config_loader.targets if target.name == name), None
+    )
+    config_loader.get_base_layer.side_effect = lambda path, name: next(
+        (target.reference for target in config_loader.targets if target.name == name), None
+    )
+    return config_loader
+
+
+if __name__ == '__main__':
+    unittest.main()
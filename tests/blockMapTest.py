@@ -0,0 +1,64 @@
+import hashlib
+import os
+import re
+import unittest
+from unittest import TestCase
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+
+from image_generator import BlockMap
+from tests import TEST_FILE_SYSTEM_ROOT
+
+
+class BlockMapTest(TestCase):
+    IMAGE_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/block-map'
+    IMAGE_PATH = f'{IMAGE_DIR}/test-target.img'
+    BMAP_PATH = f'{IMAGE_DIR}/test-target.bmap'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(self.IMAGE_DIR)
+        os.makedirs(self.IMAGE_DIR)
+        with open(self.IMAGE_PATH, 'wb') as image_file:
+            image_file.write(b'1' * 4096)
+            image_file.seek(1024 * 1024)
+            image_file.write(b'2' * 8192)
+            image_file.truncate(4 * 1024 * 1024)
+
+    def test_creates_block_map_of_sparse_image(self) -> None:
+        # Given
+        block_map = BlockMap()
+
+        # When
+        block_map.create(self.IMAGE_PATH, self.BMAP_PATH)
+
+        # Then
+        with open(self.BMAP_PATH) as bmap_file:
+            bmap = bmap_file.read()
+        self.assertIn('<ImageSize> 4194304 </ImageSize>', bmap)
+        self.assertIn('<BlocksCount> 1024 </BlocksCount>', bmap)
+        self.assertIn('<MappedBlocksCount> 3 </MappedBlocksCount>', bmap)
+        self.assertIn(f'<Range chksum="{hashlib.sha256(b"1" * 4096).hexdigest()}"> 0 </Range>', bmap)
+        self.assertIn(f'<Range chksum="{hashlib.sha256(b"2" * 8192).hexdigest()}"> 256-257 </Range>', bmap)
+
+    def test_block_map_checksum_is_valid(self) -> None:
+        # Given
+        block_map = BlockMap()
+
+        # When
+        block_map.create(self.IMAGE_PATH, self.BMAP_PATH)
+
+        # Then
+        with open(self.BMAP_PATH) as bmap_file:
+            bmap = bmap_file.read()
+        checksum = re.search(r'<BmapFileChecksum> (\w+) </BmapFileChecksum>', bmap).group(1)  # type: ignore
+        self.assertEqual(hashlib.sha256(bmap.replace(checksum, '0' * 64).encode()).hexdigest(), checksum)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import os
+import subprocess
 import unittest
 from unittest import TestCase
+from unittest.mock import patch, MagicMock
 
 from common_utility import delete_directory
 from context_logger import setup_logging
@@ -8,8 +10,8 @@ from package_downloader import PackageConfig, ReleaseConfig
 from package_installer import SourceConfig
 from test_utility import compare_files
 
-from image_generator import BuildConfigurator, TargetConfig, BuildConfiguration
-from tests import TEST_RESOURCE_ROOT, TEST_FILE_SYSTEM_ROOT, create_pi_gen_tree
+from image_generator import BuildConfigurator, TargetConfig, BuildConfiguration, StageCache, InstallerWheelhouse
+from tests import TEST_RESOURCE_ROOT, TEST_FILE_SYSTEM_ROOT, RESOURCE_ROOT, create_pi_gen_tree
 
 
 class BuildConfiguratorTest(TestCase):
@@ -129,10 +131,89 @@ class BuildConfiguratorTest(TestCase):
         self.assertTrue(
             compare_files(
                 f'{TEST_RESOURCE_ROOT}/expected/first-boot.sh',
+                f'{generated_stage_path}/files/rc.local',
+            )
+        )
+        self.assertTrue(
+            compare_files(
+                f'{TEST_RESOURCE_ROOT}/config/rc.local',
                 f'{self.PI_GEN_LOCATION}/stage2/01-sys-tweaks/files/rc.local',
             )
         )
 
+    def test_build_configuration_generated_with_apt_proxy(self) -> None:
+        # Given
+        configuration = BuildConfiguration('xz', True, True, '../template/config.j2', apt_proxy='http://127.0.0.1:3142')
+        build_configurator = BuildConfigurator(TEST_RESOURCE_ROOT, self.PI_GEN_LOCATION, configuration)
+        config = create_target_config()
+
+        # When
+        build_configurator.configure(config)
+
+        # Then
+        with open(f'{self.PI_GEN_LOCATION}/config') as config_file:
+            self.assertTrue(
+                config_file.read().endswith('STAGE_LIST="stage0 stage1 stage2"\nAPT_PROXY=http://127.0.0.1:3142\n')
+            )
+
+    def test_build_configuration_generated_with_stage_cache(self) -> None:
+        # Given
+        configuration = BuildConfiguration('xz', True, True, '../template/config.j2')
+        stage_cache = StageCache(f'{TEST_FILE_SYSTEM_ROOT}/tmp/stage-cache', RESOURCE_ROOT)
+        build_configurator = BuildConfigurator(
+            TEST_RESOURCE_ROOT, self.PI_GEN_LOCATION, configuration, stage_cache=stage_cache
+        )
+        config = create_target_config()
+
+        # When
+        build_configurator.configure(config)
+
+        # Then
+        self.assertTrue(os.path.exists(f'{self.PI_GEN_LOCATION}/stage2/02-stage-snapshot/00-run.sh'))
+        generated_stage_path = f'{self.PI_GEN_LOCATION}/stage2/03-install-packages'
+        self.assertTrue(os.path.exists(f'{generated_stage_path}/00-packages'))
+        self.assertTrue(os.path.exists(f'{generated_stage_path}/01-run.sh'))
+        self.assertTrue(compare_files(f'{TEST_RESOURCE_ROOT}/expected/config', f'{self.PI_GEN_LOCATION}/config'))
+
+    @patch('subprocess.run')
+    def test_build_configuration_generated_with_installer_wheelhouse(self, run: MagicMock) -> None:
+        # Given
+        run.return_value = subprocess.CompletedProcess([], 0, '0123abcd\trefs/tags/latest\n', '')
+        configuration = BuildConfiguration('xz', True, True, '../template/config.j2')
+        wheelhouse = InstallerWheelhouse(f'{TEST_FILE_SYSTEM_ROOT}/tmp/installer-cache', RESOURCE_ROOT)
+        build_configurator = BuildConfigurator(
+            TEST_RESOURCE_ROOT, self.PI_GEN_LOCATION, configuration, wheelhouse=wheelhouse
+        )
+        config = create_target_config()
+
+        # When
+        build_configurator.configure(config)
+
+        # Then
+        with open(f'{self.PI_GEN_LOCATION}/stage2/02-install-packages/files/wheelhouse') as wheelhouse_file:
+            self.assertEqual(f'{wheelhouse.get_wheelhouse_path(config)}\n', wheelhouse_file.read())
+
+    def test_build_configuration_creates_executable_scripts_in_place(self) -> None:
+        # Given
+        configuration = BuildConfiguration('xz', True, True, '../template/config.j2')
+        build_configurator = BuildConfigurator(TEST_RESOURCE_ROOT, self.PI_GEN_LOCATION, configuration)
+        config = create_target_config()
+        config.post_install = ['cmd1']
+        build_configurator.configure(config)
+
+        # When
+        build_configurator.configure(config)
+
+        # Then
+        stage_path = f'{self.PI_GEN_LOCATION}/stage2'
+        self.assertEqual(
+            ['00-packages', '01-run.sh', '02-run-chroot.sh', 'files'],
+            sorted(os.listdir(f'{stage_path}/03-install-packages')),
+        )
+        for script in ['00-packages', '01-run.sh', '02-run-chroot.sh']:
+            self.assertEqual(0o755, os.stat(f'{stage_path}/03-install-packages/{script}').st_mode & 0o777)
+        self.assertFalse(os.path.exists(f'{stage_path}/.install-packages.tmp'))
+
 
 def create_target_config() -> TargetConfig:
     return TargetConfig(
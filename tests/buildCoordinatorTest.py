@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import time
+import unittest
+from unittest import TestCase
+from typing import Any
+from unittest.mock import MagicMock, patch
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+
+from image_generator import BuildCoordinator, BuildDaemon, BuildJob, ITargetConfigLoader, TargetConfigLoader
+from tests import TEST_FILE_SYSTEM_ROOT
+from tests.buildDaemonTest import FakeGeneratorFactory, WorkspaceGeneratorFactory
+
+
+class BuildCoordinatorTest(TestCase):
+    WORKER_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/worker'
+    OUTPUT_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/coordinator-image'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(self.WORKER_DIR)
+        delete_directory(self.OUTPUT_DIR)
+
+    def test_targets_built_on_workers_and_artifacts_received(self) -> None:
+        # Given
+        coordinator = BuildCoordinator(
+            '/path/to/config', create_config_loader(), self.OUTPUT_DIR, port=0, poll_interval=0.05
+        )
+        url = coordinator.start()
+        workers = [
+            BuildDaemon(FakeGeneratorFactory(f'{self.WORKER_DIR}-{index}'), 1, port=0, coordinator_url=url)
+            for index in range(2)
+        ]
+        for worker in workers:
+            worker.start()
+        wait_for_workers(coordinator, 2)
+
+        # When
+        results = coordinator.generate(['slow-a1', 'a2', 'b1'])
+        for worker in workers:
+            worker.stop()
+        coordinator.stop()
+
+        # Then
+        self.assertEqual(['slow-a1', 'a2', 'b1'], [result.target for result in results])
+        self.assertTrue(all(result.success and result.version == '1.0.0' for result in results))
+        self.assertEqual(results[0].worker_id, results[1].worker_id)
+        self.assertNotEqual(results[0].worker_id, results[2].worker_id)
+        for target in ['slow-a1', 'a2', 'b1']:
+            with open(f'{self.OUTPUT_DIR}/{target}/1.0.0/{target}-1.0.0.img.xz', 'rb') as image_file:
+                self.assertEqual(f'{target} image'.encode(), image_file.read())
+            self.assertEqual(
+                sorted(f'{target}-1.0.0.{extension}' for extension in ['img.xz', 'json', 'sha256']),
+                sorted(os.listdir(f'{self.OUTPUT_DIR}/{target}/1.0.0')),
+            )
+
+    def test_builds_targets_sharing_base_layer_in_reset_workspace(self) -> None:
+        # Given
+        root_dir = f'{TEST_FILE_SYSTEM_ROOT}/tmp/coordinator-workspace'
+        generator_factory = WorkspaceGeneratorFactory(root_dir)
+        config_path, config_loader = f'{root_dir}/target-config.json', TargetConfigLoader()
+        coordinator = BuildCoordinator(config_path, config_loader, self.OUTPUT_DIR, port=0, poll_interval=0.05)
+        url = coordinator.start()
+        worker = BuildDaemon(generator_factory, 1, port=0, coordinator_url=url)
+        worker.start()
+        wait_for_workers(coordinator, 1)
+
+        # When
+        results = coordinator.generate(['a1', 'a2'])
+        worker.stop()
+        coordinator.stop()
+
+        # Then
+        self.assertEqual(
+            config_loader.get_base_layer(config_path, 'a1'), config_loader.get_base_layer(config_path, 'a2')
+        )
+        self.assertTrue(all(result.success for result in results))
+        with open(f'{self.OUTPUT_DIR}/a2/1.0.0/a2-1.0.0.img') as image_file:
+            workspace = json.load(image_file)
+        self.assertEqual(['01-sys-tweaks', '02-install-packages'], workspace['stage2'])
+        self.assertEqual([[{'package': 'package-a2', 'version': '1.0.0'}]], workspace['packages'])
+        self.assertEqual(1, workspace['cmdline'].count('quiet'))
+
+    def test_rejects_artifact_with_checksum_mismatch(self) -> None:
+        # Given
+        coordinator = BuildCoordinator(
+            '/path/to/config', create_config_loader(), self.OUTPUT_DIR, port=0, poll_interval=0.05
+        )
+        url = coordinator.start()
+        worker = BuildDaemon(FakeGeneratorFactory(self.WORKER_DIR), 1, port=0, coordinator_url=url)
+        worker.start()
+        wait_for_workers(coordinator, 1)
+
+        # When
+        results = coordinator.generate(['corrupt-a1', 'failing-b1'])
+        worker.stop()
+        coordinator.stop()
+
+        # Then
+        self.assertFalse(results[0].success)
+        self.assertEqual("ValueError('Artifact checksum mismatch')", results[0].error)
+        self.assertFalse(os.path.exists(f'{self.OUTPUT_DIR}/corrupt-a1/1.0.0/corrupt-a1-1.0.0.img.xz'))
+        self.assertEqual([], [name for name in os.listdir(f'{self.OUTPUT_DIR}/corrupt-a1/1.0.0') if 'tmp' in name])
+        self.assertFalse(results[1].success)
+        self.assertEqual("RuntimeError('Failed to build image')", results[1].error)
+
+    def test_rejects_file_names_outside_output_directory(self) -> None:
+        # Given
+        coordinator = BuildCoordinator('/path/to/config', create_config_loader(), self.OUTPUT_DIR, poll_interval=0.05)
+        coordinator.register('http://127.0.0.1:1', 2)
+        jobs = [
+            create_job('../../a1', '/tmp/a1.img.xz', ['a1.img.xz']),
+            create_job('1.0.0', '/tmp/b1.img.xz', ['b1.img.xz', '../../b1.json']),
+        ]
+
+        # When
+        with patch.object(BuildCoordinator, '_run_job', side_effect=jobs):
+            results = coordinator.generate(['a1', 'b1'])
+
+        # Then
+        self.assertEqual(["ValueError('Invalid file name')"] * 2, [result.error for result in results])
+        self.assertFalse(os.path.exists(self.OUTPUT_DIR))
+
+    def test_expired_worker_not_assigned(self) -> None:
+        # Given
+        coordinator = BuildCoordinator(
+            '/path/to/config', create_config_loader(), self.OUTPUT_DIR, port=0, poll_interval=0.05
+        )
+        url = coordinator.start()
+        workers = [
+            BuildDaemon(FakeGeneratorFactory(f'{self.WORKER_DIR}-{index}'), 1, port=0, coordinator_url=url)
+            for index in range(2)
+        ]
+        for worker in workers:
+            worker.start()
+        wait_for_workers(coordinator, 2)
+        expired, active = coordinator.get_workers()
+        expired.last_seen = 0.0
+
+        # When
+        results = coordinator.generate(['a1', 'b1'])
+        for worker in workers:
+            worker.stop()
+        coordinator.stop()
+
+        # Then
+        self.assertTrue(all(result.success and result.worker_id == active.id for result in results))
+        self.assertEqual([active], coordinator.get_workers())
+
+    def test_requeues_target_when_worker_unreachable(self) -> None:
+        # Given
+        coordinator = BuildCoordinator(
+            '/path/to/config', create_config_loader(), self.OUTPUT_DIR, port=0, poll_interval=0.05
+        )
+        url = coordinator.start()
+        unreachable = coordinator.register('http://127.0.0.1:1', 1)
+        worker = BuildDaemon(FakeGeneratorFactory(self.WORKER_DIR), 1, port=0, coordinator_url=url)
+        worker.start()
+        wait_for_workers(coordinator, 2)
+
+        # When
+        results = coordinator.generate(['a1'])
+        worker.stop()
+        coordinator.stop()
+
+        # Then
+        self.assertTrue(results[0].success)
+        self.assertNotEqual(unreachable.id, results[0].worker_id)
+        self.assertNotIn(unreachable, coordinator.get_workers())
+        self.assertTrue(os.path.exists(f'{self.OUTPUT_DIR}/a1/1.0.0/a1-1.0.0.img.xz'))
+
+    def test_fails_targets_when_no_worker_registered(self) -> None:
+        # Given
+        coordinator = BuildCoordinator(
+            '/path/to/config', create_config_loader(), self.OUTPUT_DIR, port=0, worker_timeout=0.2, poll_interval=0.05
+        )
+        coordinator.start()
+
+        # When
+        results = coordinator.generate(['a1'])
+        coordinator.stop()
+
+        # Then
+        self.assertFalse(results[0].success)
+        self.assertEqual('No build worker registered', results[0].error)
+
+
+def create_config_loader() -> MagicMock:
+    config_loader = MagicMock(spec=ITargetConfigLoader)
+    config_loader.get_base_layer.side_effect = lambda path, name: f'ref-{name[-2]}'
+    return config_loader
+
+
+def create_job(version: str, image: str, names: list[str]) -> dict[str, Any]:
+    artifacts = [{'name': name, 'sha256': hashlib.sha256(b'').hexdigest()} for name in names]
+    return {'id': 1, 'state': BuildJob.SUCCEEDED, 'version': version, 'image': image, 'artifacts': artifacts}
+
+
+def wait_for_workers(coordinator: BuildCoordinator, count: int) -> None:
+    while len(coordinator.get_workers()) < count:
+        time.sleep(0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,334 @@
+import hashlib
+import json
+import os
+import time
+import unittest
+from datetime import datetime
+from typing import Optional
+from unittest import TestCase
+from concurrent.futures.process import BrokenProcessPool
+from urllib.error import HTTPError
+from urllib.request import urlopen, Request
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+from git import Repo
+
+from image_generator import (
+    BuildDaemon,
+    BuildJob,
+    IImageGeneratorFactory,
+    ImageGenerator,
+    ImageProperties,
+    TargetConfig,
+    IImageBuilder,
+    IDependencyInstaller,
+    RepositoryManager,
+    BuildConfiguration,
+    BuildConfigurator,
+    BuildInitializer,
+    TargetConfigLoader,
+)
+from tests import TEST_FILE_SYSTEM_ROOT, RESOURCE_ROOT, create_pi_gen_tree
+
+
+class BuildDaemonTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+
+    def test_builds_submitted_job_and_returns_image_path(self) -> None:
+        # Given
+        build_daemon = BuildDaemon(FakeGeneratorFactory(), 2, port=0)
+        url = build_daemon.start()
+
+        # When
+        job = post_json(f'{url}/jobs', {'target': 'target1'})
+        result = wait_for_job(url, job['id'])
+        build_daemon.stop()
+
+        # Then
+        self.assertEqual(BuildJob.SUCCEEDED, result['state'])
+        self.assertEqual('1.0.0', result['version'])
+        self.assertEqual('/path/to/image/target1/1.0.0/target1-1.0.0.img.xz', result['image'])
+
+    def test_serves_image_artifacts_with_checksums(self) -> None:
+        # Given
+        output_dir = f'{TEST_FILE_SYSTEM_ROOT}/tmp/daemon-image'
+        delete_directory(output_dir)
+        build_daemon = BuildDaemon(FakeGeneratorFactory(output_dir), 1, port=0)
+        url = build_daemon.start()
+        job = post_json(f'{url}/jobs', {'target': 'target1'})
+        result = wait_for_job(url, job['id'])
+
+        # When
+        with urlopen(f'{url}/jobs/{job["id"]}/artifacts/target1-1.0.0.img.xz') as response:
+            image = response.read()
+        with self.assertRaises(HTTPError) as context:
+            urlopen(f'{url}/jobs/{job["id"]}/artifacts/..%2F..%2Ftarget1-1.0.0.img.xz')
+        build_daemon.stop()
+
+        # Then
+        self.assertEqual(b'target1 image', image)
+        self.assertEqual(404, context.exception.code)
+        self.assertEqual(
+            [
+                {'name': 'target1-1.0.0.img.xz', 'size': 13, 'sha256': hashlib.sha256(b'target1 image').hexdigest()},
+                {'name': 'target1-1.0.0.json', 'size': 3, 'sha256': hashlib.sha256(b'{}\n').hexdigest()},
+                {
+                    'name': 'target1-1.0.0.sha256',
+                    'size': 87,
+                    'sha256': hashlib.sha256(
+                        f'{hashlib.sha256(b"target1 image").hexdigest()}  target1-1.0.0.img.xz\n'.encode()
+                    ).hexdigest(),
+                },
+            ],
+            result['artifacts'],
+        )
+
+    def test_reports_failed_job(self) -> None:
+        # Given
+        build_daemon = BuildDaemon(FakeGeneratorFactory(), 1, port=0)
+        url = build_daemon.start()
+
+        # When
+        job = post_json(f'{url}/jobs', {'target': 'failing-target'})
+        result = wait_for_job(url, job['id'])
+        build_daemon.stop()
+
+        # Then
+        self.assertEqual(BuildJob.FAILED, result['state'])
+        self.assertEqual("RuntimeError('Failed to build image')", result['error'])
+
+    def test_starts_queued_jobs_by_priority(self) -> None:
+        # Given
+        build_daemon = BuildDaemon(FakeGeneratorFactory(), 1, port=0)
+        build_daemon.start()
+        slow_job = build_daemon.submit('slow-target')
+        while slow_job.state != BuildJob.RUNNING:
+            time.sleep(0.01)
+        low_priority_job = build_daemon.submit('target1')
+        high_priority_job = build_daemon.submit('target2', priority=10)
+
+        # When
+        while build_daemon.get_job(low_priority_job.id).state != BuildJob.SUCCEEDED:  # type: ignore
+            time.sleep(0.05)
+        build_daemon.stop()
+
+        # Then
+        self.assertLess(slow_job.started, high_priority_job.started)  # type: ignore
+        self.assertLess(high_priority_job.started, low_priority_job.started)  # type: ignore
+
+    def test_recreates_worker_pool_when_worker_process_died(self) -> None:
+        # Given
+        build_daemon = BuildDaemon(FakeGeneratorFactory(), 1, port=0)
+        url = build_daemon.start()
+        crashed_job = post_json(f'{url}/jobs', {'target': 'crashing-target'})
+        crashed_result = wait_for_job(url, crashed_job['id'])
+
+        # When
+        job = post_json(f'{url}/jobs', {'target': 'target1'})
+        result = wait_for_job(url, job['id'])
+        build_daemon.stop()
+
+        # Then
+        self.assertEqual(BuildJob.FAILED, crashed_result['state'])
+        self.assertIn('BrokenProcessPool', crashed_result['error'])
+        self.assertEqual(BuildJob.SUCCEEDED, result['state'])
+
+    def test_start_fails_when_workspace_preparation_fails(self) -> None:
+        # Given
+        build_daemon = BuildDaemon(FailingGeneratorFactory(), 1, port=0)
+
+        # When, Then
+        self.assertRaises(BrokenProcessPool, build_daemon.start)
+
+    def test_resets_workspace_between_jobs(self) -> None:
+        # Given
+        root_dir = f'{TEST_FILE_SYSTEM_ROOT}/tmp/daemon-workspace'
+        build_daemon = BuildDaemon(WorkspaceGeneratorFactory(root_dir), 1, port=0)
+        url = build_daemon.start()
+
+        # When
+        results = [wait_for_job(url, post_json(f'{url}/jobs', {'target': target})['id']) for target in ['a1', 'b1']]
+        build_daemon.stop()
+
+        # Then
+        self.assertTrue(all(result['state'] == BuildJob.SUCCEEDED for result in results))
+        with open(results[1]['image']) as image_file:
+            workspace = json.load(image_file)
+        self.assertEqual(['01-sys-tweaks', '02-install-packages'], workspace['stage2'])
+        self.assertEqual([[{'package': 'package-b1', 'version': '1.0.0'}]], workspace['packages'])
+        self.assertTrue(workspace['cmdline'].endswith(' splash\n'))
+        self.assertNotIn('quiet', workspace['cmdline'])
+
+    def test_rejects_invalid_job_request(self) -> None:
+        # Given
+        build_daemon = BuildDaemon(FakeGeneratorFactory(), 1, port=0)
+        url = build_daemon.start()
+
+        # When
+        with self.assertRaises(HTTPError) as context:
+            post_json(f'{url}/jobs', {'priority': 1})
+        build_daemon.stop()
+
+        # Then
+        self.assertEqual(400, context.exception.code)
+        self.assertEqual([], build_daemon.get_jobs())
+
+
+class FakeImageGenerator(object):
+
+    def __init__(self, output_dir: Optional[str]) -> None:
+        self._output_dir = output_dir
+
+    def generate(self, target_name: str) -> TargetConfig:
+        if target_name.startswith('failing'):
+            raise RuntimeError('Failed to build image')
+        if target_name.startswith('slow'):
+            time.sleep(0.5)
+        if target_name.startswith('crashing'):
+            os._exit(1)
+
+        config = TargetConfig(name=target_name, version='1.0.0', reference='test-ref', packages=[])
+
+        if self._output_dir:
+            create_image_files(config, self.get_image_properties(config))
+
+        return config
+
+    def get_image_properties(self, config: TargetConfig) -> ImageProperties:
+        name = f'{config.name}-{config.version}'
+        output_dir = self._output_dir if self._output_dir else '/path/to/image'
+        return ImageProperties(f'{output_dir}/{config.name}/{config.version}', name, 'img.xz')
+
+
+class FakeGeneratorFactory(IImageGeneratorFactory):
+
+    def __init__(self, output_dir: Optional[str] = None) -> None:
+        self._output_dir = output_dir
+
+    def create(self, worker_id: int = 0) -> ImageGenerator:
+        return FakeImageGenerator(self._output_dir)  # type: ignore
+
+
+class WorkspaceImageBuilder(IImageBuilder):
+
+    def __init__(self, repository_path: str) -> None:
+        self._repository_path = repository_path
+
+    def build(self, command: str = './build.sh') -> datetime:
+        start_time = datetime.now()
+        stage_dir = f'{self._repository_path}/stage2'
+
+        with open(f'{self._repository_path}/config') as config_file:
+            target = dict(line.split('=', 1) for line in config_file.read().splitlines())['IMG_NAME']
+
+        packages = []
+        for sub_stage in sorted(os.listdir(stage_dir)):
+            if os.path.exists(package_path := f'{stage_dir}/{sub_stage}/files/package-config.json'):
+                with open(package_path) as package_file:
+                    packages.append(json.load(package_file))
+
+        with open(f'{self._repository_path}/stage1/00-boot-files/files/cmdline.txt') as cmdline_file:
+            workspace = {'stage2': sorted(os.listdir(stage_dir)), 'packages': packages, 'cmdline': cmdline_file.read()}
+
+        with open(f'{self._repository_path}/deploy/image_{start_time:%Y-%m-%d}-{target}-lite.img', 'w') as image_file:
+            json.dump(workspace, image_file)
+
+        return start_time
+
+
+class NoDependencyInstaller(IDependencyInstaller):
+
+    def install(self, dependency_list: str) -> None:
+        pass
+
+
+class WorkspaceGeneratorFactory(IImageGeneratorFactory):
+
+    def __init__(self, root_dir: str) -> None:
+        self._root_dir = root_dir
+        create_workspace_origin(f'{root_dir}/origin', f'{root_dir}/target-config.json')
+
+    def create(self, worker_id: int = 0) -> ImageGenerator:
+        repository_path = f'{self._root_dir}/pi-gen-{worker_id}'
+        repository_manager = RepositoryManager(f'{self._root_dir}/origin', f'{self._root_dir}/pi-gen.git')
+        repository = repository_manager.create_worktree(repository_path)
+        configuration = BuildConfiguration('none', True, True, 'template/config.j2')
+        configurator = BuildConfigurator(RESOURCE_ROOT, repository_path, configuration)
+        initializer = BuildInitializer(repository, NoDependencyInstaller(), configurator, repository_manager)
+
+        return ImageGenerator(
+            f'{self._root_dir}/target-config.json',
+            TargetConfigLoader(),
+            initializer,
+            WorkspaceImageBuilder(repository_path),
+            f'{self._root_dir}/image',
+        )
+
+
+class FailingGeneratorFactory(IImageGeneratorFactory):
+
+    def create(self, worker_id: int = 0) -> ImageGenerator:
+        raise RuntimeError('Failed to prepare workspace')
+
+
+def create_image_files(config: TargetConfig, image_properties: ImageProperties) -> None:
+    os.makedirs(image_properties.directory, exist_ok=True)
+    image = f'{config.name} image'.encode()
+    with open(image_properties.path, 'wb') as image_file:
+        image_file.write(image)
+    with open(f'{image_properties.directory}/{image_properties.name}.json', 'w') as config_file:
+        config_file.write('{}\n')
+    with open(f'{image_properties.directory}/{image_properties.name}.sha256', 'w') as checksum_file:
+        checksum = hashlib.sha256(b'' if config.name.startswith('corrupt') else image).hexdigest()
+        checksum_file.write(f'{checksum}  {image_properties.file_name}\n')
+
+
+def create_workspace_origin(path: str, config_path: str) -> None:
+    delete_directory(os.path.dirname(path))
+    create_pi_gen_tree(path)
+    with open(f'{path}/.gitignore', 'w') as ignore_file:
+        ignore_file.write('config\nSKIP\n')
+    origin = Repo.init(path, initial_branch='master')
+    origin.git.config('user.email', 'test@example.com')
+    origin.git.config('user.name', 'Test')
+    origin.git.add('.')
+    origin.git.commit('-m', 'Initial commit')
+
+    targets = [
+        {
+            'name': name,
+            'version': '1.0.0',
+            'reference': 'master',
+            'packages': [{'package': f'package-{name}', 'version': '1.0.0'}],
+            'boot_cmdline': [cmdline],
+        }
+        for name, cmdline in [('a1', 'quiet'), ('a2', 'quiet'), ('b1', 'splash')]
+    ]
+    with open(config_path, 'w') as config_file:
+        json.dump(targets, config_file)
+
+
+def post_json(url: str, content: dict) -> dict:
+    request = Request(url, json.dumps(content).encode(), {'Content-Type': 'application/json'})
+    with urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def wait_for_job(url: str, job_id: str) -> dict:
+    while True:
+        with urlopen(f'{url}/jobs/{job_id}') as response:
+            job = json.loads(response.read())
+        if job['state'] in [BuildJob.SUCCEEDED, BuildJob.FAILED]:
+            return job
+        time.sleep(0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
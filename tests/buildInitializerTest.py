@@ -4,10 +4,16 @@ from unittest.mock import MagicMock
 
 from common_utility import delete_directory
 from context_logger import setup_logging
-from git import Repo
-from package_installer import IAptInstaller
-
-from image_generator import IBuildConfigurator, TargetConfig, BuildConfiguration, BuildInitializer
+from git import Repo, GitCommandError
+
+from image_generator import (
+    IBuildConfigurator,
+    TargetConfig,
+    BuildConfiguration,
+    BuildInitializer,
+    IDependencyInstaller,
+    IRepositoryManager,
+)
 from tests import TEST_RESOURCE_ROOT, TEST_FILE_SYSTEM_ROOT, create_pi_gen_tree
 
 
@@ -25,8 +31,8 @@ class BuildInitializerTest(TestCase):
 
     def test_returns_repository_working_tree(self) -> None:
         # Given
-        repository, apt_installer, configurator = create_mocks()
-        build_initializer = BuildInitializer(repository, apt_installer, configurator)
+        repository, dependency_installer, configurator = create_mocks()
+        build_initializer = BuildInitializer(repository, dependency_installer, configurator)
 
         # When
         result = build_initializer.get_repository_path()
@@ -36,8 +42,8 @@ class BuildInitializerTest(TestCase):
 
     def test_returns_build_configuration(self) -> None:
         # Given
-        repository, apt_installer, configurator = create_mocks()
-        build_initializer = BuildInitializer(repository, apt_installer, configurator)
+        repository, dependency_installer, configurator = create_mocks()
+        build_initializer = BuildInitializer(repository, dependency_installer, configurator)
 
         # When
         result = build_initializer.get_configuration()
@@ -48,54 +54,75 @@ class BuildInitializerTest(TestCase):
     def test_build_successfully_initialized(self) -> None:
         # Given
         config = TargetConfig(name='test-target', version='1.0.0', reference='test-ref', sources=[], packages=[])
-        repository, apt_installer, configurator = create_mocks()
-        build_initializer = BuildInitializer(repository, apt_installer, configurator)
+        repository, dependency_installer, configurator = create_mocks()
+        build_initializer = BuildInitializer(repository, dependency_installer, configurator)
 
         # When
         build_initializer.initialize(config)
 
         # Then
-        repository.git.checkout.assert_called_once_with('test-ref')
-        apt_installer.install.assert_called()
+        repository.git.checkout.assert_called_once_with('--detach', 'test-commit')
+        dependency_installer.install.assert_called_once_with(f'{self.PI_GEN_LOCATION}/depends')
         configurator.configure.assert_called_once_with(config)
 
+    def test_resets_worktree_and_fetches_reference_with_repository_manager(self) -> None:
+        # Given
+        config = TargetConfig(name='test-target', version='1.0.0', reference='test-ref', sources=[], packages=[])
+        repository, dependency_installer, configurator = create_mocks()
+        repository_manager = MagicMock(spec=IRepositoryManager)
+        build_initializer = BuildInitializer(repository, dependency_installer, configurator, repository_manager)
+
+        # When
+        build_initializer.initialize(config)
+
+        # Then
+        repository_manager.reset_worktree.assert_called_once_with(repository)
+        repository_manager.fetch_reference.assert_called_once_with('test-ref')
+        repository.git.checkout.assert_called_once_with('--detach', 'test-commit')
+
     def test_raises_error_when_target_reference_not_found(self) -> None:
         # Given
         config = TargetConfig(name='test-target', version='1.0.0', reference='invalid-ref', sources=[], packages=[])
-        repository, apt_installer, configurator = create_mocks()
-        build_initializer = BuildInitializer(repository, apt_installer, configurator)
+        repository, dependency_installer, configurator = create_mocks()
+        build_initializer = BuildInitializer(repository, dependency_installer, configurator)
 
         # When
         self.assertRaises(AttributeError, build_initializer.initialize, config)
 
         # Then
         repository.git.checkout.assert_not_called()
-        apt_installer.install.assert_not_called()
+        dependency_installer.install.assert_not_called()
         configurator.configure.assert_not_called()
 
     def test_raises_error_when_failed_to_install_build_dependency(self) -> None:
         # Given
         config = TargetConfig(name='test-target', version='1.0.0', reference='test-ref', sources=[], packages=[])
-        repository, apt_installer, configurator = create_mocks()
-        apt_installer.install.side_effect = [True, False]
-        build_initializer = BuildInitializer(repository, apt_installer, configurator)
+        repository, dependency_installer, configurator = create_mocks()
+        dependency_installer.install.side_effect = RuntimeError('Dependency not installed')
+        build_initializer = BuildInitializer(repository, dependency_installer, configurator)
 
         # When
         self.assertRaises(RuntimeError, build_initializer.initialize, config)
 
         # Then
-        repository.git.checkout.assert_called_once_with('test-ref')
+        repository.git.checkout.assert_called_once_with('--detach', 'test-commit')
         configurator.configure.assert_not_called()
 
 
 def create_mocks() -> tuple:
     repository = MagicMock(spec=Repo)
-    repository.git.show_ref.return_value = 'test-ref'
+    repository.git.rev_parse.side_effect = resolve_reference
     repository.working_tree_dir = f'{TEST_FILE_SYSTEM_ROOT}/tmp/pi-gen'
-    apt_installer = MagicMock(spec=IAptInstaller)
+    dependency_installer = MagicMock(spec=IDependencyInstaller)
     configurator = MagicMock(spec=IBuildConfigurator)
     configurator.get_configuration.return_value = BuildConfiguration('xz', True, True, 'config/config.template')
-    return repository, apt_installer, configurator
+    return repository, dependency_installer, configurator
+
+
+def resolve_reference(*args: str) -> str:
+    if args[-1] != 'test-ref^{commit}':
+        raise GitCommandError('rev-parse', 1)
+    return 'test-commit'
 
 
 if __name__ == '__main__':
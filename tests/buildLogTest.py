@@ -0,0 +1,75 @@
+import gzip
+import os
+import unittest
+from unittest import TestCase
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+
+from image_generator import BuildLog
+from tests import TEST_FILE_SYSTEM_ROOT
+
+
+class BuildLogTest(TestCase):
+    LOG_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/log'
+    LOG_PATH = f'{LOG_DIR}/pi-gen.log.gz'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(self.LOG_DIR)
+
+    def test_writes_compressed_log(self) -> None:
+        # Given
+        build_log = BuildLog(self.LOG_PATH)
+
+        # When
+        build_log.open()
+        build_log.write(b'line1\nline2\n')
+        build_log.close()
+
+        # Then
+        with gzip.open(self.LOG_PATH) as log_file:
+            self.assertEqual(b'line1\nline2\n', log_file.read())
+
+    def test_rotates_log_of_previous_build(self) -> None:
+        # Given
+        build_log = BuildLog(self.LOG_PATH)
+        build_log.open()
+        build_log.write(b'build1\n')
+        build_log.close()
+
+        # When
+        build_log.open()
+        build_log.write(b'build2\n')
+        build_log.close()
+
+        # Then
+        with gzip.open(self.LOG_PATH) as log_file:
+            self.assertEqual(b'build2\n', log_file.read())
+        with gzip.open(f'{self.LOG_PATH}.1') as log_file:
+            self.assertEqual(b'build1\n', log_file.read())
+
+    def test_rotates_log_when_size_limit_reached(self) -> None:
+        # Given
+        build_log = BuildLog(self.LOG_PATH, max_size=10, backup_count=2)
+        build_log.open()
+
+        # When
+        for index in range(4):
+            build_log.write(f'line{index}\n'.encode())
+        build_log.close()
+
+        # Then
+        self.assertEqual(['pi-gen.log.gz', 'pi-gen.log.gz.1', 'pi-gen.log.gz.2'], sorted(os.listdir(self.LOG_DIR)))
+        with gzip.open(self.LOG_PATH) as log_file:
+            self.assertEqual(b'line3\n', log_file.read())
+        with gzip.open(f'{self.LOG_PATH}.2') as log_file:
+            self.assertEqual(b'line1\n', log_file.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import os
+import unittest
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+from git import Repo, GitCommandError
+
+from image_generator import BuildManifest, IBuildConfigurator, TargetConfig, BuildConfiguration
+from tests import TEST_FILE_SYSTEM_ROOT, RESOURCE_ROOT
+
+BUILD_CONFIG = 'IMG_NAME=test-target\nENABLE_SSH=1\nCLEAN=1\n'
+
+
+class BuildManifestTest(TestCase):
+    MANIFEST_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/manifest'
+    MANIFEST_PATH = f'{MANIFEST_DIR}/test-target-1.0.0.manifest.json'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(self.MANIFEST_DIR)
+
+    def test_creates_same_manifest_for_same_inputs(self) -> None:
+        # Given
+        repository, configurator = create_mocks()
+        build_manifest = BuildManifest(repository, configurator, RESOURCE_ROOT)
+        original = build_manifest.create(create_target_config())
+
+        # When
+        result = build_manifest.create(create_target_config())
+
+        # Then
+        self.assertEqual(original, result)
+        repository.git.rev_parse.assert_called_with('--verify', 'test-ref^{commit}')
+
+    def test_manifest_changes_when_commit_changes(self) -> None:
+        # Given
+        repository, configurator = create_mocks()
+        build_manifest = BuildManifest(repository, configurator, RESOURCE_ROOT)
+        original = build_manifest.create(create_target_config())
+        repository.git.rev_parse.return_value = 'new-commit'
+
+        # When
+        result = build_manifest.create(create_target_config())
+
+        # Then
+        self.assertIsNotNone(result)
+        self.assertNotEqual(original['digest'], result['digest'])  # type: ignore
+
+    def test_manifest_changes_when_target_config_changes(self) -> None:
+        # Given
+        repository, configurator = create_mocks()
+        build_manifest = BuildManifest(repository, configurator, RESOURCE_ROOT)
+        original = build_manifest.create(create_target_config())
+        config = create_target_config()
+        config.first_boot = ['echo "first boot"']
+
+        # When
+        result = build_manifest.create(config)
+
+        # Then
+        self.assertNotEqual(original['digest'], result['digest'])  # type: ignore
+
+    def test_manifest_changes_when_compression_changes(self) -> None:
+        # Given
+        repository, configurator = create_mocks()
+        build_manifest = BuildManifest(repository, configurator, RESOURCE_ROOT)
+        original = build_manifest.create(create_target_config())
+        configurator.get_configuration.return_value = BuildConfiguration('zst', True, True, 'template/config.j2')
+
+        # When
+        result = build_manifest.create(create_target_config())
+
+        # Then
+        self.assertNotEqual(original['digest'], result['digest'])  # type: ignore
+
+    def test_manifest_changes_when_optional_outputs_change(self) -> None:
+        # Given
+        repository, configurator = create_mocks()
+        build_manifest = BuildManifest(repository, configurator, RESOURCE_ROOT)
+        original = build_manifest.create(create_target_config())
+        results = []
+
+        # When
+        for option in ['blake3_checksum', 'trim_image', 'block_map', 'analyze_image']:
+            configurator.get_configuration.return_value = BuildConfiguration(
+                'xz', True, True, 'template/config.j2', **{option: True}
+            )
+            results.append(build_manifest.create(create_target_config()))
+
+        # Then
+        digests = [original['digest']] + [result['digest'] for result in results]  # type: ignore
+        self.assertEqual(len(digests), len(set(digests)))
+
+    def test_manifest_ignores_config_not_affecting_image(self) -> None:
+        # Given
+        repository, configurator = create_mocks()
+        build_manifest = BuildManifest(repository, configurator, RESOURCE_ROOT)
+        original = build_manifest.create(create_target_config())
+        configurator.get_build_config.return_value = f'{BUILD_CONFIG.replace("CLEAN=1", "CLEAN=0")}APT_PROXY=proxy\n'
+
+        # When
+        result = build_manifest.create(create_target_config())
+
+        # Then
+        self.assertEqual(original, result)
+
+    def test_returns_none_when_reference_not_resolved(self) -> None:
+        # Given
+        repository, configurator = create_mocks()
+        repository.git.rev_parse.side_effect = GitCommandError('rev-parse', 128)
+        build_manifest = BuildManifest(repository, configurator, RESOURCE_ROOT)
+
+        # When
+        result = build_manifest.create(create_target_config())
+
+        # Then
+        self.assertIsNone(result)
+
+    def test_loads_saved_manifest(self) -> None:
+        # Given
+        repository, configurator = create_mocks()
+        build_manifest = BuildManifest(repository, configurator, RESOURCE_ROOT)
+        manifest = build_manifest.create(create_target_config())
+        os.makedirs(self.MANIFEST_DIR)
+        build_manifest.save(manifest, self.MANIFEST_PATH)  # type: ignore
+
+        # When
+        result = build_manifest.load(self.MANIFEST_PATH)
+
+        # Then
+        self.assertEqual(manifest, result)
+
+    def test_returns_none_when_manifest_not_found(self) -> None:
+        # Given
+        repository, configurator = create_mocks()
+        build_manifest = BuildManifest(repository, configurator, RESOURCE_ROOT)
+
+        # When
+        result = build_manifest.load(self.MANIFEST_PATH)
+
+        # Then
+        self.assertIsNone(result)
+
+
+def create_target_config() -> TargetConfig:
+    return TargetConfig(name='test-target', version='1.0.0', reference='test-ref', packages=[])
+
+
+def create_mocks() -> tuple[MagicMock, MagicMock]:
+    repository = MagicMock(spec=Repo)
+    repository.git = MagicMock()
+    repository.git.rev_parse.return_value = 'commit'
+    configurator = MagicMock(spec=IBuildConfigurator)
+    configurator.get_build_config.return_value = BUILD_CONFIG
+    configurator.get_configuration.return_value = BuildConfiguration('xz', True, True, 'template/config.j2')
+    return repository, configurator
+
+
+if __name__ == '__main__':
+    unittest.main()
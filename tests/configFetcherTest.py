@@ -0,0 +1,143 @@
+import hashlib
+import os
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any
+from unittest import TestCase
+from urllib.error import HTTPError
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+
+from image_generator import ConfigFetcher
+from tests import TEST_FILE_SYSTEM_ROOT
+
+CONFIG_CONTENT = b'[{"name": "test-target"}]\n'
+
+
+class ConfigFetcherTest(TestCase):
+    DOWNLOAD_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/config-fetcher'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(self.DOWNLOAD_DIR)
+        ConfigRequestHandler.requests.clear()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ConfigRequestHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/target-config.json'
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_downloads_config(self) -> None:
+        # Given
+        config_fetcher = ConfigFetcher(self.DOWNLOAD_DIR)
+
+        # When
+        result = config_fetcher.fetch(self.url)
+
+        # Then
+        self.assertTrue(result.startswith(self.DOWNLOAD_DIR))
+        self.assertTrue(result.endswith('-target-config.json'))
+        with open(result, 'rb') as file:
+            self.assertEqual(CONFIG_CONTENT, file.read())
+
+    def test_sends_conditional_request_for_cached_config(self) -> None:
+        # Given
+        config_fetcher = ConfigFetcher(self.DOWNLOAD_DIR)
+        config_fetcher.fetch(self.url)
+
+        # When
+        result = config_fetcher.fetch(self.url)
+
+        # Then
+        self.assertEqual([None, '"config-etag"'], ConfigRequestHandler.requests)
+        with open(result, 'rb') as file:
+            self.assertEqual(CONFIG_CONTENT, file.read())
+
+    def test_uses_cached_config_when_server_unavailable(self) -> None:
+        # Given
+        config_fetcher = ConfigFetcher(self.DOWNLOAD_DIR)
+        cached = config_fetcher.fetch(self.url)
+        self.server.shutdown()
+        self.server.server_close()
+
+        # When
+        result = config_fetcher.fetch(self.url)
+
+        # Then
+        self.assertEqual(cached, result)
+
+    def test_raises_error_when_server_unavailable_and_not_cached(self) -> None:
+        # Given
+        config_fetcher = ConfigFetcher(self.DOWNLOAD_DIR)
+        self.server.shutdown()
+        self.server.server_close()
+
+        # When, Then
+        self.assertRaises(OSError, config_fetcher.fetch, self.url)
+
+    def test_raises_error_when_config_not_found(self) -> None:
+        # Given
+        config_fetcher = ConfigFetcher(self.DOWNLOAD_DIR)
+
+        # When, Then
+        self.assertRaises(HTTPError, config_fetcher.fetch, self.url.replace('target-config', 'missing'))
+
+    def test_verifies_pinned_checksum(self) -> None:
+        # Given
+        config_fetcher = ConfigFetcher(self.DOWNLOAD_DIR)
+        checksum = hashlib.sha256(CONFIG_CONTENT).hexdigest()
+
+        # When
+        result = config_fetcher.fetch(self.url, checksum)
+
+        # Then
+        self.assertTrue(os.path.exists(result))
+        self.assertRaises(ValueError, config_fetcher.fetch, self.url, '0' * 64)
+
+    def test_returns_local_path(self) -> None:
+        # Given
+        config_fetcher = ConfigFetcher(self.DOWNLOAD_DIR)
+
+        # When
+        result = config_fetcher.fetch('config/target-config.json')
+
+        # Then
+        self.assertEqual(os.path.abspath('config/target-config.json'), result)
+        self.assertEqual([], ConfigRequestHandler.requests)
+
+
+class ConfigRequestHandler(BaseHTTPRequestHandler):
+    requests: list[Any] = []
+
+    def do_GET(self) -> None:
+        if self.path != '/target-config.json':
+            self.send_error(404)
+            return
+
+        ConfigRequestHandler.requests.append(self.headers.get('If-None-Match'))
+
+        if self.headers.get('If-None-Match') == '"config-etag"':
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', '"config-etag"')
+        self.send_header('Content-Length', str(len(CONFIG_CONTENT)))
+        self.end_headers()
+        self.wfile.write(CONFIG_CONTENT)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+import unittest
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+
+from image_generator import DependencyInstaller
+from tests import TEST_RESOURCE_ROOT, TEST_FILE_SYSTEM_ROOT
+
+
+class DependencyInstallerTest(TestCase):
+    DEPENDENCY_LIST = f'{TEST_RESOURCE_ROOT}/config/depends'
+    STATE_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/depends'
+    STATE_FILE = f'{STATE_DIR}/depends.state'
+    DPKG_STATUS = f'{STATE_DIR}/status'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(self.STATE_DIR)
+        os.makedirs(self.STATE_DIR)
+        update_dpkg_status(self.DPKG_STATUS, 'initial')
+
+    def test_installs_missing_dependencies_in_one_transaction(self) -> None:
+        # Given
+        cache = create_cache(['dependency1', 'dependency2', 'binfmt-support'], installed=['dependency1'])
+        dependency_installer = DependencyInstaller(self.STATE_FILE, lambda: cache, self.DPKG_STATUS)
+
+        # When
+        dependency_installer.install(self.DEPENDENCY_LIST)
+
+        # Then
+        cache['dependency1'].mark_install.assert_not_called()
+        cache['dependency2'].mark_install.assert_called_once()
+        cache['binfmt-support'].mark_install.assert_called_once()
+        cache.commit.assert_called_once()
+        self.assertTrue(os.path.exists(self.STATE_FILE))
+
+    def test_skips_installation_when_state_unchanged(self) -> None:
+        # Given
+        cache = create_cache(['dependency1', 'dependency2', 'binfmt-support'], installed=[])
+        cache_factory = MagicMock(return_value=cache)
+        dependency_installer = DependencyInstaller(self.STATE_FILE, cache_factory, self.DPKG_STATUS)
+        dependency_installer.install(self.DEPENDENCY_LIST)
+
+        # When
+        dependency_installer.install(self.DEPENDENCY_LIST)
+
+        # Then
+        cache_factory.assert_called_once()
+        cache.commit.assert_called_once()
+
+    def test_parallel_installers_run_one_transaction(self) -> None:
+        # Given
+        cache = create_cache(['dependency1', 'dependency2', 'binfmt-support'], installed=[])
+        cache.commit.side_effect = lambda: time.sleep(0.2)
+        cache_factory = MagicMock(return_value=cache)
+        installers = [DependencyInstaller(self.STATE_FILE, cache_factory, self.DPKG_STATUS) for _ in range(2)]
+        threads = [threading.Thread(target=installer.install, args=(self.DEPENDENCY_LIST,)) for installer in installers]
+
+        # When
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Then
+        cache_factory.assert_called_once()
+        cache.commit.assert_called_once()
+
+    def test_checks_dependencies_again_when_installed_state_changed(self) -> None:
+        # Given
+        cache = create_cache(['dependency1', 'dependency2', 'binfmt-support'], installed=[])
+        cache_factory = MagicMock(return_value=cache)
+        dependency_installer = DependencyInstaller(self.STATE_FILE, cache_factory, self.DPKG_STATUS)
+        dependency_installer.install(self.DEPENDENCY_LIST)
+        update_dpkg_status(self.DPKG_STATUS, 'package removed')
+
+        # When
+        dependency_installer.install(self.DEPENDENCY_LIST)
+
+        # Then
+        self.assertEqual(2, cache_factory.call_count)
+        cache.commit.assert_called_once()
+
+    def test_raises_error_when_dependency_not_found(self) -> None:
+        # Given
+        cache = create_cache(['dependency1', 'binfmt-support'], installed=[])
+        dependency_installer = DependencyInstaller(self.STATE_FILE, lambda: cache, self.DPKG_STATUS)
+
+        # When
+        self.assertRaises(RuntimeError, dependency_installer.install, self.DEPENDENCY_LIST)
+
+        # Then
+        cache.commit.assert_not_called()
+        self.assertFalse(os.path.exists(self.STATE_FILE))
+
+    def test_raises_error_when_installation_failed(self) -> None:
+        # Given
+        cache = create_cache(['dependency1', 'dependency2', 'binfmt-support'], installed=[])
+        cache.commit.side_effect = SystemError('E: Unable to locate package')
+        dependency_installer = DependencyInstaller(self.STATE_FILE, lambda: cache, self.DPKG_STATUS)
+
+        # When
+        self.assertRaises(RuntimeError, dependency_installer.install, self.DEPENDENCY_LIST)
+
+        # Then
+        self.assertFalse(os.path.exists(self.STATE_FILE))
+
+
+def create_cache(available: list[str], installed: list[str]) -> MagicMock:
+    packages = {name: MagicMock(is_installed=name in installed) for name in available}
+
+    for package in packages.values():
+        package.mark_install.side_effect = lambda package=package: setattr(package, 'is_installed', True)
+
+    cache = MagicMock()
+    cache.__contains__.side_effect = lambda name: name in packages
+    cache.__getitem__.side_effect = lambda name: packages[name]
+    return cache
+
+
+def update_dpkg_status(path: str, content: str) -> None:
+    with open(path, 'w') as status_file:
+        status_file.write(content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import unittest
+from unittest import TestCase
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+
+from benchmarks.generatorBenchmark import GeneratorBenchmark
+from tests import TEST_FILE_SYSTEM_ROOT, RESOURCE_ROOT
+
+
+class GeneratorBenchmarkTest(TestCase):
+    WORK_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/benchmark/pi-gen-benchmark'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(self.WORK_DIR)
+        os.makedirs(self.WORK_DIR)
+
+    def test_measures_every_phase(self) -> None:
+        # Given
+        benchmark = GeneratorBenchmark(RESOURCE_ROOT, self.WORK_DIR, 1, [2, 5], [10], log_lines=3000, image_size=1)
+
+        # When
+        result = benchmark.run()
+
+        # Then
+        self.assertEqual(
+            [
+                ('config_load', {'targets': 2, 'cache': 'cold'}),
+                ('config_load', {'targets': 2, 'cache': 'warm'}),
+                ('config_load', {'targets': 5, 'cache': 'cold'}),
+                ('config_load', {'targets': 5, 'cache': 'warm'}),
+                ('initialize', {'packages': 51}),
+                ('configure', {'packages': 51}),
+                ('build_output', {'lines': 3000, 'log_level': 'stage'}),
+                ('build_output', {'lines': 3000, 'log_level': 'all'}),
+                ('image_move', {'size': 1024 * 1024}),
+                ('package_diff', {'packages': 10}),
+            ],
+            [(phase['phase'], phase['parameters']) for phase in result['results']],
+        )
+        for phase in result['results']:
+            self.assertEqual(1, phase['runs'])
+            self.assertLessEqual(phase['min'], phase['max'])
+        self.assertTrue(os.path.isdir(f'{self.WORK_DIR}/pi-gen/stage2/02-install-packages'))
+
+
+if __name__ == '__main__':
+    unittest.main()
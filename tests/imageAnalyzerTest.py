@@ -0,0 +1,146 @@
+import json
+import os
+import unittest
+from subprocess import CompletedProcess, CalledProcessError
+from unittest import TestCase
+from unittest.mock import patch, call, ANY
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+
+from image_generator import ImageAnalyzer
+from tests import TEST_FILE_SYSTEM_ROOT
+
+
+class ImageAnalyzerTest(TestCase):
+    IMAGE_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/analyzer'
+    IMAGE_PATH = f'{IMAGE_DIR}/test-target.img'
+    MOUNT_DIR = f'{IMAGE_DIR}/mnt'
+    REPORT_PATH = f'{IMAGE_DIR}/test-target.analysis.json'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(self.IMAGE_DIR)
+        os.makedirs(self.IMAGE_DIR)
+        with open(self.IMAGE_PATH, 'wb') as image_file:
+            image_file.truncate(1024 * 1024)
+        write_file(f'{self.MOUNT_DIR}/p1/kernel.img', 8192)
+        write_file(f'{self.MOUNT_DIR}/p2/usr/lib/libtest.so', 16384)
+        write_file(f'{self.MOUNT_DIR}/p2/usr/lib/python3/module.py', 4096)
+        write_file(f'{self.MOUNT_DIR}/p2/etc/hostname', 10)
+        write_dpkg_status(f'{self.MOUNT_DIR}/p2/var/lib/dpkg/status', {'adduser': 849, 'filebeat': 60000})
+
+    @patch('glob.glob', return_value=['/dev/loop7p2', '/dev/loop7p1'])
+    @patch('subprocess.run')
+    def test_exports_partition_directory_and_package_sizes(self, run, _) -> None:
+        # Given
+        run.side_effect = lambda command, **kwargs: CompletedProcess(command, 0, get_output(command))
+        image_analyzer = ImageAnalyzer(mount_dir=self.MOUNT_DIR)
+
+        # When
+        result = image_analyzer.analyze(self.IMAGE_PATH, self.REPORT_PATH)
+
+        # Then
+        run.assert_has_calls(
+            [
+                call(
+                    ['losetup', '--find', '--show', '--read-only', '--partscan', self.IMAGE_PATH], check=True, **OUTPUT
+                ),
+                call(['blkid', '--output', 'value', '--match-tag', 'TYPE', '/dev/loop7p1'], check=False, **OUTPUT),
+                call(['mount', '-o', 'ro', '/dev/loop7p1', f'{self.MOUNT_DIR}/p1'], check=True, **OUTPUT),
+                call(['umount', f'{self.MOUNT_DIR}/p1'], check=True, **OUTPUT),
+                call(['blkid', '--output', 'value', '--match-tag', 'TYPE', '/dev/loop7p2'], check=False, **OUTPUT),
+                call(['mount', '-o', 'ro', '/dev/loop7p2', f'{self.MOUNT_DIR}/p2'], check=True, **OUTPUT),
+                call(['umount', f'{self.MOUNT_DIR}/p2'], check=True, **OUTPUT),
+                call(['losetup', '--detach', '/dev/loop7'], check=True, **OUTPUT),
+            ]
+        )
+        self.assertEqual(['p1', 'p2'], [partition['name'] for partition in result['partitions']])
+        self.assertEqual(['vfat', 'ext4'], [partition['type'] for partition in result['partitions']])
+        directories = result['partitions'][1]['directories']
+        self.assertEqual(['/', '/etc', '/usr', '/usr/lib', '/var', '/var/lib'], list(directories))
+        self.assertEqual(directories['/usr'], directories['/usr/lib'])
+        self.assertGreaterEqual(directories['/usr/lib'], 16384 + 4096)
+        self.assertEqual({'adduser': 849 * 1024, 'filebeat': 60000 * 1024}, result['packages'])
+        with open(self.REPORT_PATH) as report_file:
+            self.assertEqual(result, json.load(report_file))
+
+    @patch('glob.glob', return_value=['/dev/loop7p2', '/dev/loop7p1'])
+    @patch('subprocess.run')
+    def test_exports_changes_since_previous_report(self, run, _) -> None:
+        # Given
+        run.side_effect = lambda command, **kwargs: CompletedProcess(command, 0, get_output(command))
+        image_analyzer = ImageAnalyzer(mount_dir=self.MOUNT_DIR)
+        previous_report_path = f'{self.IMAGE_DIR}/previous.analysis.json'
+        image_analyzer.analyze(self.IMAGE_PATH, previous_report_path)
+        write_file(f'{self.MOUNT_DIR}/p2/usr/lib/libnew.so', 65536)
+        write_dpkg_status(f'{self.MOUNT_DIR}/p2/var/lib/dpkg/status', {'adduser': 900, 'wifi-manager': 100})
+
+        # When
+        result = image_analyzer.analyze(self.IMAGE_PATH, self.REPORT_PATH, previous_report_path)
+
+        # Then
+        changes = result['changes']
+        self.assertEqual('test-target.img', changes['previous'])
+        self.assertEqual(['/', '/usr', '/usr/lib'], list(changes['partitions']['p2']['directories']))
+        self.assertGreaterEqual(changes['partitions']['p2']['directories']['/usr/lib'], 65536)
+        self.assertEqual({}, changes['partitions']['p1']['directories'])
+        self.assertEqual(
+            {
+                'added': {'wifi-manager': 100 * 1024},
+                'removed': {'filebeat': 60000 * 1024},
+                'changed': {'adduser': 51 * 1024},
+            },
+            changes['packages'],
+        )
+
+    @patch('glob.glob', return_value=['/dev/loop7p2'])
+    @patch('subprocess.run')
+    def test_detaches_loop_device_when_mount_fails(self, run, _) -> None:
+        # Given
+        def run_command(command: list[str], **kwargs: bool) -> CompletedProcess:
+            if command[0] == 'mount':
+                raise CalledProcessError(32, command)
+            return CompletedProcess(command, 0, get_output(command))
+
+        run.side_effect = run_command
+        image_analyzer = ImageAnalyzer(mount_dir=self.MOUNT_DIR)
+
+        # When
+        self.assertRaises(CalledProcessError, image_analyzer.analyze, self.IMAGE_PATH, self.REPORT_PATH)
+
+        # Then
+        run.assert_any_call(['losetup', '--detach', '/dev/loop7'], check=True, capture_output=ANY, text=ANY)
+        self.assertFalse(os.path.exists(self.REPORT_PATH))
+
+
+OUTPUT = {'capture_output': True, 'text': True}
+
+
+def get_output(command: list[str]) -> str:
+    if command[0] == 'losetup' and '--show' in command:
+        return '/dev/loop7\n'
+    if command[0] == 'blkid':
+        return 'ext4\n' if command[-1].endswith('p2') else 'vfat\n'
+    return ''
+
+
+def write_file(path: str, size: int) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(b'\1' * size)
+
+
+def write_dpkg_status(path: str, packages: dict[str, int]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as status_file:
+        for package, size in packages.items():
+            status_file.write(f'Package: {package}\nStatus: install ok installed\nInstalled-Size: {size}\n\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,12 @@
 import unittest
 from subprocess import CalledProcessError
 from unittest import TestCase
+from unittest.mock import MagicMock, patch
 
-from common_utility import copy_file
+from common_utility import copy_file, delete_directory
 from context_logger import setup_logging
 
-from image_generator import ImageBuilder
+from image_generator import ImageBuilder, IStageProfiler, IBuildLog
 from tests import TEST_RESOURCE_ROOT, TEST_FILE_SYSTEM_ROOT
 
 
@@ -37,6 +38,76 @@ class ImageBuilderTest(TestCase):
         # When, Then
         self.assertRaises(CalledProcessError, image_builder.build, f'/bin/bash ./build.sh 1 {self.PI_GEN_LOCATION}')
 
+    def test_failing_build_creates_failure_report(self):
+        # Given
+        report_path = f'{TEST_FILE_SYSTEM_ROOT}/tmp/report/pi-gen.failure.log'
+        delete_directory(f'{TEST_FILE_SYSTEM_ROOT}/tmp/report')
+        image_builder = ImageBuilder(self.PI_GEN_LOCATION, failure_report=report_path, report_lines=3)
+
+        # When
+        with self.assertRaises(CalledProcessError) as context:
+            image_builder.build(f'/bin/bash ./build.sh 1 {self.PI_GEN_LOCATION}')
+
+        # Then
+        report = context.exception.output
+        self.assertIn('Return code: 1', report)
+        self.assertIn('Stage: stage2', report)
+        self.assertIn('--- stage2 (last 3 lines) ---', report)
+        self.assertIn('Build failed', report)
+        self.assertNotIn('stage0', report)
+        self.assertEqual(3, len(report.split('--- stage2 (last 3 lines) ---')[1].strip().splitlines()))
+        with open(report_path) as report_file:
+            self.assertEqual(report, report_file.read())
+
+    def test_profiles_build_stages(self):
+        # Given
+        stage_profiler = MagicMock(spec=IStageProfiler)
+        image_builder = ImageBuilder(self.PI_GEN_LOCATION, stage_profiler)
+
+        # When
+        image_builder.build(f'/bin/bash ./build.sh 0 {self.PI_GEN_LOCATION}')
+
+        # Then
+        stage_profiler.start.assert_called_once()
+        stage_profiler.stop.assert_called_once()
+        stages = [args[0] for args, _ in stage_profiler.begin_stage.call_args_list]
+        self.assertEqual(['build', 'stage0', 'stage1', 'stage2'], stages)
+        self.assertEqual(4, stage_profiler.end_stage.call_count)
+
+    def test_writes_raw_build_log(self):
+        # Given
+        build_log = MagicMock(spec=IBuildLog)
+        image_builder = ImageBuilder(self.PI_GEN_LOCATION, build_log=build_log)
+
+        # When
+        image_builder.build(f'/bin/bash ./build.sh 0 {self.PI_GEN_LOCATION}')
+
+        # Then
+        build_log.open.assert_called_once()
+        build_log.close.assert_called_once()
+        output = b''.join(args[0] for args, _ in build_log.write.call_args_list)
+        self.assertEqual(5, output.count(b'Build in progress...\n'))
+        self.assertIn(b'Warning...\n', output)
+
+    @patch('image_generator.imageBuilder.log')
+    def test_logs_only_stage_transitions_and_warnings(self, log):
+        # Given
+        image_builder = ImageBuilder(self.PI_GEN_LOCATION, log_level='warning')
+
+        # When
+        image_builder.build(f'/bin/bash ./build.sh 0 {self.PI_GEN_LOCATION}')
+
+        # Then
+        logged_lines = [args[1] for args, _ in log.log.call_args_list]
+        self.assertEqual(['Warning...'], logged_lines)
+        self.assertEqual(
+            8, len([args for args, _ in log.info.call_args_list if ' Begin ' in args[0] or ' End ' in args[0]])
+        )
+
+    def test_raises_error_when_log_level_is_invalid(self):
+        # When, Then
+        self.assertRaises(ValueError, ImageBuilder, self.PI_GEN_LOCATION, log_level='invalid')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,100 @@
+import gzip
+import hashlib
+import lzma
+import os
+import unittest
+from subprocess import CalledProcessError
+from unittest import TestCase
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+
+from image_generator import ImageCompressor, BuildConfiguration
+from tests import TEST_FILE_SYSTEM_ROOT
+
+
+class ImageCompressorTest(TestCase):
+    IMAGE_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/compressor'
+    SOURCE_PATH = f'{IMAGE_DIR}/test-target.img'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(self.IMAGE_DIR)
+        os.makedirs(self.IMAGE_DIR)
+        with open(self.SOURCE_PATH, 'wb') as image_file:
+            image_file.write(b'image' * 1000)
+
+    def test_compresses_image_with_xz(self) -> None:
+        # Given
+        image_compressor = ImageCompressor()
+        configuration = create_configuration('xz', compression_level=1, compression_threads=2)
+
+        # When
+        result = image_compressor.compress(self.SOURCE_PATH, f'{self.SOURCE_PATH}.xz', configuration)
+
+        # Then
+        self.assertFalse(os.path.exists(self.SOURCE_PATH))
+        with open(f'{self.SOURCE_PATH}.xz', 'rb') as image_file:
+            compressed = image_file.read()
+        self.assertEqual(len(compressed), result.size)
+        self.assertEqual(hashlib.sha256(compressed).hexdigest(), result.sha256)
+        self.assertFalse(os.path.exists(f'{self.SOURCE_PATH}.xz.tmp'))
+        with lzma.open(f'{self.SOURCE_PATH}.xz') as image_file:
+            self.assertEqual(b'image' * 1000, image_file.read())
+
+    def test_compresses_image_with_gzip(self) -> None:
+        # Given
+        image_compressor = ImageCompressor()
+        configuration = create_configuration('gz')
+
+        # When
+        image_compressor.compress(self.SOURCE_PATH, f'{self.SOURCE_PATH}.gz', configuration)
+
+        # Then
+        with gzip.open(f'{self.SOURCE_PATH}.gz') as image_file:
+            self.assertEqual(b'image' * 1000, image_file.read())
+
+    def test_raises_error_and_keeps_source_when_compression_fails(self) -> None:
+        # Given
+        image_compressor = ImageCompressor()
+        configuration = create_configuration('xz')
+        os.unlink(self.SOURCE_PATH)
+
+        # When
+        self.assertRaises(
+            CalledProcessError, image_compressor.compress, self.SOURCE_PATH, f'{self.SOURCE_PATH}.xz', configuration
+        )
+
+        # Then
+        self.assertFalse(os.path.exists(f'{self.SOURCE_PATH}.xz'))
+        self.assertFalse(os.path.exists(f'{self.SOURCE_PATH}.xz.tmp'))
+
+    def test_raises_error_when_compression_not_supported(self) -> None:
+        # Given
+        image_compressor = ImageCompressor()
+        configuration = create_configuration('zip')
+
+        # When, Then
+        self.assertRaises(
+            ValueError, image_compressor.compress, self.SOURCE_PATH, f'{self.SOURCE_PATH}.zip', configuration
+        )
+        self.assertTrue(os.path.exists(self.SOURCE_PATH))
+
+    def test_exports_uncompressed_image_from_pi_gen(self) -> None:
+        # When
+        result = [create_configuration(compression).deploy_compression for compression in ['xz', 'zst', 'zip']]
+
+        # Then
+        self.assertEqual(['none', 'none', 'zip'], result)
+
+
+def create_configuration(compression: str, **kwargs: int) -> BuildConfiguration:
+    return BuildConfiguration(compression, True, True, 'template/config.j2', **kwargs)  # type: ignore
+
+
+if __name__ == '__main__':
+    unittest.main()
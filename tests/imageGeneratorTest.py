@@ -1,17 +1,30 @@
+import hashlib
+import json
 import os
 import subprocess
 import unittest
 from datetime import datetime
 from unittest import TestCase
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, ANY
 
 from common_utility import delete_directory
-from common_utility.jsonLoader import IJsonLoader
 from context_logger import setup_logging
 from package_downloader import PackageConfig
 from test_utility import compare_files
 
-from image_generator import ImageGenerator, IImageBuilder, TargetConfig, BuildConfiguration, IBuildInitializer
+from image_generator import (
+    ImageGenerator,
+    ITargetConfigLoader,
+    IImageBuilder,
+    TargetConfig,
+    BuildConfiguration,
+    IBuildInitializer,
+    IBuildManifest,
+    IImageCompressor,
+    IImageTrimmer,
+    IImageAnalyzer,
+    IPhaseHook,
+)
 from tests import TEST_RESOURCE_ROOT, TEST_FILE_SYSTEM_ROOT, create_pi_gen_tree
 
 
@@ -37,8 +50,8 @@ class ImageGeneratorTest(TestCase):
             reference='test-ref',
             packages=[PackageConfig(package='package1'), PackageConfig(package='package2')],
         )
-        json_loader, initializer, builder = create_mocks(config)
-        image_generator = ImageGenerator('/path/to/config', json_loader, initializer, builder, self.OUTPUT_DIR)
+        config_loader, initializer, builder = create_mocks(config)
+        image_generator = ImageGenerator('/path/to/config', config_loader, initializer, builder, self.OUTPUT_DIR)
         subprocess.run(['/bin/bash', f'{TEST_RESOURCE_ROOT}/scripts/build.sh', '0', f'{self.PI_GEN_LOCATION}'])
 
         # When
@@ -46,10 +59,13 @@ class ImageGeneratorTest(TestCase):
 
         # Then
         self.assertEqual(config, result)
-        json_loader.load_list.assert_called_once()
+        config_loader.load_target.assert_called_once_with('/path/to/config', 'test-target')
         initializer.initialize.assert_called_once_with(config)
         builder.build.assert_called_once()
         self.assertTrue(os.path.exists(f'{TEST_RESOURCE_ROOT}/image/test-target/1.0.0/test-target-1.0.0.img.xz'))
+        with open(f'{TEST_RESOURCE_ROOT}/image/test-target/1.0.0/test-target-1.0.0.sha256') as checksum_file:
+            self.assertTrue(checksum_file.read().endswith('  test-target-1.0.0.img.xz\n'))
+        self.assertTrue(os.path.exists(f'{TEST_RESOURCE_ROOT}/image/test-target/1.0.0/test-target-1.0.0.digest.json'))
         self.assertTrue(
             compare_files(
                 f'{TEST_RESOURCE_ROOT}/expected/test-target-1.0.0.json',
@@ -62,45 +78,247 @@ class ImageGeneratorTest(TestCase):
                 f'{TEST_RESOURCE_ROOT}/image/test-target/1.0.0/test-target-1.0.0.list',
             )
         )
+        with open(f'{TEST_RESOURCE_ROOT}/image/test-target/1.0.0/test-target-1.0.0.packages.json') as diff_file:
+            package_diff = json.load(diff_file)
+            self.assertEqual(124, len(package_diff['added']))
+            self.assertEqual({'version': '8.12.2', 'arch': 'armhf'}, package_diff['added']['filebeat'])
+
+    def test_image_moved_when_compressed_by_pi_gen(self) -> None:
+        # Given
+        delete_directory(f'{TEST_RESOURCE_ROOT}/image')
+        config = TargetConfig(name='test-target', version='1.0.0', reference='test-ref', packages=[])
+        config_loader, initializer, builder = create_mocks(config)
+        initializer.get_configuration.return_value = BuildConfiguration('none', True, True, 'config/config.template')
+        image_compressor = MagicMock(spec=IImageCompressor)
+        image_generator = ImageGenerator(
+            '/path/to/config', config_loader, initializer, builder, self.OUTPUT_DIR, image_compressor=image_compressor
+        )
+        subprocess.run(['/bin/bash', f'{TEST_RESOURCE_ROOT}/scripts/build.sh', '0', f'{self.PI_GEN_LOCATION}'])
+
+        # When
+        image_generator.generate('test-target')
+
+        # Then
+        image_compressor.compress.assert_not_called()
+        self.assertTrue(os.path.exists(f'{TEST_RESOURCE_ROOT}/image/test-target/1.0.0/test-target-1.0.0.img'))
+        self.assertFalse(os.path.exists(f'{TEST_RESOURCE_ROOT}/image/test-target/1.0.0/test-target-1.0.0.bmap'))
+        with open(f'{TEST_RESOURCE_ROOT}/image/test-target/1.0.0/test-target-1.0.0.sha256') as checksum_file:
+            self.assertEqual(f'{hashlib.sha256().hexdigest()}  test-target-1.0.0.img\n', checksum_file.read())
+
+    def test_raw_image_trimmed_and_block_map_created(self) -> None:
+        # Given
+        delete_directory(f'{TEST_RESOURCE_ROOT}/image')
+        config = TargetConfig(name='test-target', version='1.0.0', reference='test-ref', packages=[])
+        config_loader, initializer, builder = create_mocks(config)
+        configuration = BuildConfiguration('xz', True, True, 'config/config.template', trim_image=True, block_map=True)
+        initializer.get_configuration.return_value = configuration
+        image_trimmer = MagicMock(spec=IImageTrimmer)
+        image_generator = ImageGenerator(
+            '/path/to/config', config_loader, initializer, builder, self.OUTPUT_DIR, image_trimmer=image_trimmer
+        )
+        subprocess.run(['/bin/bash', f'{TEST_RESOURCE_ROOT}/scripts/build.sh', '0', f'{self.PI_GEN_LOCATION}'])
+
+        # When
+        image_generator.generate('test-target')
+
+        # Then
+        image_trimmer.trim.assert_called_once()
+        self.assertTrue(os.path.exists(f'{TEST_RESOURCE_ROOT}/image/test-target/1.0.0/test-target-1.0.0.bmap'))
+
+    def test_raw_image_analyzed_against_previous_version(self) -> None:
+        # Given
+        delete_directory(f'{TEST_RESOURCE_ROOT}/image')
+        previous_report_path = f'{TEST_RESOURCE_ROOT}/image/test-target/0.9.0/test-target-0.9.0.analysis.json'
+        os.makedirs(os.path.dirname(previous_report_path))
+        open(previous_report_path, 'w').close()
+        os.makedirs(f'{TEST_RESOURCE_ROOT}/image/test-target/2.0.0')
+        open(f'{TEST_RESOURCE_ROOT}/image/test-target/2.0.0/test-target-2.0.0.analysis.json', 'w').close()
+        config = TargetConfig(name='test-target', version='1.0.0', reference='test-ref', packages=[])
+        config_loader, initializer, builder = create_mocks(config)
+        configuration = BuildConfiguration('xz', True, True, 'config/config.template', analyze_image=True)
+        initializer.get_configuration.return_value = configuration
+        image_analyzer = MagicMock(spec=IImageAnalyzer)
+        image_generator = ImageGenerator(
+            '/path/to/config', config_loader, initializer, builder, self.OUTPUT_DIR, image_analyzer=image_analyzer
+        )
+        subprocess.run(['/bin/bash', f'{TEST_RESOURCE_ROOT}/scripts/build.sh', '0', f'{self.PI_GEN_LOCATION}'])
+
+        # When
+        image_generator.generate('test-target')
+
+        # Then
+        image_analyzer.analyze.assert_called_once_with(
+            ANY, f'{TEST_RESOURCE_ROOT}/image/test-target/1.0.0/test-target-1.0.0.analysis.json', previous_report_path
+        )
+
+    def test_phase_hooks_called_for_each_phase(self) -> None:
+        # Given
+        delete_directory(f'{TEST_RESOURCE_ROOT}/image')
+        config = TargetConfig(name='test-target', version='1.0.0', reference='test-ref', packages=[])
+        config_loader, initializer, builder = create_mocks(config)
+        phase_hook = MagicMock(spec=IPhaseHook)
+        image_generator = ImageGenerator(
+            '/path/to/config', config_loader, initializer, builder, self.OUTPUT_DIR, phase_hooks=[phase_hook]
+        )
+        subprocess.run(['/bin/bash', f'{TEST_RESOURCE_ROOT}/scripts/build.sh', '0', f'{self.PI_GEN_LOCATION}'])
+
+        # When
+        image_generator.generate('test-target')
+
+        # Then
+        phases = [
+            'load_config',
+            'check_manifest',
+            'initialize',
+            'build',
+            'prepare_image',
+            'analyze_image',
+            'move_image',
+            'export',
+        ]
+        events = [phase_call.args[0] for phase_call in phase_hook.after_phase.call_args_list]
+        self.assertEqual(phases, [event.phase for event in events])
+        self.assertEqual(phases, [phase_call.args[0].phase for phase_call in phase_hook.before_phase.call_args_list])
+        self.assertTrue(all(event.target == 'test-target' and event.error is None for event in events))
+        self.assertTrue(all(event.duration >= 0 for event in events))
+        self.assertIn('image_bytes', events[6].metrics)
 
     def test_raises_error_when_target_not_found(self) -> None:
         # Given
         config = TargetConfig(name='test-target', version='1.0.0', reference='test-ref', packages=[])
-        json_loader, initializer, builder = create_mocks(config)
-        image_generator = ImageGenerator('/path/to/config', json_loader, initializer, builder, self.OUTPUT_DIR)
+        config_loader, initializer, builder = create_mocks(config)
+        image_generator = ImageGenerator('/path/to/config', config_loader, initializer, builder, self.OUTPUT_DIR)
 
         # When
         self.assertRaises(AttributeError, image_generator.generate, 'invalid-target')
 
         # Then
-        json_loader.load_list.assert_called_once()
+        config_loader.load_target.assert_called_once_with('/path/to/config', 'invalid-target')
         initializer.initialize.assert_not_called()
         builder.build.assert_not_called()
 
     def test_raises_error_when_image_not_found(self):
         # Given
         config = TargetConfig(name='test-target', version='1.0.0', reference='test-ref', packages=[])
-        json_loader, initializer, builder = create_mocks(config)
-        image_generator = ImageGenerator('/path/to/config', json_loader, initializer, builder, self.OUTPUT_DIR)
+        config_loader, initializer, builder = create_mocks(config)
+        image_generator = ImageGenerator('/path/to/config', config_loader, initializer, builder, self.OUTPUT_DIR)
 
         # When
         self.assertRaises(FileNotFoundError, image_generator.generate, 'test-target')
 
         # Then
-        json_loader.load_list.assert_called_once()
+        config_loader.load_target.assert_called_once_with('/path/to/config', 'test-target')
         initializer.initialize.assert_called_once_with(config)
         builder.build.assert_called_once()
 
+    def test_skips_build_when_manifest_matches(self) -> None:
+        # Given
+        config = TargetConfig(name='test-target', version='1.0.0', reference='test-ref', packages=[])
+        config_loader, initializer, builder = create_mocks(config)
+        build_manifest = create_build_manifest({'digest': 'digest'}, {'digest': 'digest'})
+        image_generator = ImageGenerator(
+            '/path/to/config', config_loader, initializer, builder, self.OUTPUT_DIR, build_manifest=build_manifest
+        )
+        create_output_files(f'{self.OUTPUT_DIR}/test-target/1.0.0')
+
+        # When
+        result = image_generator.generate('test-target')
+
+        # Then
+        self.assertEqual(config, result)
+        initializer.initialize.assert_not_called()
+        builder.build.assert_not_called()
+        build_manifest.save.assert_not_called()
+
+    def test_builds_image_and_saves_manifest_when_manifest_differs(self) -> None:
+        # Given
+        delete_directory(f'{TEST_RESOURCE_ROOT}/image')
+        config = TargetConfig(name='test-target', version='1.0.0', reference='test-ref', packages=[])
+        config_loader, initializer, builder = create_mocks(config)
+        build_manifest = create_build_manifest({'digest': 'new-digest'}, {'digest': 'digest'})
+        image_generator = ImageGenerator(
+            '/path/to/config', config_loader, initializer, builder, self.OUTPUT_DIR, build_manifest=build_manifest
+        )
+        subprocess.run(['/bin/bash', f'{TEST_RESOURCE_ROOT}/scripts/build.sh', '0', f'{self.PI_GEN_LOCATION}'])
+
+        # When
+        image_generator.generate('test-target')
+
+        # Then
+        builder.build.assert_called_once()
+        build_manifest.save.assert_called_once_with(
+            {'digest': 'new-digest'}, f'{self.OUTPUT_DIR}/test-target/1.0.0/test-target-1.0.0.manifest.json'
+        )
+
+    def test_builds_image_when_forced(self) -> None:
+        # Given
+        config = TargetConfig(name='test-target', version='1.0.0', reference='test-ref', packages=[])
+        config_loader, initializer, builder = create_mocks(config)
+        build_manifest = create_build_manifest({'digest': 'digest'}, {'digest': 'digest'})
+        image_generator = ImageGenerator(
+            '/path/to/config',
+            config_loader,
+            initializer,
+            builder,
+            self.OUTPUT_DIR,
+            build_manifest=build_manifest,
+            force_build=True,
+        )
+        create_output_files(f'{self.OUTPUT_DIR}/test-target/1.0.0')
+
+        # When
+        self.assertRaises(FileNotFoundError, image_generator.generate, 'test-target')
+
+        # Then
+        initializer.initialize.assert_called_once_with(config)
+        builder.build.assert_called_once()
+        self.assertFalse(os.path.exists(f'{self.OUTPUT_DIR}/test-target/1.0.0/test-target-1.0.0.manifest.json'))
+
+    def test_prepare_and_complete_split_generation(self) -> None:
+        # Given
+        delete_directory(f'{TEST_RESOURCE_ROOT}/image')
+        config = TargetConfig(name='test-target', version='1.0.0', reference='test-ref', packages=[])
+        config_loader, initializer, builder = create_mocks(config)
+        image_generator = ImageGenerator('/path/to/config', config_loader, initializer, builder, self.OUTPUT_DIR)
+        subprocess.run(['/bin/bash', f'{TEST_RESOURCE_ROOT}/scripts/build.sh', '0', f'{self.PI_GEN_LOCATION}'])
+
+        # When
+        context = image_generator.prepare('test-target')
+        result = image_generator.complete(context, datetime.now())
+
+        # Then
+        self.assertEqual(config, result)
+        self.assertFalse(context.up_to_date)
+        initializer.initialize.assert_called_once_with(config)
+        builder.build.assert_not_called()
+        self.assertTrue(os.path.exists(f'{TEST_RESOURCE_ROOT}/image/test-target/1.0.0/test-target-1.0.0.img.xz'))
+
+
+def create_build_manifest(manifest: dict[str, str], saved_manifest: dict[str, str]) -> MagicMock:
+    build_manifest = MagicMock(spec=IBuildManifest)
+    build_manifest.create.return_value = manifest
+    build_manifest.load.return_value = saved_manifest
+    return build_manifest
+
+
+def create_output_files(directory: str) -> None:
+    delete_directory(directory)
+    os.makedirs(directory)
+    for extension in ['img.xz', 'json', 'manifest.json']:
+        with open(f'{directory}/test-target-1.0.0.{extension}', 'w') as output_file:
+            output_file.write('\n')
+
 
 def create_mocks(target: TargetConfig) -> tuple:
-    json_loader = MagicMock(spec=IJsonLoader)
-    json_loader.load_list.return_value = [target]
+    config_loader = MagicMock(spec=ITargetConfigLoader)
+    config_loader.load_target.side_effect = lambda path, name: target if name == target.name else None
+    config_loader.get_target_names.return_value = [target.name]
     initializer = MagicMock(spec=IBuildInitializer)
     initializer.get_repository_path.return_value = f'{TEST_FILE_SYSTEM_ROOT}/tmp/pi-gen'
     initializer.get_configuration.return_value = BuildConfiguration('xz', True, True, 'config/config.template')
     builder = MagicMock(spec=IImageBuilder)
     builder.build.return_value = datetime.now()
-    return json_loader, initializer, builder
+    return config_loader, initializer, builder
 
 
 if __name__ == '__main__':
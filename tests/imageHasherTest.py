@@ -0,0 +1,99 @@
+import errno
+import hashlib
+import io
+import os
+import unittest
+from unittest import TestCase
+from unittest.mock import patch
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+
+from image_generator import ImageHasher, ImageDigest
+from tests import TEST_FILE_SYSTEM_ROOT
+
+CONTENT = b'image' * 1000000
+
+
+class ImageHasherTest(TestCase):
+    IMAGE_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/hasher'
+    SOURCE_PATH = f'{IMAGE_DIR}/deploy/test-target.img'
+    TARGET_PATH = f'{IMAGE_DIR}/image/test-target-1.0.0.img'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(self.IMAGE_DIR)
+        os.makedirs(os.path.dirname(self.SOURCE_PATH))
+        os.makedirs(os.path.dirname(self.TARGET_PATH))
+        with open(self.SOURCE_PATH, 'wb') as image_file:
+            image_file.write(CONTENT)
+
+    def test_computes_digest_while_copying(self) -> None:
+        # Given
+        image_hasher = ImageHasher()
+        target = io.BytesIO()
+
+        # When
+        result = image_hasher.copy(io.BytesIO(CONTENT), target)
+
+        # Then
+        self.assertEqual(CONTENT, target.getvalue())
+        self.assertEqual(ImageDigest(len(CONTENT), hashlib.sha256(CONTENT).hexdigest()), result)
+
+    def test_moves_image_on_same_file_system(self) -> None:
+        # Given
+        image_hasher = ImageHasher()
+
+        # When
+        result = image_hasher.move(self.SOURCE_PATH, self.TARGET_PATH)
+
+        # Then
+        self.assertFalse(os.path.exists(self.SOURCE_PATH))
+        self.assertEqual(ImageDigest(len(CONTENT), hashlib.sha256(CONTENT).hexdigest()), result)
+
+    def test_copies_image_across_file_systems(self) -> None:
+        # Given
+        image_hasher = ImageHasher()
+
+        # When
+        with patch('os.rename', side_effect=OSError(errno.EXDEV, 'Invalid cross-device link')):
+            result = image_hasher.move(self.SOURCE_PATH, self.TARGET_PATH)
+
+        # Then
+        self.assertFalse(os.path.exists(self.SOURCE_PATH))
+        self.assertFalse(os.path.exists(f'{self.TARGET_PATH}.tmp'))
+        with open(self.TARGET_PATH, 'rb') as image_file:
+            self.assertEqual(CONTENT, image_file.read())
+        self.assertEqual(ImageDigest(len(CONTENT), hashlib.sha256(CONTENT).hexdigest()), result)
+
+    def test_preserves_sparse_image_when_copying_across_file_systems(self) -> None:
+        # Given
+        image_hasher = ImageHasher()
+        with open(self.SOURCE_PATH, 'ab') as image_file:
+            image_file.truncate(64 * 1024 * 1024)
+            image_file.seek(0, os.SEEK_END)
+            image_file.write(b'end')
+
+        # When
+        with patch('os.rename', side_effect=OSError(errno.EXDEV, 'Invalid cross-device link')):
+            result = image_hasher.move(self.SOURCE_PATH, self.TARGET_PATH)
+
+        # Then
+        content = CONTENT + bytes(64 * 1024 * 1024 - len(CONTENT)) + b'end'
+        self.assertEqual(ImageDigest(len(content), hashlib.sha256(content).hexdigest()), result)
+        self.assertEqual(len(content), os.path.getsize(self.TARGET_PATH))
+        self.assertLess(os.stat(self.TARGET_PATH).st_blocks * 512, 32 * 1024 * 1024)
+
+    def test_raises_error_when_blake3_not_available(self) -> None:
+        # Given
+        with patch.dict('sys.modules', {'blake3': None}):
+            # When, Then
+            self.assertRaises(ImportError, ImageHasher, True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import unittest
+from subprocess import CompletedProcess, CalledProcessError
+from unittest import TestCase
+from unittest.mock import patch, call, ANY
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+
+from image_generator import ImageTrimmer
+from tests import TEST_FILE_SYSTEM_ROOT
+
+
+class ImageTrimmerTest(TestCase):
+    IMAGE_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/trimmer'
+    IMAGE_PATH = f'{IMAGE_DIR}/test-target.img'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(self.IMAGE_DIR)
+        os.makedirs(self.IMAGE_DIR)
+        with open(self.IMAGE_PATH, 'wb') as image_file:
+            image_file.truncate(1024 * 1024)
+
+    @patch('glob.glob', return_value=['/dev/loop7p2', '/dev/loop7p1'])
+    @patch('subprocess.run')
+    def test_zero_fills_ext4_partitions_and_digs_holes(self, run, _) -> None:
+        # Given
+        run.side_effect = lambda command, **kwargs: CompletedProcess(command, 0, get_output(command))
+        image_trimmer = ImageTrimmer()
+
+        # When
+        image_trimmer.trim(self.IMAGE_PATH)
+
+        # Then
+        run.assert_has_calls(
+            [
+                call(['losetup', '--find', '--show', '--partscan', self.IMAGE_PATH], check=True, **OUTPUT),
+                call(['blkid', '--output', 'value', '--match-tag', 'TYPE', '/dev/loop7p1'], check=False, **OUTPUT),
+                call(['blkid', '--output', 'value', '--match-tag', 'TYPE', '/dev/loop7p2'], check=False, **OUTPUT),
+                call(['zerofree', '/dev/loop7p2'], check=True, **OUTPUT),
+                call(['losetup', '--detach', '/dev/loop7'], check=True, **OUTPUT),
+                call(['fallocate', '--dig-holes', self.IMAGE_PATH], check=True, **OUTPUT),
+            ]
+        )
+
+    @patch('glob.glob', return_value=['/dev/loop7p2'])
+    @patch('subprocess.run')
+    def test_detaches_loop_device_when_zero_fill_fails(self, run, _) -> None:
+        # Given
+        def run_command(command: list[str], **kwargs: bool) -> CompletedProcess:
+            if command[0] == 'zerofree':
+                raise CalledProcessError(1, command)
+            return CompletedProcess(command, 0, get_output(command))
+
+        run.side_effect = run_command
+        image_trimmer = ImageTrimmer()
+
+        # When
+        self.assertRaises(CalledProcessError, image_trimmer.trim, self.IMAGE_PATH)
+
+        # Then
+        run.assert_any_call(['losetup', '--detach', '/dev/loop7'], check=True, capture_output=ANY, text=ANY)
+
+
+OUTPUT = {'capture_output': True, 'text': True}
+
+
+def get_output(command: list[str]) -> str:
+    if command[0] == 'losetup' and '--show' in command:
+        return '/dev/loop7\n'
+    if command[0] == 'blkid':
+        return 'ext4\n' if command[-1].endswith('p2') else 'vfat\n'
+    return ''
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import subprocess
+import unittest
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+from common_utility import delete_directory, create_file
+from context_logger import setup_logging
+
+from image_generator import InstallerWheelhouse, TargetConfig
+from tests import TEST_FILE_SYSTEM_ROOT, RESOURCE_ROOT
+
+
+class InstallerWheelhouseTest(TestCase):
+    CACHE_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/installer-cache'
+    FILES_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/files'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(TEST_FILE_SYSTEM_ROOT)
+        os.makedirs(self.FILES_DIR)
+
+    @patch('subprocess.run')
+    def test_requests_wheelhouse_export_when_not_cached(self, run: MagicMock) -> None:
+        # Given
+        run.return_value = get_output('0123abcd\trefs/tags/latest\n')
+        wheelhouse = InstallerWheelhouse(self.CACHE_DIR, RESOURCE_ROOT)
+        config = create_target_config('test-ref')
+
+        # When
+        result = wheelhouse.prepare(config, self.FILES_DIR)
+
+        # Then
+        self.assertFalse(result)
+        self.assertFalse(os.path.exists(f'{self.FILES_DIR}/wheels'))
+        with open(f'{self.FILES_DIR}/wheelhouse') as wheelhouse_file:
+            self.assertEqual(f'{wheelhouse.get_wheelhouse_path(config)}\n', wheelhouse_file.read())
+
+    @patch('subprocess.run')
+    def test_copies_cached_wheelhouse(self, run: MagicMock) -> None:
+        # Given
+        run.return_value = get_output('0123abcd\trefs/tags/latest\n')
+        wheelhouse = InstallerWheelhouse(self.CACHE_DIR, RESOURCE_ROOT)
+        config = create_target_config('test-ref')
+        create_file(f'{wheelhouse.get_wheelhouse_path(config)}/installer-1.0.0-py3-none-any.whl', 'wheel')
+
+        # When
+        result = wheelhouse.prepare(config, self.FILES_DIR)
+
+        # Then
+        self.assertTrue(result)
+        self.assertTrue(os.path.exists(f'{self.FILES_DIR}/wheels/installer-1.0.0-py3-none-any.whl'))
+        self.assertFalse(os.path.exists(f'{self.FILES_DIR}/wheelhouse'))
+
+    @patch('subprocess.run')
+    def test_wheelhouse_path_changes_with_reference(self, run: MagicMock) -> None:
+        # Given
+        run.return_value = get_output('0123abcd\trefs/tags/latest\n')
+        wheelhouse = InstallerWheelhouse(self.CACHE_DIR, RESOURCE_ROOT)
+
+        # When
+        result1 = wheelhouse.get_wheelhouse_path(create_target_config('test-ref-1'))
+        result2 = wheelhouse.get_wheelhouse_path(create_target_config('test-ref-2'))
+
+        # Then
+        self.assertNotEqual(result1, result2)
+
+    @patch('subprocess.run')
+    def test_wheelhouse_path_changes_with_installer_release(self, run: MagicMock) -> None:
+        # Given
+        wheelhouse = InstallerWheelhouse(self.CACHE_DIR, RESOURCE_ROOT)
+        config = create_target_config('test-ref')
+        run.return_value = get_output('0123abcd\trefs/tags/latest\n')
+        result1 = wheelhouse.get_wheelhouse_path(config)
+        run.return_value = get_output('4567cdef\trefs/tags/latest\n')
+
+        # When
+        result2 = wheelhouse.get_wheelhouse_path(config)
+
+        # Then
+        self.assertNotEqual(result1, result2)
+        run.assert_called_with(
+            [
+                'git',
+                'ls-remote',
+                'https://github.com/EffectiveRange/debian-package-installer.git',
+                'latest',
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+            timeout=30,
+        )
+
+    @patch('subprocess.run')
+    def test_skips_wheelhouse_when_installer_release_not_resolved(self, run: MagicMock) -> None:
+        # Given
+        wheelhouse = InstallerWheelhouse(self.CACHE_DIR, RESOURCE_ROOT)
+        run.side_effect = subprocess.CalledProcessError(128, 'git')
+
+        # When
+        result = wheelhouse.prepare(create_target_config('test-ref'), self.FILES_DIR)
+
+        # Then
+        self.assertFalse(result)
+        self.assertFalse(os.path.exists(f'{self.FILES_DIR}/wheelhouse'))
+
+    @patch('subprocess.run')
+    def test_copies_latest_cached_wheelhouse_when_installer_release_not_resolved(self, run: MagicMock) -> None:
+        # Given
+        wheelhouse = InstallerWheelhouse(self.CACHE_DIR, RESOURCE_ROOT)
+        config = create_target_config('test-ref')
+        for index, commit in enumerate(['0123abcd', '4567cdef']):
+            run.return_value = get_output(f'{commit}\trefs/tags/latest\n')
+            wheelhouse_path = wheelhouse.get_wheelhouse_path(config)
+            create_file(f'{wheelhouse_path}/installer-1.0.{index}-py3-none-any.whl', 'wheel')
+            os.utime(wheelhouse_path, (1000 + index, 1000 + index))
+        os.makedirs(f'{wheelhouse_path}.123.tmp')
+        run.side_effect = subprocess.CalledProcessError(128, 'git')
+
+        # When
+        result = wheelhouse.prepare(config, self.FILES_DIR)
+
+        # Then
+        self.assertTrue(result)
+        self.assertEqual(['installer-1.0.1-py3-none-any.whl'], os.listdir(f'{self.FILES_DIR}/wheels'))
+        self.assertFalse(os.path.exists(f'{self.FILES_DIR}/wheelhouse'))
+
+
+def get_output(stdout: str) -> subprocess.CompletedProcess[str]:
+    return subprocess.CompletedProcess([], 0, stdout, '')
+
+
+def create_target_config(reference: str) -> TargetConfig:
+    return TargetConfig(name='test-target', version='1.0.0', reference=reference, packages=[])
+
+
+if __name__ == '__main__':
+    unittest.main()
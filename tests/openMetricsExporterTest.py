@@ -0,0 +1,74 @@
+import os
+import unittest
+from unittest import TestCase
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+
+from image_generator import OpenMetricsExporter, PhaseEvent
+from tests import TEST_FILE_SYSTEM_ROOT
+
+
+class OpenMetricsExporterTest(TestCase):
+    METRICS_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/metrics'
+    METRICS_FILE = f'{METRICS_DIR}/image-generator.prom'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(self.METRICS_DIR)
+
+    def test_phase_metrics_exported(self) -> None:
+        # Given
+        exporter = OpenMetricsExporter(self.METRICS_FILE)
+        event = PhaseEvent('test-target', 'build', 1700000000.0, 12.5, 1.25, 300.0, 4096, 1048576, 3)
+
+        # When
+        exporter.before_phase(event)
+        exporter.after_phase(event)
+
+        # Then
+        lines = read_lines(self.METRICS_FILE)
+        labels = '{target="test-target",phase="build"}'
+        self.assertIn('# TYPE image_generator_phase_duration_seconds gauge', lines)
+        self.assertIn('# HELP image_generator_phase_runs_total Runs of the phase', lines)
+        self.assertIn('# TYPE image_generator_phase_runs_total counter', lines)
+        self.assertIn('# TYPE image_generator_phase_failures_total counter', lines)
+        self.assertIn(f'image_generator_phase_duration_seconds{labels} 12.5', lines)
+        self.assertIn(f'image_generator_phase_cpu_seconds{labels} 1.25', lines)
+        self.assertIn(f'image_generator_phase_child_cpu_seconds{labels} 300', lines)
+        self.assertIn(f'image_generator_phase_read_bytes{labels} 4096', lines)
+        self.assertIn(f'image_generator_phase_written_bytes{labels} 1048576', lines)
+        self.assertIn(f'image_generator_phase_subprocesses{labels} 3', lines)
+        self.assertIn(f'image_generator_phase_timestamp_seconds{labels} 1700000012.5', lines)
+        self.assertIn(f'image_generator_phase_runs_total{labels} 1', lines)
+        self.assertNotIn(f'image_generator_phase_failures_total{labels} 1', lines)
+        self.assertFalse(any(line.startswith(('# UNIT', '# EOF')) for line in lines))
+        self.assertEqual(['image-generator.prom'], os.listdir(self.METRICS_DIR))
+
+    def test_counters_kept_across_runs_and_targets(self) -> None:
+        # Given
+        OpenMetricsExporter(self.METRICS_FILE).after_phase(PhaseEvent('test-target', 'build', 0.0))
+        OpenMetricsExporter(self.METRICS_FILE).after_phase(PhaseEvent('other-target', 'build', 0.0))
+        exporter = OpenMetricsExporter(self.METRICS_FILE)
+
+        # When
+        exporter.after_phase(PhaseEvent('test-target', 'build', 0.0, error="OSError('Disk full')"))
+
+        # Then
+        lines = read_lines(self.METRICS_FILE)
+        self.assertIn('image_generator_phase_runs_total{target="test-target",phase="build"} 2', lines)
+        self.assertIn('image_generator_phase_failures_total{target="test-target",phase="build"} 1', lines)
+        self.assertIn('image_generator_phase_runs_total{target="other-target",phase="build"} 1', lines)
+
+
+def read_lines(path: str) -> list[str]:
+    with open(path, 'r') as metrics_file:
+        return metrics_file.read().splitlines()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import unittest
+from unittest import TestCase
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+
+from image_generator import packageList
+from image_generator.packageList import InstalledPackage
+from tests import TEST_FILE_SYSTEM_ROOT, TEST_RESOURCE_ROOT
+
+
+class PackageListTest(TestCase):
+    TEST_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/package-list'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(self.TEST_DIR)
+        os.makedirs(self.TEST_DIR)
+
+    def test_parses_apt_package_list(self) -> None:
+        # Given
+        package_list = f'{TEST_RESOURCE_ROOT}/config/after-install.list'
+
+        # When
+        result = packageList.parse_package_list(package_list)
+
+        # Then
+        self.assertEqual(722, len(result))
+        self.assertEqual(InstalledPackage('1.2.4-1', 'all', 'oldstable,now'), result['alsa-topology-conf'])
+        self.assertEqual(InstalledPackage('2:2.9.0-21+deb11u2', 'armhf', 'oldstable,now'), result['hostapd'])
+
+    def test_diffs_package_lists(self) -> None:
+        # Given
+        before = write_list(
+            f'{self.TEST_DIR}/before.list',
+            ['adduser/now 3.118 all [installed]', 'curl/now 7.74.0-1.3 armhf [installed]', 'vim/now 2:8.2-1 armhf'],
+        )
+        after = write_list(
+            f'{self.TEST_DIR}/after.list',
+            ['adduser/now 3.118 all [installed]', 'curl/now 7.74.0-1.3+deb11u1 armhf', 'filebeat/now 8.12.2 armhf'],
+        )
+
+        # When
+        result = packageList.diff_packages(before, after)
+
+        # Then
+        self.assertEqual(['filebeat'], list(result.added))
+        self.assertEqual(['vim'], list(result.removed))
+        self.assertEqual(['curl'], list(result.upgraded))
+        self.assertEqual({}, result.downgraded)
+        self.assertEqual(
+            ['curl/now 7.74.0-1.3+deb11u1 armhf', 'filebeat/now 8.12.2 armhf'], result.get_installed(after)
+        )
+        self.assertEqual(
+            {'from': '7.74.0-1.3', 'to': '7.74.0-1.3+deb11u1', 'arch': 'armhf'}, result.to_dict()['upgraded']['curl']
+        )
+
+    def test_compares_debian_versions(self) -> None:
+        # Given
+        versions = [
+            ('1.0', '1.0~rc1', 1),
+            ('1:1.0', '2.0', 1),
+            ('1.2.4-1', '1.2.10-1', -1),
+            ('1.0-1', '1.0-1+rpt1', -1),
+            ('1.0a', '1.0', 1),
+            ('1.0-1', '1.0-1', 0),
+        ]
+
+        # When
+        result = [packageList.compare_versions(first, second) for first, second, _ in versions]
+
+        # Then
+        self.assertEqual([expected for _, _, expected in versions], result)
+
+
+def write_list(path: str, lines: list[str]) -> dict[str, InstalledPackage]:
+    with open(path, 'w') as file:
+        file.write('Listing...\n' + '\n'.join(lines) + '\n')
+
+    return packageList.parse_package_list(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
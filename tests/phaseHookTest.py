@@ -0,0 +1,109 @@
+import subprocess
+import unittest
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from context_logger import setup_logging
+
+from image_generator import PhaseInstrumentation, IPhaseHook, PhaseEvent
+
+
+class PhaseHookTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+
+    def test_phase_event_passed_to_hooks(self) -> None:
+        # Given
+        hook = RecordingPhaseHook()
+        instrumentation = PhaseInstrumentation([hook])
+
+        # When
+        with instrumentation.phase('test-target', 'build') as event:
+            subprocess.run(['true'], check=True)
+            subprocess.run(['true'], check=True)
+            event.metrics['image_bytes'] = 1024
+
+        # Then
+        self.assertEqual([('before', 'build'), ('after', 'build')], hook.calls)
+        self.assertEqual('test-target', event.target)
+        self.assertEqual(2, event.subprocesses)
+        self.assertGreater(event.duration, 0)
+        self.assertGreaterEqual(event.child_cpu_time, 0)
+        self.assertEqual({'image_bytes': 1024}, event.metrics)
+        self.assertIsNone(event.error)
+
+    def test_io_counters_measured(self) -> None:
+        # Given
+        instrumentation = PhaseInstrumentation([RecordingPhaseHook()])
+
+        # When
+        with instrumentation.phase('test-target', 'export') as event:
+            with open('/dev/null', 'w') as null_file:
+                null_file.write('x' * 4096)
+
+        # Then
+        self.assertGreaterEqual(event.written_bytes, 4096)
+
+    def test_error_recorded_and_raised(self) -> None:
+        # Given
+        hook = RecordingPhaseHook()
+        instrumentation = PhaseInstrumentation([hook])
+
+        # When
+        with self.assertRaises(ValueError):
+            with instrumentation.phase('test-target', 'initialize'):
+                raise ValueError('Invalid configuration')
+
+        # Then
+        self.assertEqual([('before', 'initialize'), ('after', 'initialize')], hook.calls)
+        self.assertEqual("ValueError('Invalid configuration')", hook.events[0].error)
+
+    def test_failing_hook_does_not_fail_phase(self) -> None:
+        # Given
+        failing_hook = MagicMock(spec=IPhaseHook)
+        failing_hook.after_phase.side_effect = OSError('Disk full')
+        hook = RecordingPhaseHook()
+        instrumentation = PhaseInstrumentation([failing_hook, hook])
+
+        # When
+        with instrumentation.phase('test-target', 'export'):
+            pass
+
+        # Then
+        failing_hook.after_phase.assert_called_once()
+        self.assertEqual([('before', 'export'), ('after', 'export')], hook.calls)
+
+    def test_phase_not_measured_without_hooks(self) -> None:
+        # Given
+        instrumentation = PhaseInstrumentation()
+
+        # When
+        with instrumentation.phase('test-target', 'build') as event:
+            subprocess.run(['true'], check=True)
+
+        # Then
+        self.assertEqual(0, event.duration)
+        self.assertEqual(0, event.subprocesses)
+
+
+class RecordingPhaseHook(IPhaseHook):
+
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, str]] = []
+        self.events: list[PhaseEvent] = []
+
+    def before_phase(self, event: PhaseEvent) -> None:
+        self.calls.append(('before', event.phase))
+
+    def after_phase(self, event: PhaseEvent) -> None:
+        self.calls.append(('after', event.phase))
+        self.events.append(event)
+
+
+if __name__ == '__main__':
+    unittest.main()
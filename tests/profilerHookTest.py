@@ -0,0 +1,55 @@
+import os
+import pstats
+import unittest
+from unittest import TestCase
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+
+from image_generator import ProfilerHook, PhaseInstrumentation
+from tests import TEST_FILE_SYSTEM_ROOT
+
+
+class ProfilerHookTest(TestCase):
+    OUTPUT_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/phase-profile'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(self.OUTPUT_DIR)
+
+    def test_phase_profiled_with_cprofile(self) -> None:
+        # Given
+        instrumentation = PhaseInstrumentation([ProfilerHook(self.OUTPUT_DIR)])
+
+        # When
+        with instrumentation.phase('test-target', 'export'):
+            sorted(str(number) for number in range(1000))
+
+        # Then
+        stats = pstats.Stats(f'{self.OUTPUT_DIR}/test-target-export.prof')
+        self.assertGreater(stats.total_calls, 0)  # type: ignore[attr-defined]
+
+    def test_only_selected_phases_profiled(self) -> None:
+        # Given
+        instrumentation = PhaseInstrumentation([ProfilerHook(self.OUTPUT_DIR, phases=['build'])])
+
+        # When
+        with instrumentation.phase('test-target', 'export'):
+            pass
+        with instrumentation.phase('test-target', 'build'):
+            pass
+
+        # Then
+        self.assertEqual(['test-target-build.prof'], os.listdir(self.OUTPUT_DIR))
+
+    def test_raises_error_when_profiler_is_invalid(self) -> None:
+        # When, Then
+        self.assertRaises(ValueError, ProfilerHook, self.OUTPUT_DIR, 'yappi')
+
+
+if __name__ == '__main__':
+    unittest.main()
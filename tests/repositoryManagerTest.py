@@ -0,0 +1,151 @@
+import os
+import unittest
+from unittest import TestCase
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+from git import Repo
+
+from image_generator import RepositoryManager
+from tests import TEST_FILE_SYSTEM_ROOT
+
+
+class RepositoryManagerTest(TestCase):
+    ROOT_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/repository-manager'
+    ORIGIN_PATH = f'{ROOT_DIR}/origin'
+    MIRROR_PATH = f'{ROOT_DIR}/pi-gen.git'
+    WORKTREE_PATH = f'{ROOT_DIR}/pi-gen'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(self.ROOT_DIR)
+        os.makedirs(self.ROOT_DIR)
+        os.chdir(self.ROOT_DIR)
+        self.origin = create_origin(self.ORIGIN_PATH)
+
+    def test_creates_worktree_from_mirror(self) -> None:
+        # Given
+        repository_manager = RepositoryManager(self.ORIGIN_PATH, self.MIRROR_PATH)
+
+        # When
+        repository = repository_manager.create_worktree(self.WORKTREE_PATH)
+
+        # Then
+        self.assertTrue(os.path.exists(f'{self.MIRROR_PATH}/HEAD'))
+        self.assertTrue(os.path.isfile(f'{self.WORKTREE_PATH}/.git'))
+        self.assertEqual(self.origin.head.commit.hexsha, repository.head.commit.hexsha)
+
+    def test_cleans_existing_worktree(self) -> None:
+        # Given
+        repository_manager = RepositoryManager(self.ORIGIN_PATH, self.MIRROR_PATH)
+        repository_manager.create_worktree(self.WORKTREE_PATH)
+        create_file(f'{self.WORKTREE_PATH}/untracked', 'untracked')
+        create_file(f'{self.WORKTREE_PATH}/build.sh', 'modified')
+
+        # When
+        repository_manager.create_worktree(self.WORKTREE_PATH)
+
+        # Then
+        self.assertFalse(os.path.exists(f'{self.WORKTREE_PATH}/untracked'))
+        with open(f'{self.WORKTREE_PATH}/build.sh') as file:
+            self.assertEqual('original', file.read())
+
+    def test_removes_ignored_skip_markers_from_existing_worktree(self) -> None:
+        # Given
+        repository_manager = RepositoryManager(self.ORIGIN_PATH, self.MIRROR_PATH)
+        repository_manager.create_worktree(self.WORKTREE_PATH)
+        os.makedirs(f'{self.WORKTREE_PATH}/stage1/00-boot-files')
+        create_file(f'{self.WORKTREE_PATH}/stage1/00-boot-files/SKIP', '')
+        create_file(f'{self.WORKTREE_PATH}/stage0/SKIP', '')
+        create_file(f'{self.WORKTREE_PATH}/config', 'config')
+
+        # When
+        repository_manager.create_worktree(self.WORKTREE_PATH)
+
+        # Then
+        self.assertFalse(os.path.exists(f'{self.WORKTREE_PATH}/stage1'))
+        self.assertFalse(os.path.exists(f'{self.WORKTREE_PATH}/stage0/SKIP'))
+        self.assertTrue(os.path.exists(f'{self.WORKTREE_PATH}/stage0/prerun.sh'))
+        self.assertTrue(os.path.exists(f'{self.WORKTREE_PATH}/config'))
+
+    def test_resets_worktree(self) -> None:
+        # Given
+        repository_manager = RepositoryManager(self.ORIGIN_PATH, self.MIRROR_PATH)
+        repository = repository_manager.create_worktree(self.WORKTREE_PATH)
+        os.makedirs(f'{self.WORKTREE_PATH}/stage2/02-install-packages')
+        create_file(f'{self.WORKTREE_PATH}/stage0/SKIP', '')
+        create_file(f'{self.WORKTREE_PATH}/build.sh', 'modified')
+
+        # When
+        repository_manager.reset_worktree(repository)
+
+        # Then
+        self.assertFalse(os.path.exists(f'{self.WORKTREE_PATH}/stage2'))
+        self.assertFalse(os.path.exists(f'{self.WORKTREE_PATH}/stage0/SKIP'))
+        with open(f'{self.WORKTREE_PATH}/build.sh') as file:
+            self.assertEqual('original', file.read())
+
+    def test_creates_worktrees_sharing_one_mirror(self) -> None:
+        # Given
+        repository_manager = RepositoryManager(self.ORIGIN_PATH, self.MIRROR_PATH)
+
+        # When
+        repository_manager.create_worktree(self.WORKTREE_PATH)
+        repository_manager.create_worktree(f'{self.WORKTREE_PATH}-1')
+
+        # Then
+        worktrees = Repo(self.MIRROR_PATH).git.worktree('list', '--porcelain').splitlines()
+        self.assertIn(f'worktree {self.WORKTREE_PATH}', worktrees)
+        self.assertIn(f'worktree {self.WORKTREE_PATH}-1', worktrees)
+
+    def test_replaces_existing_clone_with_worktree(self) -> None:
+        # Given
+        Repo.clone_from(self.ORIGIN_PATH, self.WORKTREE_PATH)
+        repository_manager = RepositoryManager(self.ORIGIN_PATH, self.MIRROR_PATH)
+
+        # When
+        repository_manager.create_worktree(self.WORKTREE_PATH)
+
+        # Then
+        self.assertTrue(os.path.isfile(f'{self.WORKTREE_PATH}/.git'))
+
+    def test_fetches_missing_reference_into_mirror(self) -> None:
+        # Given
+        repository_manager = RepositoryManager(f'file://{self.ORIGIN_PATH}', self.MIRROR_PATH, depth=1)
+        repository = repository_manager.create_worktree(self.WORKTREE_PATH)
+        self.origin.git.checkout('-b', 'new-branch')
+        create_file(f'{self.ORIGIN_PATH}/new-file', 'new')
+        self.origin.git.add('new-file')
+        self.origin.git.commit('-m', 'New commit')
+
+        # When
+        repository_manager.fetch_reference('new-branch')
+
+        # Then
+        self.assertEqual(self.origin.head.commit.hexsha, repository.git.rev_parse('new-branch^{commit}'))
+
+
+def create_origin(path: str) -> Repo:
+    origin = Repo.init(path, initial_branch='master')
+    origin.git.config('user.email', 'test@example.com')
+    origin.git.config('user.name', 'Test')
+    create_file(f'{path}/build.sh', 'original')
+    create_file(f'{path}/.gitignore', 'config\nSKIP\n')
+    os.makedirs(f'{path}/stage0')
+    create_file(f'{path}/stage0/prerun.sh', 'prerun')
+    origin.git.add('build.sh', '.gitignore', 'stage0/prerun.sh')
+    origin.git.commit('-m', 'Initial commit')
+    return origin
+
+
+def create_file(path: str, content: str) -> None:
+    with open(path, 'w') as file:
+        file.write(content)
+
+
+if __name__ == '__main__':
+    unittest.main()
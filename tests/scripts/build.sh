@@ -37,7 +37,7 @@ if [ "$return_code" -eq 0 ]; then
 
     if [ $# -ge 2 ]; then
         mkdir -p "$build_dir"/deploy
-        touch "$build_dir"/deploy/image_"$(date +'%Y-%m-%d')"-test-target-lite.img.xz
+        touch "$build_dir"/deploy/image_"$(date +'%Y-%m-%d')"-test-target-lite.img
     fi
 else
     >&2 echo "Build failed"
@@ -0,0 +1,153 @@
+import os
+import subprocess
+import unittest
+from pathlib import Path
+from unittest import TestCase
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+
+from image_generator import StageCache
+from tests import TEST_RESOURCE_ROOT, TEST_FILE_SYSTEM_ROOT, RESOURCE_ROOT, create_pi_gen_tree
+
+BUILD_CONFIG = 'IMG_NAME=test-target\nTARGET_HOSTNAME=test-target\nENABLE_SSH=1\nCLEAN=1\n'
+
+
+class StageCacheTest(TestCase):
+    PI_GEN_LOCATION = f'{TEST_FILE_SYSTEM_ROOT}/tmp/pi-gen'
+    CACHE_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/stage-cache'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(f'{TEST_RESOURCE_ROOT}/build')
+        create_pi_gen_tree(self.PI_GEN_LOCATION)
+
+    def test_creates_snapshot_script_when_snapshot_not_found(self) -> None:
+        # Given
+        stage_cache = StageCache(self.CACHE_DIR, RESOURCE_ROOT)
+        snapshot_path = stage_cache.get_snapshot_path(stage_cache.get_key(self.PI_GEN_LOCATION, 2, 2, BUILD_CONFIG))
+
+        # When
+        result = stage_cache.prepare(self.PI_GEN_LOCATION, 2, 2, BUILD_CONFIG)
+
+        # Then
+        self.assertFalse(result)
+        script_path = f'{self.PI_GEN_LOCATION}/stage2/02-stage-snapshot/00-run.sh'
+        self.assertTrue(os.access(script_path, os.X_OK))
+        with open(script_path) as script_file:
+            self.assertIn(f'snapshot="{snapshot_path}"', script_file.read())
+        self.assertFalse(os.path.exists(f'{self.PI_GEN_LOCATION}/stage1/SKIP'))
+        self.assertFalse(os.path.exists(f'{self.PI_GEN_LOCATION}/stage2/prerun.sh'))
+
+    def test_skips_cached_stages_when_snapshot_found(self) -> None:
+        # Given
+        stage_cache = StageCache(self.CACHE_DIR, RESOURCE_ROOT)
+        snapshot_path = stage_cache.get_snapshot_path(stage_cache.get_key(self.PI_GEN_LOCATION, 2, 2, BUILD_CONFIG))
+        os.makedirs(self.CACHE_DIR, exist_ok=True)
+        Path(snapshot_path).touch()
+
+        # When
+        result = stage_cache.prepare(self.PI_GEN_LOCATION, 2, 2, BUILD_CONFIG)
+
+        # Then
+        self.assertTrue(result)
+        self.assertTrue(os.path.exists(f'{self.PI_GEN_LOCATION}/stage1/SKIP'))
+        self.assertTrue(os.path.exists(f'{self.PI_GEN_LOCATION}/stage2/00-copies-and-fills/SKIP'))
+        self.assertTrue(os.path.exists(f'{self.PI_GEN_LOCATION}/stage2/01-sys-tweaks/SKIP'))
+        self.assertTrue(os.path.exists(f'{self.PI_GEN_LOCATION}/stage2/02-stage-snapshot/SKIP'))
+        self.assertFalse(os.path.exists(f'{self.PI_GEN_LOCATION}/stage2/SKIP'))
+        with open(f'{self.PI_GEN_LOCATION}/stage2/prerun.sh') as script_file:
+            self.assertIn(f'snapshot="{snapshot_path}"', script_file.read())
+
+    def test_key_changes_when_boot_files_change(self) -> None:
+        # Given
+        stage_cache = StageCache(self.CACHE_DIR, RESOURCE_ROOT)
+        original_key = stage_cache.get_key(self.PI_GEN_LOCATION, 2, 2, BUILD_CONFIG)
+
+        with open(f'{self.PI_GEN_LOCATION}/stage1/00-boot-files/files/config.txt', 'a') as config_file:
+            config_file.write('option1\n')
+
+        # When
+        result = stage_cache.get_key(self.PI_GEN_LOCATION, 2, 2, BUILD_CONFIG)
+
+        # Then
+        self.assertNotEqual(original_key, result)
+
+    def test_key_ignores_config_not_affecting_root_file_system(self) -> None:
+        # Given
+        stage_cache = StageCache(self.CACHE_DIR, RESOURCE_ROOT)
+        original_key = stage_cache.get_key(
+            self.PI_GEN_LOCATION, 2, 2, f'{BUILD_CONFIG}APT_PROXY=http://10.0.0.1:3142\n'
+        )
+
+        # When
+        build_config = BUILD_CONFIG.replace('CLEAN=1', 'CLEAN=0').replace('HOSTNAME=test', 'HOSTNAME=new')
+        build_config += 'APT_PROXY=http://10.0.0.1:3143\n'
+        result = stage_cache.get_key(self.PI_GEN_LOCATION, 2, 2, build_config)
+
+        # Then
+        self.assertEqual(original_key, result)
+
+    def test_restore_script_replaces_apt_proxy_of_snapshot(self) -> None:
+        # Given
+        stage_cache = StageCache(self.CACHE_DIR, RESOURCE_ROOT)
+        snapshot_path = stage_cache.get_snapshot_path(stage_cache.get_key(self.PI_GEN_LOCATION, 2, 2, BUILD_CONFIG))
+        snapshot_root = f'{TEST_FILE_SYSTEM_ROOT}/tmp/snapshot-root'
+        os.makedirs(f'{snapshot_root}/etc/apt/apt.conf.d', exist_ok=True)
+        with open(f'{snapshot_root}/etc/apt/apt.conf.d/51cache', 'w') as proxy_file:
+            proxy_file.write('Acquire::http { Proxy "http://127.0.0.1:3142"; };\n')
+        os.makedirs(self.CACHE_DIR, exist_ok=True)
+        subprocess.run(['tar', '-cf', snapshot_path, '-C', snapshot_root, '.'], check=True)
+        stage_cache.prepare(self.PI_GEN_LOCATION, 2, 2, BUILD_CONFIG)
+        root_dir = f'{TEST_FILE_SYSTEM_ROOT}/tmp/rootfs'
+
+        # When
+        restore_script = f'{self.PI_GEN_LOCATION}/stage2/prerun.sh'
+        subprocess.run([restore_script], env={'ROOTFS_DIR': root_dir, 'APT_PROXY': 'http://127.0.0.1:3143'}, check=True)
+        with open(f'{root_dir}/etc/apt/apt.conf.d/51cache') as proxy_file:
+            restored_proxy = proxy_file.read()
+        subprocess.run([restore_script], env={'ROOTFS_DIR': root_dir}, check=True)
+
+        # Then
+        self.assertEqual('Acquire::http { Proxy "http://127.0.0.1:3143"; };\n', restored_proxy)
+        self.assertFalse(os.path.exists(f'{root_dir}/etc/apt/apt.conf.d/51cache'))
+        self.assertTrue(os.path.isdir(f'{root_dir}/etc/apt/apt.conf.d'))
+
+    def test_key_changes_when_root_file_system_config_changes(self) -> None:
+        # Given
+        stage_cache = StageCache(self.CACHE_DIR, RESOURCE_ROOT)
+        original_key = stage_cache.get_key(self.PI_GEN_LOCATION, 2, 2, BUILD_CONFIG)
+
+        # When
+        result = stage_cache.get_key(self.PI_GEN_LOCATION, 2, 2, BUILD_CONFIG.replace('SSH=1', 'SSH=0'))
+
+        # Then
+        self.assertNotEqual(original_key, result)
+
+    def test_creates_reflink_snapshot_scripts(self) -> None:
+        # Given
+        stage_cache = StageCache(self.CACHE_DIR, RESOURCE_ROOT, 'reflink')
+        snapshot_path = stage_cache.get_snapshot_path(stage_cache.get_key(self.PI_GEN_LOCATION, 2, 2, BUILD_CONFIG))
+        os.makedirs(snapshot_path, exist_ok=True)
+
+        # When
+        result = stage_cache.prepare(self.PI_GEN_LOCATION, 2, 2, BUILD_CONFIG)
+
+        # Then
+        self.assertTrue(result)
+        with open(f'{self.PI_GEN_LOCATION}/stage2/02-stage-snapshot/00-run.sh') as script_file:
+            self.assertIn('--reflink=auto', script_file.read())
+        with open(f'{self.PI_GEN_LOCATION}/stage2/prerun.sh') as script_file:
+            self.assertIn('cp -a --reflink=auto "${snapshot}" "${ROOTFS_DIR}"', script_file.read())
+
+    def test_raises_error_when_snapshot_format_is_invalid(self) -> None:
+        # When, Then
+        self.assertRaises(ValueError, StageCache, self.CACHE_DIR, RESOURCE_ROOT, 'invalid')
+
+
+if __name__ == '__main__':
+    unittest.main()
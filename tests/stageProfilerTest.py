@@ -0,0 +1,76 @@
+import json
+import os
+import time
+import unittest
+from subprocess import Popen
+from unittest import TestCase
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+
+from image_generator import StageProfiler
+from tests import TEST_FILE_SYSTEM_ROOT
+
+BUSY_COMMAND = ['python3', '-c', 'import time\nend = time.time() + 0.5\nwhile time.time() < end: pass']
+
+
+class StageProfilerTest(TestCase):
+    OUTPUT_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/profile'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(self.OUTPUT_DIR)
+        os.makedirs(self.OUTPUT_DIR)
+
+    def test_profiles_nested_stages(self) -> None:
+        # Given
+        stage_profiler = StageProfiler(0.05)
+
+        # When
+        with Popen(BUSY_COMMAND) as process:
+            stage_profiler.start(process.pid)
+            stage_profiler.begin_stage('stage0')
+            stage_profiler.begin_stage('stage0/00-configure-apt')
+            time.sleep(0.3)
+            stage_profiler.end_stage()
+            stage_profiler.end_stage()
+            stage_profiler.begin_stage('stage1')
+        stage_profiler.stop()
+
+        # Then
+        timeline = stage_profiler.get_timeline()
+        self.assertEqual(['stage0', 'stage0/00-configure-apt', 'stage1'], [stage.name for stage in timeline])
+        self.assertEqual([0, 1, 0], [stage.depth for stage in timeline])
+        self.assertTrue(all(stage.end and stage.duration is not None for stage in timeline))
+        self.assertGreater(timeline[0].cpu_time, 0)
+        self.assertGreater(timeline[1].peak_rss, 0)
+        self.assertGreater(timeline[1].peak_cpu, 0)
+
+    def test_exports_timeline_and_chrome_trace(self) -> None:
+        # Given
+        stage_profiler = StageProfiler(0.05, chrome_trace=True)
+        with Popen(['sleep', '0.2']) as process:
+            stage_profiler.start(process.pid)
+            stage_profiler.begin_stage('stage0')
+        stage_profiler.stop()
+
+        # When
+        stage_profiler.export(f'{self.OUTPUT_DIR}/test-target-1.0.0')
+
+        # Then
+        with open(f'{self.OUTPUT_DIR}/test-target-1.0.0.timeline.json') as timeline_file:
+            timeline = json.load(timeline_file)
+        self.assertEqual(['stage0'], [stage['name'] for stage in timeline['stages']])
+        self.assertNotIn('start_usage', timeline['stages'][0])
+        with open(f'{self.OUTPUT_DIR}/test-target-1.0.0.trace.json') as trace_file:
+            events = json.load(trace_file)['traceEvents']
+        self.assertEqual('X', events[0]['ph'])
+        self.assertIn('rss', [event['name'] for event in events if event['ph'] == 'C'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+import json
+import os
+import unittest
+from unittest import TestCase
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+from pydantic import ValidationError
+
+from image_generator import TargetConfigLoader
+from tests import TEST_FILE_SYSTEM_ROOT
+
+
+class TargetConfigLoaderTest(TestCase):
+    CONFIG_DIR = f'{TEST_FILE_SYSTEM_ROOT}/tmp/target-config'
+    CONFIG_PATH = f'{CONFIG_DIR}/target-config.json'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        setup_logging('raspbian-image-generator', 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self) -> None:
+        print()
+        delete_directory(self.CONFIG_DIR)
+        os.makedirs(self.CONFIG_DIR)
+
+    def test_loads_requested_target_without_validating_others(self) -> None:
+        # Given
+        write_json(self.CONFIG_PATH, [create_target('target1'), {'name': 'invalid-target'}, create_target('target2')])
+        config_loader = TargetConfigLoader()
+
+        # When
+        result = config_loader.load_target(self.CONFIG_PATH, 'target2')
+
+        # Then
+        self.assertEqual('target2', result.name)  # type: ignore
+        self.assertEqual(['target1', 'invalid-target', 'target2'], config_loader.get_target_names(self.CONFIG_PATH))
+
+    def test_raises_error_when_requested_target_is_invalid(self) -> None:
+        # Given
+        write_json(self.CONFIG_PATH, [create_target('target1'), {'name': 'invalid-target'}])
+        config_loader = TargetConfigLoader()
+
+        # When, Then
+        self.assertRaises(ValidationError, config_loader.load_target, self.CONFIG_PATH, 'invalid-target')
+
+    def test_returns_none_when_target_not_found(self) -> None:
+        # Given
+        write_json(self.CONFIG_PATH, [create_target('target1')])
+        config_loader = TargetConfigLoader()
+
+        # When
+        result = config_loader.load_target(self.CONFIG_PATH, 'target2')
+
+        # Then
+        self.assertIsNone(result)
+
+    def test_returns_cached_config_until_file_changes(self) -> None:
+        # Given
+        write_json(self.CONFIG_PATH, [create_target('target1')])
+        config_loader = TargetConfigLoader()
+        first = config_loader.load_target(self.CONFIG_PATH, 'target1')
+
+        # When
+        second = config_loader.load_target(self.CONFIG_PATH, 'target1')
+        write_json(self.CONFIG_PATH, [create_target('target1', '10.0.0')])
+        third = config_loader.load_target(self.CONFIG_PATH, 'target1')
+
+        # Then
+        self.assertIs(first, second)
+        self.assertEqual('10.0.0', third.version)  # type: ignore
+
+    def test_loads_targets_from_directory(self) -> None:
+        # Given
+        write_json(f'{self.CONFIG_DIR}/target1.json', create_target('target1'))
+        write_json(f'{self.CONFIG_DIR}/others.json', [create_target('target2'), create_target('target3')])
+        config_loader = TargetConfigLoader()
+
+        # When
+        result = config_loader.load_targets(self.CONFIG_DIR, ['target1', 'target3', 'target4'])
+
+        # Then
+        self.assertEqual(['target1', 'target3'], [config.name for config in result])
+        self.assertEqual(['target2', 'target3', 'target1'], config_loader.get_target_names(self.CONFIG_DIR))
+
+    def test_merges_extended_and_included_targets(self) -> None:
+        # Given
+        base = {'name': 'base', 'abstract': True, 'reference': 'test-ref', 'boot_config': ['enable_uart=1']}
+        base['packages'] = [{'package': 'wifi-manager'}]
+        usb = {
+            'name': 'usb',
+            'abstract': True,
+            'boot_cmdline': ['modules-load=dwc2'],
+            'boot_config': ['dtoverlay=dwc2'],
+        }
+        target = {'name': 'target1', 'version': '1.0.0', 'extends': 'base', 'include': ['usb']}
+        target['packages'] = [{'package': 'filebeat'}, {'package': 'wifi-manager'}]
+        write_json(self.CONFIG_PATH, [base, usb, target])
+        config_loader = TargetConfigLoader()
+
+        # When
+        result = config_loader.load_target(self.CONFIG_PATH, 'target1')
+
+        # Then
+        self.assertEqual('test-ref', result.reference)  # type: ignore
+        self.assertEqual(['wifi-manager', 'filebeat'], [package.package for package in result.packages])  # type: ignore
+        self.assertEqual(['enable_uart=1', 'dtoverlay=dwc2'], result.boot_config)  # type: ignore
+        self.assertEqual(['modules-load=dwc2'], result.boot_cmdline)  # type: ignore
+        self.assertEqual(['target1'], config_loader.get_target_names(self.CONFIG_PATH))
+        self.assertIsNone(config_loader.load_target(self.CONFIG_PATH, 'base'))
+
+    def test_overrides_extended_target_fields(self) -> None:
+        # Given
+        target = {'name': 'target2', 'extends': 'target1', 'version': '2.0.0', 'stage': 4}
+        write_json(self.CONFIG_PATH, [create_target('target1'), target])
+        config_loader = TargetConfigLoader()
+
+        # When
+        result = config_loader.load_target(self.CONFIG_PATH, 'target2')
+
+        # Then
+        self.assertEqual(('target2', '2.0.0', 4), (result.name, result.version, result.stage))  # type: ignore
+
+    def test_raises_error_when_inheritance_is_circular(self) -> None:
+        # Given
+        target1 = create_target('target1') | {'extends': 'target3'}
+        target2 = create_target('target2') | {'extends': 'target1'}
+        target3 = create_target('target3') | {'include': ['target2']}
+        write_json(self.CONFIG_PATH, [target1, target2, target3])
+        config_loader = TargetConfigLoader()
+
+        # When, Then
+        self.assertRaises(ValueError, config_loader.load_target, self.CONFIG_PATH, 'target2')
+
+    def test_raises_error_when_base_target_not_found(self) -> None:
+        # Given
+        write_json(self.CONFIG_PATH, [create_target('target1') | {'extends': 'base'}])
+        config_loader = TargetConfigLoader()
+
+        # When, Then
+        self.assertRaises(ValueError, config_loader.load_target, self.CONFIG_PATH, 'target1')
+
+    def test_reloads_target_when_base_file_changes(self) -> None:
+        # Given
+        write_json(f'{self.CONFIG_DIR}/base.json', {'name': 'base', 'abstract': True, 'reference': 'test-ref'})
+        write_json(f'{self.CONFIG_DIR}/target1.json', create_target('target1') | {'extends': 'base'})
+        config_loader = TargetConfigLoader()
+        first = config_loader.load_target(self.CONFIG_DIR, 'target1')
+
+        # When
+        second = config_loader.load_target(self.CONFIG_DIR, 'target1')
+        write_json(f'{self.CONFIG_DIR}/base.json', {'name': 'base', 'abstract': True, 'stage': 4})
+        third = config_loader.load_target(self.CONFIG_DIR, 'target1')
+
+        # Then
+        self.assertIs(first, second)
+        self.assertEqual(4, third.stage)  # type: ignore
+
+    def test_returns_same_base_layer_for_targets_sharing_base_stages(self) -> None:
+        # Given
+        base = {'name': 'base', 'abstract': True, 'reference': 'test-ref', 'packages': [{'package': 'filebeat'}]}
+        other = {'name': 'other', 'abstract': True, 'reference': 'other-ref', 'packages': []}
+        target1 = {'name': 'target1', 'version': '1.0.0', 'extends': 'base', 'first_boot': ['echo 1']}
+        target2 = {'name': 'target2', 'version': '2.0.0', 'extends': 'base', 'packages': [{'package': 'nginx'}]}
+        target3 = {'name': 'target3', 'version': '1.0.0', 'extends': 'other'}
+        target5 = {'name': 'target5', 'version': '1.0.0', 'extends': 'base', 'boot_config': ['dtoverlay=dwc2']}
+        write_json(self.CONFIG_PATH, [base, other, target1, target2, target3, create_target('target4'), target5])
+        config_loader = TargetConfigLoader()
+
+        # When
+        result = [config_loader.get_base_layer(self.CONFIG_PATH, f'target{index}') for index in range(1, 6)]
+
+        # Then
+        self.assertEqual(result[0], result[1])
+        self.assertNotEqual(result[0], result[2])
+        self.assertEqual(result[0], result[3])
+        self.assertNotEqual(result[0], result[4])
+        self.assertIsNone(config_loader.get_base_layer(self.CONFIG_PATH, 'base'))
+
+
+def create_target(name: str, version: str = '1.0.0') -> dict:
+    return {'name': name, 'version': version, 'reference': 'test-ref', 'packages': []}
+
+
+def write_json(path: str, content: object) -> None:
+    with open(path, 'w') as file:
+        json.dump(content, file)
+
+
+if __name__ == '__main__':
+    unittest.main()